@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "EcoFinds.settings")
 
 application = get_asgi_application()
+
+# Build the search box's suggestion index before the first request needs it
+from products import autocomplete  # noqa: E402
+
+autocomplete.start_warming()
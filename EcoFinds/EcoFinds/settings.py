@@ -62,6 +62,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "cart.middleware.GuestCartMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -195,3 +196,14 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 # Gemini API Configuration
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+# Background tasks (products.tasks): worker threads for image processing;
+# eager mode runs tasks inline, e.g. in tests
+TASK_WORKERS = int(os.getenv('TASK_WORKERS', 2))
+TASKS_EAGER = os.getenv('TASKS_EAGER', '') == '1'
+
+# Product view counters (products.counters): hits are buffered per process
+# and written at most this often, or once this many are pending
+VIEW_COUNTERS_ENABLED = True
+VIEW_COUNTER_FLUSH_SECONDS = 10
+VIEW_COUNTER_MAX_PENDING = 1000
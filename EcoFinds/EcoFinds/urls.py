@@ -29,6 +29,7 @@ urlpatterns = [
     path("orders/", include("orders.urls")),
     path("profile/", include("user_profile.urls")),
     path("chatbot/", include("chatbot.urls")),
+    path("api/", include("products.api_urls")),
 ]
 
 # Serve media files during development
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "EcoFinds.settings")
 
 application = get_wsgi_application()
+
+# Build the search box's suggestion index before the first request needs it
+from products import autocomplete  # noqa: E402
+
+autocomplete.start_warming()
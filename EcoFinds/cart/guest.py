@@ -0,0 +1,163 @@
+"""
+Carts of visitors who are not signed in.
+
+A guest cart lives entirely in a signed cookie listing product ids and
+quantities ("12:1.40:2"), so browsing and filling it writes nothing to
+the database. A cookie whose signature does not match, that has expired,
+or that does not parse reads as an empty cart. The cart is capped at
+``MAX_ITEMS`` products of up to ``MAX_QUANTITY`` each, which keeps the
+cookie well under browser limits.
+
+Changes are written back to the response by cart.middleware. On
+login the items are merged into the user's Cart with batched upserts (see
+``merge_into`` and cart.signals) and the cookie is dropped.
+"""
+from decimal import Decimal
+
+from django.utils.functional import cached_property
+
+from products.models import Product
+from .models import CartItem, add_cart_items, cart_id_for
+
+COOKIE_NAME = 'guest_cart'
+COOKIE_SALT = 'cart.guest'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+
+MAX_ITEMS = 50
+MAX_QUANTITY = 99
+
+# Products merged into a user's cart per upsert statement
+MERGE_BATCH_SIZE = 25
+
+
+def decode(value):
+    """``{product_id: quantity}`` from a cookie value, or None if malformed"""
+    items = {}
+    for entry in filter(None, value.split('.')):
+        try:
+            product_id, quantity = map(int, entry.split(':'))
+        except ValueError:
+            return None
+        if product_id < 1 or not 1 <= quantity <= MAX_QUANTITY:
+            return None
+        items[product_id] = quantity
+    return items if len(items) <= MAX_ITEMS else None
+
+
+def encode(items):
+    return '.'.join(f'{product_id}:{quantity}' for product_id, quantity in items.items())
+
+
+class GuestCart:
+    def __init__(self, items=None):
+        self.items = dict(items or {})
+        self.modified = False
+
+    @classmethod
+    def from_request(cls, request):
+        """The request's guest cart, read from its cookie once per request"""
+        guest = getattr(request, '_guest_cart', None)
+        if guest is None:
+            value = request.get_signed_cookie(
+                COOKIE_NAME, default='', salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE
+            )
+            guest = request._guest_cart = cls(decode(value) or {})
+        return guest
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def add(self, product_id, quantity=1):
+        """Add to a product's quantity; False if the cart has no room for a new product"""
+        if product_id not in self.items and len(self.items) >= MAX_ITEMS:
+            return False
+        self.items[product_id] = min(self.items.get(product_id, 0) + quantity, MAX_QUANTITY)
+        self.changed()
+        return True
+
+    def set(self, product_id, quantity):
+        """Set the quantity of a product already in the cart; False if it is not"""
+        if product_id not in self.items:
+            return False
+        if quantity <= 0:
+            del self.items[product_id]
+        else:
+            self.items[product_id] = min(quantity, MAX_QUANTITY)
+        self.changed()
+        return True
+
+    def update(self, quantities):
+        """
+        Set ``{product_id: quantity}``; 0 removes a product. Products not
+        yet in the cart are added if available and there is room for them.
+        """
+        new = [product_id for product_id, quantity in quantities.items()
+               if quantity > 0 and product_id not in self.items]
+        available = set(
+            Product.objects.filter(pk__in=new, status='available').values_list('pk', flat=True)
+        ) if new else set()
+        # Removals first, so they make room for additions
+        for product_id, quantity in sorted(quantities.items(), key=lambda entry: entry[1] > 0):
+            if product_id in self.items:
+                self.set(product_id, quantity)
+            elif product_id in available:
+                self.add(product_id, quantity)
+
+    def remove(self, product_id):
+        return self.set(product_id, 0)
+
+    def clear(self):
+        self.items.clear()
+        self.changed()
+
+    def changed(self):
+        self.modified = True
+        self.__dict__.pop('lines', None)
+
+    @cached_property
+    def lines(self):
+        """
+        Unsaved CartItems for the products still available, in the order
+        added, with card images loaded in one query
+        """
+        products = Product.objects.filter(pk__in=self.items, status='available').with_primary_image().in_bulk()
+        return [
+            CartItem(product=products[product_id], quantity=quantity)
+            for product_id, quantity in self.items.items()
+            if product_id in products
+        ]
+
+    @property
+    def total_items(self):
+        return sum(self.items.values())
+
+    @property
+    def total_price(self):
+        return sum((line.total_price for line in self.lines), Decimal('0.00'))
+
+    def save(self, response):
+        if not self.modified:
+            return
+        if self.items:
+            response.set_signed_cookie(
+                COOKIE_NAME, encode(self.items), salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE,
+                httponly=True, samesite='Lax',
+            )
+        else:
+            response.delete_cookie(COOKIE_NAME, samesite='Lax')
+        self.modified = False
+
+
+def merge_into(guest, user):
+    """
+    Add a guest cart's items to the user's Cart, one upsert per
+    ``MERGE_BATCH_SIZE`` products, and empty the guest cart
+    """
+    if not guest:
+        return
+    cart_id = cart_id_for(user)
+    items = list(guest.items.items())
+    for start in range(0, len(items), MERGE_BATCH_SIZE):
+        add_cart_items(cart_id, dict(items[start:start + MERGE_BATCH_SIZE]))
+    guest.clear()
+
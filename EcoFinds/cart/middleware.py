@@ -0,0 +1,12 @@
+class GuestCartMiddleware:
+    """Write changes to the request's guest cart back to its cookie"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        guest = getattr(request, '_guest_cart', None)
+        if guest is not None:
+            guest.save(response)
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0001_initial"),
+        ("products", "0010_product_trending_score"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="cartitem",
+            index=models.Index(fields=["added_at"], name="cartitem_added_idx"),
+        ),
+    ]
@@ -1,5 +1,11 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import connection, models, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.functional import cached_property
 from products.models import Product
 
 
@@ -11,24 +17,34 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart for {self.user.username}"
 
+    def totals(self):
+        """``{'items': quantity, 'price': amount}`` of the cart from one aggregate query"""
+        money = models.DecimalField(max_digits=12, decimal_places=2)
+        totals = self.items.aggregate(
+            items=Coalesce(Sum('quantity'), 0),
+            price=Coalesce(Sum(F('quantity') * F('product__price'), output_field=money), Decimal('0.00'),
+                           output_field=money),
+        )
+        # SQLite hands back whole amounts without their cents
+        totals['price'] = totals['price'].quantize(Decimal('0.01'))
+        return totals
+
+    @cached_property
+    def summary(self):
+        """``totals()`` as of first use; read it after changing the items"""
+        return self.totals()
+
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.summary['items']
 
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.summary['price']
 
     def add_item(self, product, quantity=1):
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=self,
-            product=product,
-            defaults={'quantity': quantity}
-        )
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
-        return cart_item
+        add_cart_items(self.pk, {product.pk: quantity})
+        return CartItem.objects.get(cart=self, product=product)
 
     def remove_item(self, product):
         try:
@@ -50,10 +66,95 @@ class CartItem(models.Model):
 
     class Meta:
         unique_together = ['cart', 'product']
+        indexes = [
+            # Trending runs read only the adds since the previous run
+            models.Index(fields=['added_at'], name='cartitem_added_idx'),
+        ]
 
     def __str__(self):
         return f"{self.quantity}x {self.product.title} in {self.cart.user.username}'s cart"
 
     @property
     def total_price(self):
-        return self.product.price * self.quantity
\ No newline at end of file
+        return self.product.price * self.quantity
+
+
+def cart_id_for(user):
+    """
+    The id of the user's cart, created on first use, from a single
+    ``INSERT ... ON CONFLICT`` statement, so concurrent first requests
+    cannot race to create it
+    """
+    table = connection.ops.quote_name(Cart._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, created_at, updated_at) VALUES (%s, %s, %s) "
+            "ON CONFLICT (user_id) DO UPDATE SET updated_at = excluded.updated_at"
+            + (" RETURNING id" if connection.features.can_return_columns_from_insert else ""),
+            [user.pk, now, now],
+        )
+        if connection.features.can_return_columns_from_insert:
+            return cursor.fetchone()[0]
+    return Cart.objects.filter(user=user).values_list('pk', flat=True).get()
+
+
+def add_cart_items(cart_id, quantities):
+    """
+    Add ``{product_id: quantity}`` to a cart in a single statement: new
+    products are inserted and ones already in the cart have the quantity
+    added in the database, so concurrent adds are never lost. Products
+    that are not available are skipped. Returns the number of products
+    added.
+    """
+    if not quantities:
+        return 0
+    items = connection.ops.quote_name(CartItem._meta.db_table)
+    products = connection.ops.quote_name(Product._meta.db_table)
+    cases = ' '.join('WHEN %s THEN %s' for _ in quantities)
+    placeholders = ', '.join('%s' for _ in quantities)
+    params = [cart_id]
+    for product_id, quantity in quantities.items():
+        params += [product_id, quantity]
+    params += [connection.ops.adapt_datetimefield_value(timezone.now()), *quantities, 'available']
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {items} (cart_id, product_id, quantity, added_at) "
+            f"SELECT %s, id, CASE id {cases} END, %s FROM {products} "
+            f"WHERE id IN ({placeholders}) AND status = %s "
+            f"ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {items}.quantity + excluded.quantity",
+            params,
+        )
+        return cursor.rowcount
+
+
+def set_cart_quantities(cart_id, quantities):
+    """
+    Set the quantities of ``{product_id: quantity}`` in a cart in one
+    transaction: a quantity of 0 removes the product, products already in
+    the cart are changed with one bulk update, and the rest are added
+    with one upsert (unavailable products are skipped)
+    """
+    with transaction.atomic():
+        existing = {
+            item.product_id: item
+            for item in CartItem.objects.filter(cart_id=cart_id, product_id__in=quantities)
+        }
+        removed = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+        changed = []
+        for product_id, item in existing.items():
+            quantity = quantities[product_id]
+            if quantity > 0 and quantity != item.quantity:
+                item.quantity = quantity
+                changed.append(item)
+        added = {
+            product_id: quantity
+            for product_id, quantity in quantities.items()
+            if quantity > 0 and product_id not in existing
+        }
+
+        if removed:
+            CartItem.objects.filter(cart_id=cart_id, product_id__in=removed).delete()
+        if changed:
+            CartItem.objects.bulk_update(changed, ['quantity'])
+        add_cart_items(cart_id, added)
@@ -0,0 +1,11 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from .guest import GuestCart, merge_into
+
+
+@receiver(user_logged_in)
+def merge_guest_cart(sender, request, user, **kwargs):
+    """Move what the visitor added before signing in into their cart"""
+    if request is not None:
+        merge_into(GuestCart.from_request(request), user)
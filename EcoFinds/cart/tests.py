@@ -1,3 +1,316 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from products.models import Category, Product
+from . import guest
+from .models import Cart, CartItem, add_cart_items, cart_id_for, set_cart_quantities
+
+
+def create_products(seller, count, price='250.00'):
+    category, _ = Category.objects.get_or_create(name='Books', slug='books')
+    return [
+        Product.objects.create(
+            title=f'Book {i}', slug=f'book-{i}', description='Gently used', category=category,
+            seller=seller, price=Decimal(price), condition='good', city='Pune', state='Maharashtra',
+        )
+        for i in range(count)
+    ]
+
+
+class CartTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='password')
+        cls.products = create_products(cls.user, 3)
+        cls.products[1].price = Decimal('99.50')
+        cls.products[1].save()
+
+    def test_totals_come_from_one_aggregate(self):
+        cart = Cart.objects.create(user=self.user)
+        for product, quantity in zip(self.products, (1, 2, 3)):
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        cart = Cart.objects.get(pk=cart.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(cart.total_items, 6)
+            self.assertEqual(cart.total_price, Decimal('1199.00'))
+
+    def test_empty_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        self.assertEqual(cart.totals(), {'items': 0, 'price': Decimal('0.00')})
+
+
+class CartEndpointQueryCountTests(TestCase):
+    """
+    Cart requests cost the same number of queries however full the cart is.
+    Counts include the session and user lookups, and the savepoints
+    around get_or_create inserts.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='password')
+        cls.products = create_products(cls.user, 12)
+
+    def setUp(self):
+        self.client.login(username='buyer', password='password')
+
+    def fill_cart(self, count):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        cart.items.all().delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=2) for product in self.products[:count]
+        ])
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def count_queries(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def assertQueriesPerRequest(self, expected, request):
+        counts = []
+        for size in (1, 10):
+            self.fill_cart(size)
+            counts.append(self.count_queries(request))
+        self.assertEqual(counts, [expected, expected])
+
+    def test_cart_page(self):
+        self.assertQueriesPerRequest(6, lambda: self.client.get('/cart/'))
+
+    def test_add(self):
+        last = self.products[-1]
+        self.assertQueriesPerRequest(5, lambda: self.post('/cart/add/', {'product_id': last.pk}))
+
+    def test_remove(self):
+        first = self.products[0]
+        self.assertQueriesPerRequest(6, lambda: self.post('/cart/remove/', {'product_id': first.pk}))
+
+    def test_update(self):
+        first = self.products[0]
+        self.assertQueriesPerRequest(
+            6, lambda: self.post('/cart/update/', {'product_id': first.pk, 'quantity': 5})
+        )
+        data = self.post('/cart/update/', {'product_id': first.pk, 'quantity': 3}).json()
+        self.assertEqual((data['cart_total'], data['item_total']), (21, '750.00'))
+
+    def test_batch(self):
+        first, second, last = self.products[0], self.products[1], self.products[-1]
+        operations = [
+            {'product_id': first.pk, 'quantity': 4},
+            {'product_id': second.pk, 'quantity': 0},
+            {'product_id': last.pk, 'quantity': 1},
+        ]
+        self.assertQueriesPerRequest(10, lambda: self.post('/cart/batch/', {'operations': operations}))
+
+
+class AddToCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='password')
+        cls.products = create_products(cls.user, 3)
+        cls.products[2].status = 'sold'
+        cls.products[2].save()
+
+    def test_add_is_two_statements(self):
+        with CaptureQueriesContext(connection) as queries:
+            cart_id = cart_id_for(self.user)
+            added = add_cart_items(cart_id, {self.products[0].pk: 2, self.products[1].pk: 1})
+        self.assertEqual((len(queries), added), (2, 2))
+        add_cart_items(cart_id_for(self.user), {self.products[0].pk: 3})
+        self.assertEqual(Cart.objects.get().totals()['items'], 6)
+        self.assertEqual(Cart.objects.count(), 1)
+
+    def test_unavailable_products_are_not_added(self):
+        self.client.login(username='buyer', password='password')
+        response = self.client.post('/cart/add/', json.dumps({'product_id': self.products[2].pk}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartItem.objects.exists())
+        response = self.client.post('/cart/add/', json.dumps({'product_id': self.products[0].pk, 'quantity': 0}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class GuestCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.buyer = User.objects.create_user('buyer', password='password')
+        cls.products = create_products(cls.seller, 30)
+
+    def add(self, product, quantity=1):
+        return self.client.post('/cart/add/', json.dumps({'product_id': product.pk, 'quantity': quantity}),
+                                content_type='application/json')
+
+    def test_adding_writes_only_the_cookie(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.add(self.products[0], 2)
+            response = self.add(self.products[1])
+        self.assertEqual(response.json()['cart_total'], 3)
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in queries), queries)
+        self.assertFalse(Cart.objects.exists())
+
+        response = self.client.get('/cart/')
+        self.assertEqual([item.quantity for item in response.context['cart_items']], [2, 1])
+        self.assertEqual(response.context['cart'].total_price, Decimal('750.00'))
+
+    def test_tampered_cookie_reads_as_empty(self):
+        self.add(self.products[0])
+        value = self.client.cookies[guest.COOKIE_NAME].value
+        self.client.cookies[guest.COOKIE_NAME] = value.replace(f'{self.products[0].pk}:1', f'{self.products[0].pk}:9')
+        response = self.client.get('/cart/')
+        self.assertEqual(list(response.context['cart_items']), [])
+
+    def test_cart_size_is_capped(self):
+        with mock.patch.object(guest, 'MAX_ITEMS', 2):
+            self.add(self.products[0])
+            self.add(self.products[1])
+            response = self.add(self.products[2])
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(self.add(self.products[0], 500).json()['cart_total'], guest.MAX_QUANTITY + 1)
+
+    def test_update_and_remove(self):
+        self.add(self.products[0])
+        self.add(self.products[1])
+        response = self.client.post('/cart/update/', json.dumps({'product_id': self.products[0].pk, 'quantity': 3}),
+                                    content_type='application/json')
+        self.assertEqual((response.json()['cart_total'], response.json()['item_total']), (4, '750.00'))
+        response = self.client.post('/cart/remove/', json.dumps({'product_id': self.products[1].pk}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['cart_total'], 3)
+        response = self.client.post('/cart/remove/', json.dumps({'product_id': self.products[1].pk}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_login_merges_in_batches(self):
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+        for product in self.products:
+            self.add(product)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/auth/login/', {'username': 'buyer', 'password': 'password'})
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "cart_cartitem"')]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(response.cookies[guest.COOKIE_NAME].value, '')
+
+        quantities = dict(CartItem.objects.values_list('product_id', 'quantity'))
+        self.assertEqual(len(quantities), 30)
+        self.assertEqual(quantities[self.products[0].pk], 2)
+
+
+class BatchCartUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='password')
+        cls.products = create_products(cls.user, 5)
+        cls.products[4].status = 'sold'
+        cls.products[4].save()
+
+    def post(self, operations):
+        return self.client.post('/cart/batch/', json.dumps({'operations': operations}),
+                                content_type='application/json')
+
+    def test_changes_are_applied_together(self):
+        cart = Cart.objects.create(user=self.user)
+        for product in self.products[:3]:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        set_cart_quantities(cart.pk, {
+            self.products[0].pk: 3,
+            self.products[1].pk: 0,
+            self.products[3].pk: 2,
+            self.products[4].pk: 1,
+        })
+        quantities = dict(CartItem.objects.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {self.products[0].pk: 3, self.products[2].pk: 1, self.products[3].pk: 2})
+
+    def test_endpoint_returns_totals(self):
+        self.client.login(username='buyer', password='password')
+        data = self.post([
+            {'product_id': self.products[0].pk, 'quantity': 1},
+            {'product_id': self.products[1].pk, 'quantity': 2},
+            {'product_id': self.products[0].pk, 'quantity': 3},
+        ]).json()
+        self.assertEqual((data['cart_total'], data['total_price']), (5, '1250.00'))
+
+    def test_guest_batch(self):
+        data = self.post([
+            {'product_id': self.products[0].pk, 'quantity': 2},
+            {'product_id': self.products[4].pk, 'quantity': 1},
+        ]).json()
+        self.assertEqual((data['cart_total'], data['total_price']), (2, '500.00'))
+        data = self.post([{'product_id': self.products[0].pk, 'quantity': 0}]).json()
+        self.assertEqual(data['cart_total'], 0)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_invalid_operations_are_rejected(self):
+        self.client.login(username='buyer', password='password')
+        for operations in ([{'product_id': self.products[0].pk}], [{'product_id': 'x', 'quantity': 1}],
+                           [{'product_id': self.products[0].pk, 'quantity': -1}], 'all'):
+            self.assertEqual(self.post(operations).status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+
+def retry_while_locked(func, *args, attempts=200, delay=0.005):
+    """
+    Call ``func`` until SQLite stops reporting a locked table, giving up
+    after ``attempts`` tries. Connections to the in-memory test database
+    share one cache, and SQLite fails statements that contend on it
+    instead of waiting as it does for a database file.
+    """
+    for attempt in range(attempts):
+        try:
+            return func(*args)
+        except OperationalError as e:
+            if 'locked' not in str(e) or attempt == attempts - 1:
+                raise
+            time.sleep(delay * min(attempt + 1, 10))
+
+
+# Products are committed here, so their on-commit tasks would otherwise
+# run on the background pool and contend with the test's threads
+@override_settings(TASKS_EAGER=True)
+class ConcurrentAddToCartTests(TransactionTestCase):
+    THREADS = 8
+    ADDS = 25
+
+    def test_parallel_adds_are_all_counted(self):
+        user = User.objects.create_user('buyer', password='password')
+        products = create_products(user, 2)
+        barrier = threading.Barrier(self.THREADS, timeout=10)
+        errors = []
+
+        def add():
+            try:
+                barrier.wait()
+                for i in range(self.ADDS):
+                    cart_id = retry_while_locked(cart_id_for, user)
+                    retry_while_locked(add_cart_items, cart_id, {products[i % 2].pk: 1})
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=add) for _ in range(self.THREADS)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=60)
+
+        self.assertFalse([worker for worker in workers if worker.is_alive()], 'adds did not finish')
+        self.assertEqual(errors, [])
+        self.assertEqual(Cart.objects.count(), 1)
+        quantities = dict(CartItem.objects.values_list('product_id', 'quantity'))
+        self.assertEqual(sum(quantities.values()), self.THREADS * self.ADDS)
+        self.assertEqual(len(quantities), 2)
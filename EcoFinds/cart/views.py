@@ -1,28 +1,35 @@
-from django.shortcuts import render, get_object_or_404
-from django.contrib.auth.decorators import login_required
+from django.shortcuts import render
 from django.http import JsonResponse
-from .models import Cart, CartItem
-from products.models import Product
+from .guest import GuestCart
+from .models import Cart, CartItem, add_cart_items, cart_id_for, set_cart_quantities
+from products.models import Product, display_images_prefetch
 import json
 
+# Operations accepted by one batch_update_cart request
+MAX_BATCH_OPERATIONS = 100
+
 
-@login_required
 def cart_view(request):
     """
     Shopping cart view
     """
+    if not request.user.is_authenticated:
+        guest = GuestCart.from_request(request)
+        return render(request, 'main/cart.html', {'cart': guest, 'cart_items': guest.lines})
+
     cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.all()
+    cart_items = cart.items.select_related('product').prefetch_related(
+        display_images_prefetch('product__images')
+    )
     
     context = {
         'cart': cart,
         'cart_items': cart_items,
     }
     
-    return render(request, 'cart/cart.html', context)
+    return render(request, 'main/cart.html', context)
 
 
-@login_required
 def add_to_cart(request):
     """
     Add product to cart
@@ -30,33 +37,33 @@ def add_to_cart(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            product_id = data.get('product_id')
+            product_id = int(data.get('product_id'))
             quantity = int(data.get('quantity', 1))
+            if quantity < 1:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Quantity must be at least 1'
+                }, status=400)
+
+            if not request.user.is_authenticated:
+                return add_to_guest_cart(request, product_id, quantity)
             
-            product = Product.objects.get(id=product_id, status='available')
-            cart, created = Cart.objects.get_or_create(user=request.user)
-            
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-            
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+            # One upsert each for the cart and the item; see add_cart_items
+            cart_id = cart_id_for(request.user)
+            if not add_cart_items(cart_id, {product_id: quantity}):
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Product not found'
+                }, status=404)
             
             return JsonResponse({
                 'success': True,
                 'message': 'Product added to cart',
-                'cart_total': cart.total_items
+                'cart_total': Cart(pk=cart_id, user=request.user).total_items
             })
             
-        except Product.DoesNotExist:
-            return JsonResponse({
-                'success': False,
-                'message': 'Product not found'
-            }, status=404)
+        except (TypeError, ValueError):
+            return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -66,7 +73,30 @@ def add_to_cart(request):
     return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
 
 
-@login_required
+def add_to_guest_cart(request, product_id, quantity):
+    """
+    Add to the visitor's cookie cart; nothing is written to the database
+    """
+    if not Product.objects.filter(pk=product_id, status='available').exists():
+        return JsonResponse({
+            'success': False,
+            'message': 'Product not found'
+        }, status=404)
+
+    guest = GuestCart.from_request(request)
+    if not guest.add(product_id, quantity):
+        return JsonResponse({
+            'success': False,
+            'message': 'Your cart is full'
+        }, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'message': 'Product added to cart',
+        'cart_total': guest.total_items
+    })
+
+
 def remove_from_cart(request):
     """
     Remove product from cart
@@ -75,6 +105,16 @@ def remove_from_cart(request):
         try:
             data = json.loads(request.body)
             product_id = data.get('product_id')
+
+            if not request.user.is_authenticated:
+                guest = GuestCart.from_request(request)
+                if not guest.remove(int(product_id)):
+                    raise CartItem.DoesNotExist
+                return JsonResponse({
+                    'success': True,
+                    'message': 'Product removed from cart',
+                    'cart_total': guest.total_items
+                })
             
             cart = Cart.objects.get(user=request.user)
             cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
@@ -100,7 +140,6 @@ def remove_from_cart(request):
     return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
 
 
-@login_required
 def update_cart_item(request):
     """
     Update cart item quantity
@@ -110,9 +149,12 @@ def update_cart_item(request):
             data = json.loads(request.body)
             product_id = data.get('product_id')
             quantity = int(data.get('quantity', 1))
+
+            if not request.user.is_authenticated:
+                return update_guest_cart(request, int(product_id), quantity)
             
             cart = Cart.objects.get(user=request.user)
-            cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
+            cart_item = CartItem.objects.select_related('product').get(cart=cart, product_id=product_id)
             
             if quantity <= 0:
                 cart_item.delete()
@@ -141,13 +183,81 @@ def update_cart_item(request):
     return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
 
 
-@login_required
+def update_guest_cart(request, product_id, quantity):
+    guest = GuestCart.from_request(request)
+    if not guest.set(product_id, quantity):
+        raise CartItem.DoesNotExist
+    item_total = 0
+    if quantity > 0:
+        price = Product.objects.filter(pk=product_id).values_list('price', flat=True).first() or 0
+        item_total = price * guest.items[product_id]
+    return JsonResponse({
+        'success': True,
+        'message': 'Cart updated',
+        'cart_total': guest.total_items,
+        'item_total': item_total
+    })
+
+
+def batch_update_cart(request):
+    """
+    Apply several quantity changes at once. Expects
+    ``{"operations": [{"product_id": 1, "quantity": 2}, ...]}``; a quantity
+    of 0 removes the product, and a later operation on the same product
+    replaces an earlier one. Returns the cart totals after all of them.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
+
+    try:
+        operations = json.loads(request.body)['operations']
+        if not isinstance(operations, list) or len(operations) > MAX_BATCH_OPERATIONS:
+            raise ValueError
+        quantities = {
+            int(operation['product_id']): int(operation['quantity'])
+            for operation in operations
+        }
+        if any(quantity < 0 for quantity in quantities.values()):
+            raise ValueError
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
+
+    try:
+        if request.user.is_authenticated:
+            cart_id = cart_id_for(request.user)
+            set_cart_quantities(cart_id, quantities)
+            cart = Cart(pk=cart_id, user=request.user)
+        else:
+            cart = GuestCart.from_request(request)
+            cart.update(quantities)
+
+        return JsonResponse({
+            'success': True,
+            'message': 'Cart updated',
+            'cart_total': cart.total_items,
+            'total_price': cart.total_price
+        })
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': 'Error updating cart'
+        }, status=500)
+
+
 def clear_cart(request):
     """
     Clear all items from cart
     """
     if request.method == 'POST':
         try:
+            if not request.user.is_authenticated:
+                GuestCart.from_request(request).clear()
+                return JsonResponse({
+                    'success': True,
+                    'message': 'Cart cleared'
+                })
+
             cart = Cart.objects.get(user=request.user)
             cart.clear()
             
@@ -1,3 +1,138 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from PIL import Image
+
+from cart.models import Cart, CartItem
+from products import tasks
+from products.cache import lookup_stats
+from products.models import Category, Product, ProductImage
+
+
+class ProductCardQueryCountTests(TestCase):
+    """Home and cart pages load card images in bulk, not per product"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('shopper', password='password')
+        self.category = Category.objects.create(name='Books', slug='books')
+
+    def add_products(self, count, featured=False):
+        products = []
+        for i in range(count):
+            product = Product.objects.create(
+                title=f'Book {i}', slug=f'book-{Product.objects.count()}',
+                description='Gently used', category=self.category, seller=self.user,
+                price=Decimal('250.00'), condition='good', city='Pune', state='Maharashtra',
+                is_featured=featured,
+            )
+            ProductImage.objects.create(product=product, image=f'products/{product.slug}.jpg', is_primary=True)
+            ProductImage.objects.create(product=product, image=f'products/{product.slug}-2.jpg')
+            products.append(product)
+        return products
+
+    def count_queries(self, url, table=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len([q for q in ctx.captured_queries if table is None or f'"{table}"' in q['sql']])
+
+    def test_home_query_count_is_constant(self):
+        self.add_products(1, featured=True)
+        self.add_products(1)
+        few = self.count_queries('/')
+        self.add_products(8, featured=True)
+        self.add_products(8)
+        self.assertEqual(self.count_queries('/'), few)
+
+    def test_cart_image_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        cart = Cart.objects.create(user=self.user)
+        for product in self.add_products(1):
+            CartItem.objects.create(cart=cart, product=product)
+        few = self.count_queries('/cart/', table='products_productimage')
+        for product in self.add_products(10):
+            CartItem.objects.create(cart=cart, product=product)
+        self.assertEqual(self.count_queries('/cart/', table='products_productimage'), few)
+
+
+class HomePageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('shopper', password='password')
+        self.category = Category.objects.create(name='Books', slug='books')
+        self.product = Product.objects.create(
+            title='Atlas of the world', slug='atlas', description='Gently used',
+            category=self.category, seller=self.user, price=Decimal('250.00'),
+            condition='good', city='Pune', state='Maharashtra',
+        )
+
+    def get(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx)
+
+    def test_anonymous_visitors_share_a_cached_response(self):
+        self.get()
+        response, queries = self.get()
+        self.assertEqual(queries, 0)
+        self.assertContains(response, 'Atlas of the world')
+        self.assertEqual(lookup_stats(['home_response'])['home_response']['hits'], 1)
+
+    def test_logged_in_users_get_their_own_navbar(self):
+        self.get()
+        self.client.force_login(self.user)
+        response, _ = self.get()
+        self.assertContains(response, 'Atlas of the world')
+        self.assertContains(response, 'My Orders')
+        self.assertEqual(lookup_stats(['home_body'])['home_body']['hits'], 1)
+
+    def test_blocks_refresh_when_products_change(self):
+        self.get()
+        self.product.is_featured = True
+        self.product.save()
+        self.assertContains(self.get()[0], 'Featured Products')
+
+        self.product.status = 'sold'
+        self.product.save()
+        self.assertNotContains(self.get()[0], 'Atlas of the world')
+
+    def test_blocks_refresh_when_card_images_change(self):
+        self.get()
+        image = ProductImage.objects.create(product=self.product, image='products/atlas-cover.jpg', is_primary=True)
+        self.assertContains(self.get()[0], '/media/products/atlas-cover.jpg')
+        image.delete()
+        self.assertNotContains(self.get()[0], '/media/products/atlas-cover.jpg')
+
+    def test_blocks_refresh_when_an_upload_is_processed(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            buffer = BytesIO()
+            Image.new('RGB', (800, 600), (80, 186, 66)).save(buffer, 'PNG')
+            name = default_storage.save('products/atlas.png', ContentFile(buffer.getvalue()))
+            image = ProductImage.objects.create(product=self.product, image=name, is_primary=True)
+            self.assertContains(self.get()[0], '/media/products/atlas.png')
+
+            tasks.process_image(image.pk)
+            image.refresh_from_db()
+            response, _ = self.get()
+        self.assertNotContains(response, '/media/products/atlas.png')
+        self.assertContains(response, image.rendition_url('card'))
+
+    def test_unrelated_edits_keep_the_cache(self):
+        self.get()
+        self.product.model = 'Hardback'
+        self.product.save()
+        self.assertEqual(self.get()[1], 0)
@@ -1,13 +1,15 @@
 from django.urls import path
 from . import views
+from cart import views as cart_views
 
 app_name = 'main'
 
 urlpatterns = [
     path('', views.home, name='home'),
-    path('cart/', views.cart_view, name='cart'),
-    path('cart/add/', views.add_to_cart, name='add_to_cart'),
-    path('cart/remove/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/', cart_views.cart_view, name='cart'),
+    path('cart/add/', cart_views.add_to_cart, name='add_to_cart'),
+    path('cart/remove/', cart_views.remove_from_cart, name='remove_from_cart'),
     path('about/', views.about, name='about'),
     path('contact/', views.contact, name='contact'),
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
 ]
@@ -1,101 +1,96 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from products.models import Product, Category
-from cart.models import Cart, CartItem
-from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-import json
+from products import trending
+from products.catalog import CatalogQuery
+from products.views import render_listing
+from products.cache import get_home_generation, lookup_stats, record_lookup
+from django.contrib.admin.views.decorators import staff_member_required
 
+# Backstop for writes that bypass the signals bumping the home generation,
+# such as queryset updates from the shell
+HOME_TIMEOUT = 60 * 10
 
-def home(request):
+
+def render_home_body():
     """
-    Home page view
+    Render the product blocks of the home page, the same for every visitor.
+    No request is passed, so nothing user-specific can leak into the cache.
     """
     # Get featured products
     featured_products = Product.objects.filter(
         is_featured=True, 
         status='available'
-    )[:8]
+    ).with_primary_image()[:8]
+    
+    # Get trending products, scored by the update_trending command
+    trending_products = trending.trending_products().with_primary_image()
     
     # Get latest products
     latest_products = Product.objects.filter(
         status='available'
-    ).order_by('-created_at')[:8]
+    ).order_by('-created_at').with_primary_image()[:8]
     
     # Get categories
     categories = Category.objects.all()[:6]
     
     context = {
         'featured_products': featured_products,
+        'trending_products': trending_products,
         'latest_products': latest_products,
         'categories': categories,
     }
-    
-    return render(request, 'main/home.html', context)
+    return render_to_string('main/partials/home_body.html', context)
+
+
+def home(request):
+    """
+    Home page view
+
+    Anonymous visitors without pending messages share one cached response;
+    everyone else gets the cached product blocks inside a page rendered for
+    them. Both are keyed by the home generation, see products.signals.
+    """
+    generation = get_home_generation()
+    shared = request.method == 'GET' and not request.user.is_authenticated and not get_messages(request)
+    if shared:
+        response_key = f'home:response:{generation}'
+        html = cache.get(response_key)
+        record_lookup('home_response', html is not None)
+        if html is not None:
+            return HttpResponse(html)
+
+    body_key = f'home:body:{generation}'
+    home_body = cache.get(body_key)
+    record_lookup('home_body', home_body is not None)
+    if home_body is None:
+        home_body = render_home_body()
+        cache.set(body_key, home_body, HOME_TIMEOUT)
+
+    response = render(request, 'main/home.html', {'home_body': mark_safe(home_body)})
+    if shared:
+        cache.set(response_key, response.content.decode(), HOME_TIMEOUT)
+    return response
+
+
+@staff_member_required
+def cache_stats(request):
+    """
+    Hit/miss counters of the page caches. With a per-process cache backend
+    the numbers cover the process that serves this request.
+    """
+    return JsonResponse(lookup_stats())
 
 
 def product_list(request):
     """
     Product listing page
     """
-    products = Product.objects.filter(status='available')
-    categories = Category.objects.all()
-    
-    # Filter by category
-    category_slug = request.GET.get('category')
-    if category_slug:
-        try:
-            category = Category.objects.get(slug=category_slug)
-            products = products.filter(category=category)
-        except Category.DoesNotExist:
-            pass
-    
-    # Search functionality
-    search_query = request.GET.get('search')
-    if search_query:
-        products = products.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(brand__icontains=search_query)
-        )
-    
-    # Filter by condition
-    condition = request.GET.get('condition')
-    if condition:
-        products = products.filter(condition=condition)
-    
-    # Filter by price range
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    
-    if min_price:
-        products = products.filter(price__gte=min_price)
-    if max_price:
-        products = products.filter(price__lte=max_price)
-    
-    # Sort products
-    sort_by = request.GET.get('sort', 'newest')
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'oldest':
-        products = products.order_by('created_at')
-    else:  # newest
-        products = products.order_by('-created_at')
-    
-    context = {
-        'products': products,
-        'categories': categories,
-        'current_category': category_slug,
-        'search_query': search_query,
-        'condition': condition,
-        'min_price': min_price,
-        'max_price': max_price,
-        'sort_by': sort_by,
-    }
-    
-    return render(request, 'main/product_list.html', context)
+    return render_listing(request, CatalogQuery.from_params(request.GET))
 
 
 def product_detail(request, slug):
@@ -107,7 +102,7 @@ def product_detail(request, slug):
         related_products = Product.objects.filter(
             category=product.category,
             status='available'
-        ).exclude(id=product.id)[:4]
+        ).exclude(id=product.id).with_primary_image()[:4]
         
         context = {
             'product': product,
@@ -119,100 +114,6 @@ def product_detail(request, slug):
         return render(request, 'main/404.html', status=404)
 
 
-@login_required
-def cart_view(request):
-    """
-    Shopping cart view
-    """
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.all()
-    
-    context = {
-        'cart': cart,
-        'cart_items': cart_items,
-    }
-    
-    return render(request, 'main/cart.html', context)
-
-
-@login_required
-def add_to_cart(request):
-    """
-    Add product to cart
-    """
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            product_id = data.get('product_id')
-            quantity = int(data.get('quantity', 1))
-            
-            product = Product.objects.get(id=product_id, status='available')
-            cart, created = Cart.objects.get_or_create(user=request.user)
-            
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-            
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
-            
-            return JsonResponse({
-                'success': True,
-                'message': 'Product added to cart',
-                'cart_total': cart.total_items
-            })
-            
-        except Product.DoesNotExist:
-            return JsonResponse({
-                'success': False,
-                'message': 'Product not found'
-            }, status=404)
-        except Exception as e:
-            return JsonResponse({
-                'success': False,
-                'message': 'Error adding product to cart'
-            }, status=500)
-    
-    return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
-
-
-@login_required
-def remove_from_cart(request):
-    """
-    Remove product from cart
-    """
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            product_id = data.get('product_id')
-            
-            cart = Cart.objects.get(user=request.user)
-            cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
-            cart_item.delete()
-            
-            return JsonResponse({
-                'success': True,
-                'message': 'Product removed from cart',
-                'cart_total': cart.total_items
-            })
-            
-        except (Cart.DoesNotExist, CartItem.DoesNotExist):
-            return JsonResponse({
-                'success': False,
-                'message': 'Item not found in cart'
-            }, status=404)
-        except Exception as e:
-            return JsonResponse({
-                'success': False,
-                'message': 'Error removing product from cart'
-            }, status=500)
-    
-    return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
-
-
 def about(request):
     """
     About page
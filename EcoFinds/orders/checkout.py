@@ -0,0 +1,66 @@
+"""
+Turning a user's cart into an order.
+
+Checkout runs as one transaction with a fixed number of statements
+however full the cart is: the cart is read once with its products, the
+products are marked sold with a single UPDATE that only matches ones
+still available, the order items are bulk-inserted and the cart is
+emptied. If another buyer got to a product first the UPDATE matches
+fewer rows than the cart holds and everything is rolled back.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from cart.models import CartItem
+from products.models import Product
+from products.signals import products_sold
+from .models import Order, OrderItem
+
+
+class CheckoutError(Exception):
+    """The cart cannot be ordered; the message is shown to the buyer"""
+
+
+SHIPPING_FIELDS = ('name', 'phone', 'address', 'city', 'state', 'pincode')
+
+
+def place_order(user, payment_method='cash_on_delivery', shipping=None):
+    """Order everything in ``user``'s cart and empty it"""
+    shipping = shipping or {}
+    with transaction.atomic():
+        # Locks the cart's product rows where the database supports it
+        items = list(
+            CartItem.objects.filter(cart__user=user)
+            .select_related('product').select_for_update(of=('product',))
+        )
+        if not items:
+            raise CheckoutError('Cart is empty')
+
+        products = [item.product for item in items]
+        unavailable = [product.title for product in products if product.status != 'available']
+        if unavailable:
+            raise CheckoutError(f"No longer available: {', '.join(unavailable)}")
+
+        sold = Product.objects.filter(
+            pk__in=[product.pk for product in products], status='available'
+        ).update(status='sold')
+        if sold != len(products):
+            raise CheckoutError('Some items in your cart were just sold')
+
+        subtotal = sum((item.total_price for item in items), Decimal('0.00'))
+        order = Order.objects.create(
+            user=user,
+            payment_method=payment_method,
+            subtotal=subtotal,
+            total_amount=subtotal,  # Add shipping cost if needed
+            **{f'shipping_{name}': shipping.get(name, '') for name in SHIPPING_FIELDS},
+            shipping_country=shipping.get('country', 'India'),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item.product, quantity=item.quantity, price=item.product.price)
+            for item in items
+        ])
+        CartItem.objects.filter(pk__in=[item.pk for item in items]).delete()
+        products_sold(products)
+    return order
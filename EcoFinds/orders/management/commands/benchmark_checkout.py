@@ -0,0 +1,76 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from cart.models import Cart, CartItem, add_cart_items, cart_id_for
+from orders.checkout import place_order
+from orders.models import Order, OrderItem
+from products import tasks
+from products.benchmarks import benchmark_database, format_timing, seed_catalog, time_call
+from products.models import Product
+
+
+def per_item_checkout(user):
+    """
+    Checkout as create_order used to do it: totals summed item by item
+    twice, one INSERT and product fetch per item, no transaction, and no
+    products marked sold
+    """
+    cart = Cart.objects.get(user=user)
+    cart_items = cart.items.all()
+    subtotal = sum((item.product.price * item.quantity for item in cart.items.all()), Decimal('0.00'))
+    total = sum((item.product.price * item.quantity for item in cart.items.all()), Decimal('0.00'))
+    order = Order.objects.create(
+        user=user, payment_method='cash_on_delivery', subtotal=subtotal, total_amount=total,
+        shipping_name='', shipping_phone='', shipping_address='', shipping_city='', shipping_state='',
+        shipping_pincode='',
+    )
+    for cart_item in cart_items:
+        OrderItem.objects.create(
+            order=order, product=cart_item.product, quantity=cart_item.quantity, price=cart_item.product.price
+        )
+    cart.clear()
+    return order
+
+
+class Command(BaseCommand):
+    help = 'Benchmark checkout latency against cart size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10000, help='Catalog size')
+        parser.add_argument('--cart-sizes', nargs='+', type=int, default=[1, 5, 20, 50],
+                            help='Products in the cart at checkout')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed checkouts per cart size')
+
+    def handle(self, *args, **options):
+        # Background tasks a sale queues run after the response; they are
+        # dropped so the timings are the checkout request's own
+        with benchmark_database(), override_settings(DEBUG=False), mock.patch.object(tasks, 'enqueue'):
+            self.stdout.write(f'Seeding {options["size"]} products...')
+            seed_catalog(options['size'])
+            buyer = User.objects.create_user('benchmark_buyer')
+            available = list(
+                Product.objects.filter(status='available').values_list('pk', flat=True)[:max(options['cart_sizes'])]
+            )
+
+            for cart_size in sorted(options['cart_sizes']):
+                product_ids = available[:cart_size]
+
+                def fill_cart():
+                    Product.objects.filter(pk__in=product_ids).update(status='available')
+                    CartItem.objects.filter(cart__user=buyer).delete()
+                    add_cart_items(cart_id_for(buyer), {product_id: 1 for product_id in product_ids})
+
+                self.stdout.write(f'\nCart of {cart_size} products:')
+                variants = [
+                    ('place_order', lambda: place_order(buyer)),
+                    ('per-item', lambda: per_item_checkout(buyer)),
+                ]
+                for name, func in variants:
+                    timing = time_call(func, options['repeat'], setup=fill_cart)
+                    self.stdout.write(f'  {name:12} {format_timing(timing)}')
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
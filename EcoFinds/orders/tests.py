@@ -1,3 +1,89 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from cart.models import CartItem, add_cart_items, cart_id_for
+from products import autocomplete, search
+from products.cache import get_catalog_generation
+from products.models import Category, Product
+from .checkout import CheckoutError, place_order
+from .models import Order, OrderItem
+
+
+@override_settings(TASKS_EAGER=True)
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.buyer = User.objects.create_user('buyer', password='password')
+        category = Category.objects.create(name='Books', slug='books')
+        cls.products = [
+            Product.objects.create(
+                title=f'Novel {i}', slug=f'novel-{i}', description='Gently used', category=category,
+                seller=cls.seller, price=Decimal('120.50'), condition='good', city='Pune', state='Maharashtra',
+            )
+            for i in range(12)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        autocomplete.clear_index()
+
+    def fill_cart(self, count, user=None, start=0):
+        products = self.products[start:start + count]
+        add_cart_items(cart_id_for(user or self.buyer), {product.pk: 1 for product in products})
+
+    def test_order_is_placed_and_products_sold(self):
+        self.fill_cart(2)
+        generation = get_catalog_generation()
+        self.assertIn('novel 0', [s['text'] for s in autocomplete.suggest('novel')])
+        self.client.force_login(self.buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/orders/create/', json.dumps({'shipping': {'name': 'Asha', 'city': 'Pune'}}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+        order = Order.objects.get()
+        self.assertEqual((order.subtotal, order.shipping_name, order.shipping_country),
+                         (Decimal('241.00'), 'Asha', 'India'))
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 2)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(
+            set(Product.objects.filter(status='sold').values_list('pk', flat=True)),
+            {self.products[0].pk, self.products[1].pk},
+        )
+        self.assertNotEqual(get_catalog_generation(), generation)
+        titles = [s['text'] for s in autocomplete.suggest('novel')]
+        self.assertNotIn('novel 0', titles)
+        self.assertIn('novel 2', titles)
+        if search.fts_available():
+            self.assertNotIn(self.products[0], search.search(Product.objects.all(), 'novel'))
+
+    def test_sold_product_rolls_back_the_order(self):
+        self.fill_cart(3)
+        Product.objects.filter(pk=self.products[1].pk).update(status='sold')
+        with self.assertRaisesMessage(CheckoutError, 'Novel 1'):
+            place_order(self.buyer)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 3)
+        self.assertEqual(Product.objects.filter(status='sold').count(), 1)
+
+    def test_empty_cart(self):
+        self.client.force_login(self.buyer)
+        response = self.client.post('/orders/create/', '{}', content_type='application/json')
+        self.assertEqual((response.status_code, response.json()['message']), (400, 'Cart is empty'))
+
+    @override_settings(TASKS_EAGER=False)
+    def test_queries_do_not_grow_with_the_cart(self):
+        counts = []
+        for size, user, start in ((1, self.buyer, 0), (10, self.seller, 1)):
+            self.fill_cart(size, user, start)
+            with CaptureQueriesContext(connection) as queries:
+                place_order(user)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
@@ -2,11 +2,9 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.contrib import messages
-from .models import Order, OrderItem, OrderTracking, Refund
-from cart.models import Cart, CartItem
-from products.models import Product
+from .checkout import CheckoutError, place_order
+from .models import Order, OrderTracking, Refund
 import json
-import uuid
 
 
 @login_required
@@ -30,47 +28,14 @@ def create_order(request):
     """
     if request.method == 'POST':
         try:
-            cart = Cart.objects.get(user=request.user)
-            cart_items = cart.items.all()
-            
-            if not cart_items.exists():
-                return JsonResponse({
-                    'success': False,
-                    'message': 'Cart is empty'
-                }, status=400)
-            
             # Get shipping address from request
             data = json.loads(request.body)
-            shipping_data = data.get('shipping', {})
-            payment_method = data.get('payment_method', 'cash_on_delivery')
-            
-            # Create order
-            order = Order.objects.create(
-                user=request.user,
-                payment_method=payment_method,
-                subtotal=cart.total_price,
-                total_amount=cart.total_price,  # Add shipping cost if needed
-                shipping_name=shipping_data.get('name', ''),
-                shipping_phone=shipping_data.get('phone', ''),
-                shipping_address=shipping_data.get('address', ''),
-                shipping_city=shipping_data.get('city', ''),
-                shipping_state=shipping_data.get('state', ''),
-                shipping_pincode=shipping_data.get('pincode', ''),
-                shipping_country=shipping_data.get('country', 'India'),
+            order = place_order(
+                request.user,
+                payment_method=data.get('payment_method', 'cash_on_delivery'),
+                shipping=data.get('shipping', {}),
             )
             
-            # Create order items
-            for cart_item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    quantity=cart_item.quantity,
-                    price=cart_item.product.price
-                )
-            
-            # Clear cart
-            cart.clear()
-            
             return JsonResponse({
                 'success': True,
                 'message': 'Order created successfully',
@@ -78,11 +43,11 @@ def create_order(request):
                 'order_number': order.order_number
             })
             
-        except Cart.DoesNotExist:
+        except CheckoutError as e:
             return JsonResponse({
                 'success': False,
-                'message': 'Cart not found'
-            }, status=404)
+                'message': str(e)
+            }, status=400)
         except Exception as e:
             return JsonResponse({
                 'success': False,
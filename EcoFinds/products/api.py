@@ -0,0 +1,114 @@
+"""
+Read-only JSON catalog API, mounted at /api/.
+
+Product listings take the same filters as the listing pages (see
+products.catalog) and are paged with the same keyset cursors (see
+products.pagination): ``next`` and ``previous`` are links carrying
+``?cursor=`` (a cursor that does not decode is a 404), and
+``?page_size=`` asks for up to ``MAX_PAGE_SIZE`` rows.
+``?fields=id,title,price`` limits products to the named fields, and only
+the columns and prefetches those fields need are loaded.
+"""
+from django.shortcuts import get_object_or_404
+from rest_framework import permissions, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .catalog import CatalogQuery
+from .models import Category, Product, ProductReview
+from .pagination import PER_PAGE, KeysetPaginator
+from .reviews import REVIEW_ORDERING
+from .serializers import CategorySerializer, ProductDetailSerializer, ProductSerializer, ReviewSerializer
+
+MAX_PAGE_SIZE = 1000
+
+
+class KeysetCursorPagination(BasePagination):
+    """DRF pagination over ``KeysetPaginator``, ordered by ``view.get_ordering()``"""
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return PER_PAGE
+        return max(1, min(size, MAX_PAGE_SIZE))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(queryset, view.get_ordering(), self.get_page_size(request))
+        cursor = request.query_params.get('cursor')
+        if cursor and paginator.parse_cursor(cursor) is None:
+            # As DRF's CursorPagination answers cursors it cannot use
+            raise NotFound('Invalid cursor')
+        self.page = paginator.page(cursor)
+        return self.page.object_list
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), 'cursor', cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.page.next_cursor),
+            'previous': self.get_link(self.page.previous_cursor),
+            'results': data,
+        })
+
+
+class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Available products. The list is a page of cards; a single product adds
+    its description, seller, category and every displayable image.
+    """
+    permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetCursorPagination
+
+    @property
+    def requested_fields(self):
+        """Field names from ``?fields=``, or None for all of them"""
+        fields = self.request.query_params.get('fields', '')
+        return {name.strip() for name in fields.split(',') if name.strip()} or None
+
+    def get_serializer_class(self):
+        return ProductDetailSerializer if self.action == 'retrieve' else ProductSerializer
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'fields': self.requested_fields}
+
+    def get_queryset(self):
+        if self.action != 'list':
+            return Product.objects.filter(status='available').select_related(
+                'category', 'seller'
+            ).with_primary_image()
+        self.query = CatalogQuery.from_params(self.request.query_params)
+        if self.query.errors:
+            raise ValidationError({'price': list(self.query.errors)})
+        products, _ = self.query.filtered()
+        fields = self.requested_fields
+        return self.query.cards(
+            products, ProductSerializer.columns(fields), images=not fields or 'primary_image' in fields
+        )
+
+    def get_ordering(self):
+        return REVIEW_ORDERING if self.action == 'reviews' else self.query.ordering
+
+    @action(detail=True)
+    def reviews(self, request, pk=None):
+        """The product's reviews, newest first"""
+        product = get_object_or_404(Product.objects.only('pk'), pk=pk, status='available')
+        reviews = ProductReview.objects.filter(product=product).select_related('user')
+        page = self.paginate_queryset(reviews)
+        serializer = ReviewSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+
+class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+    permission_classes = [permissions.AllowAny]
+    pagination_class = None
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
@@ -0,0 +1,9 @@
+from rest_framework.routers import DefaultRouter
+
+from . import api
+
+router = DefaultRouter()
+router.register('products', api.ProductViewSet, basename='product')
+router.register('categories', api.CategoryViewSet, basename='category')
+
+urlpatterns = router.urls
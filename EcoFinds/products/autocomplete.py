@@ -0,0 +1,259 @@
+"""
+Typeahead suggestions for the search box.
+
+Category names, brands, title words and whole titles of available products
+are kept in sorted arrays, one per kind, and completed with bisect: the keys
+starting with a prefix form the contiguous run that begins at
+``bisect_left(keys, prefix)``. Each key carries the number of available
+products behind it, which ranks the suggestions of its kind.
+
+Like the similarity index, each process builds its own copy (the WSGI and
+ASGI entry points start that at startup, otherwise the first request does)
+and then applies the product saves and deletes it handles itself, once they
+commit (see products.signals). Changes made through other processes are
+picked up by a rebuild once the catalog generation shows them, checked
+every ``REFRESH_INTERVAL`` seconds.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from urllib.parse import urlencode
+
+from django.db import connection
+from django.urls import reverse
+
+from . import tasks
+from .cache import get_catalog_generation
+from .models import Category, Product
+from .search import tokenize
+
+MIN_PREFIX = 2
+
+SUGGESTIONS = 8
+
+# Kinds in the order they are shown, with the most each may contribute
+KIND_LIMITS = {'category': 2, 'brand': 2, 'term': 3, 'title': 4}
+
+# Matches of a kind ranked per lookup; a very short prefix of the title
+# index ranks only the first of its matches in key order
+SCAN_LIMIT = 200
+
+# Product fields the suggestions are built from
+PRODUCT_FIELDS = ('title', 'brand', 'category_id', 'status')
+
+
+def normalize(text):
+    return ' '.join(tokenize(text))
+
+
+class PrefixIndex:
+    """Sorted keys with a product count each, and display labels where they differ"""
+
+    def __init__(self, counts=None, labels=None):
+        self.counts = counts or {}
+        self.labels = labels or {}
+        self.keys = sorted(self.counts)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, label=None):
+        if key not in self.counts:
+            insort(self.keys, key)
+            self.counts[key] = 0
+            if label and label != key:
+                self.labels[key] = label
+        self.counts[key] += 1
+
+    def discard(self, key):
+        count = self.counts.get(key)
+        if count is None:
+            return
+        if count > 1:
+            self.counts[key] = count - 1
+            return
+        del self.counts[key]
+        self.labels.pop(key, None)
+        del self.keys[bisect_left(self.keys, key)]
+
+    def complete(self, prefix, limit):
+        """``[(key, label, count), ...]`` for the best keys starting with ``prefix``"""
+        start = bisect_left(self.keys, prefix)
+        matches = []
+        for key in self.keys[start:start + SCAN_LIMIT]:
+            if not key.startswith(prefix):
+                break
+            matches.append(key)
+        matches.sort(key=lambda key: (-self.counts[key], key))
+        return [(key, self.labels.get(key, key), self.counts[key]) for key in matches[:limit]]
+
+
+class Autocomplete:
+    def __init__(self, categories):
+        self.categories = categories  # category id -> (key, name, slug)
+        self.slugs = {key: slug for key, _, slug in categories.values()}
+        self.indexes = {kind: PrefixIndex() for kind in KIND_LIMITS}
+
+    @classmethod
+    def build(cls, rows, categories):
+        counts = {kind: {} for kind in KIND_LIMITS}
+        labels = {kind: {} for kind in KIND_LIMITS}
+        index = cls(categories)
+        for row in rows:
+            for kind, key, label in index.entries(row):
+                counts[kind][key] = counts[kind].get(key, 0) + 1
+                if label and label != key:
+                    labels[kind].setdefault(key, label)
+        index.indexes = {kind: PrefixIndex(counts[kind], labels[kind]) for kind in KIND_LIMITS}
+        return index
+
+    def entries(self, row):
+        """``(kind, key, label)`` for everything a product row contributes"""
+        title = normalize(row['title'])
+        if title:
+            yield 'title', title, None
+        for term in set(tokenize(row['title'])):
+            if len(term) > 1 and not term.isdigit():
+                yield 'term', term, None
+        brand = normalize(row['brand'])
+        if brand:
+            yield 'brand', brand, row['brand'].strip()
+        if row['category_id'] in self.categories:
+            key, name, _ = self.categories[row['category_id']]
+            yield 'category', key, name
+
+    def add(self, row):
+        for kind, key, label in self.entries(row):
+            self.indexes[kind].add(key, label)
+
+    def remove(self, row):
+        for kind, key, _ in self.entries(row):
+            self.indexes[kind].discard(key)
+
+    def suggest(self, query, limit=SUGGESTIONS):
+        tokens = tokenize(query)
+        prefix = ' '.join(tokens)
+        if len(prefix) < MIN_PREFIX:
+            return []
+        suggestions = []
+        for kind, kind_limit in KIND_LIMITS.items():
+            if kind == 'term':
+                # Complete the last word, keeping the ones typed before it
+                head = ' '.join(tokens[:-1])
+                matches = [
+                    (f'{head} {key}'.strip(), f'{head} {label}'.strip(), count)
+                    for key, label, count in self.indexes[kind].complete(tokens[-1], kind_limit)
+                ]
+            else:
+                matches = self.indexes[kind].complete(prefix, kind_limit)
+            for key, label, count in matches:
+                if kind == 'category':
+                    url = reverse('products:product_list') + '?' + urlencode({'category': self.slugs[key]})
+                else:
+                    url = reverse('products:product_list') + '?' + urlencode({'search': label})
+                suggestions.append({'text': label, 'kind': kind, 'count': count, 'url': url})
+
+        # Whole titles often repeat a completed word; show each text once
+        seen = set()
+        unique = []
+        for suggestion in suggestions:
+            if suggestion['text'].lower() not in seen:
+                seen.add(suggestion['text'].lower())
+                unique.append(suggestion)
+        return unique[:limit]
+
+
+# Seconds between checks for catalog changes made by other processes
+REFRESH_INTERVAL = 60
+
+_index = None
+_index_generation = None  # catalog generation the index was built at
+_checked_at = 0.0
+_refreshing = False
+_index_lock = threading.RLock()
+
+
+def load_categories():
+    return {
+        pk: (normalize(name), name, slug)
+        for pk, name, slug in Category.objects.values_list('pk', 'name', 'slug')
+    }
+
+
+def clear_index():
+    """Forget the in-memory index; the next lookup rebuilds it"""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def build_index():
+    """A fresh index and the catalog generation it reflects"""
+    # Read first, so changes committed during the build show up as a
+    # newer generation at the next check
+    generation = get_catalog_generation()
+    rows = Product.objects.filter(status='available').values(*PRODUCT_FIELDS).iterator(chunk_size=5000)
+    return Autocomplete.build(rows, load_categories()), generation
+
+
+def refresh_index():
+    """Rebuild the index and swap it in; lookups use the old one meanwhile"""
+    global _index, _index_generation, _refreshing
+    try:
+        index, generation = build_index()
+        with _index_lock:
+            _index, _index_generation = index, generation
+    finally:
+        _refreshing = False
+
+
+def get_index():
+    """
+    The process's index, built on first use. Every ``REFRESH_INTERVAL``
+    seconds the catalog generation is compared with the one the index was
+    built at, and a rebuild is queued if it moved, which picks up products
+    changed through other processes.
+    """
+    global _index, _index_generation, _checked_at, _refreshing
+    with _index_lock:
+        if _index is None:
+            _index, _index_generation = build_index()
+            _checked_at = time.monotonic()
+        elif not _refreshing and time.monotonic() - _checked_at >= REFRESH_INTERVAL:
+            _checked_at = time.monotonic()
+            if get_catalog_generation() != _index_generation:
+                _refreshing = True
+                tasks.enqueue(refresh_index)
+        return _index
+
+
+def start_warming():
+    """Build the index on a background thread, so the first request need not"""
+    def warm():
+        try:
+            get_index()
+        finally:
+            connection.close()
+
+    threading.Thread(target=warm, name='autocomplete-warmup', daemon=True).start()
+
+
+def suggest(query, limit=SUGGESTIONS):
+    # Saves change the index from other threads; read it under the same lock
+    with _index_lock:
+        return get_index().suggest(query, limit)
+
+
+def product_changed(old, new):
+    """
+    Apply a committed product change to the index, if this process has one.
+    ``old`` and ``new`` are the product's field values before and after, or
+    None where it was not listed.
+    """
+    with _index_lock:
+        if _index is None:
+            return
+        if old is not None and old.get('status') == 'available':
+            _index.remove(old)
+        if new is not None and new.get('status') == 'available':
+            _index.add(new)
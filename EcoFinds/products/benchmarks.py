@@ -0,0 +1,119 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks run against a throwaway test database so they never touch real
+data; the synthetic catalog is bulk-inserted and grown between sizes.
+"""
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+from .models import Category, Product
+
+WORDS = [
+    'vintage', 'leather', 'wooden', 'classic', 'portable', 'wireless', 'compact',
+    'ergonomic', 'stainless', 'handmade', 'refurbished', 'premium', 'foldable',
+    'jacket', 'laptop', 'bicycle', 'table', 'lamp', 'headset', 'camera', 'phone',
+    'bookshelf', 'sofa', 'guitar', 'watch', 'backpack', 'speaker', 'monitor',
+    'keyboard', 'sneakers', 'novel', 'blender', 'kettle', 'helmet', 'stroller',
+]
+BRANDS = [
+    'Samsung', 'Apple', 'Sony', 'Adidas', 'Nike', 'Ikea', 'Philips', 'Dell',
+    'Lenovo', 'Canon', 'Yamaha', 'Bosch', 'Puma', 'Hero', 'Prestige', '',
+]
+CITIES = [('Mumbai', 'Maharashtra'), ('Pune', 'Maharashtra'), ('Delhi', 'Delhi'),
+          ('Bengaluru', 'Karnataka'), ('Chennai', 'Tamil Nadu'), ('Jaipur', 'Rajasthan')]
+CATEGORY_NAMES = ['Electronics', 'Clothing', 'Books', 'Furniture', 'Sports', 'Vehicles']
+
+# Synthetic long-tail vocabulary so descriptions are not all the same few words
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'tas', 'vo', 'zu', 'pri', 'sel', 'dor', 'nek', 'gal', 'fen', 'bru']
+VOCABULARY = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+VOCABULARY_WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+@contextmanager
+def benchmark_database():
+    """Create a throwaway test database for the duration of the block"""
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+def seed_catalog(size, batch_size=5000, seed=42):
+    """
+    Grow the synthetic catalog to ``size`` products.
+
+    Rows are bulk-inserted, so model signals (and the search index) are not
+    updated; callers rebuild whatever derived state they benchmark.
+    """
+    rng = random.Random(seed + size)
+    seller, _ = User.objects.get_or_create(username='benchmark_seller')
+    categories = [
+        Category.objects.get_or_create(slug=name.lower(), defaults={'name': name})[0]
+        for name in CATEGORY_NAMES
+    ]
+    conditions = [choice for choice, _ in Product.CONDITION_CHOICES]
+
+    start = Product.objects.count()
+    batch = []
+    for i in range(start, size):
+        words = rng.sample(WORDS, 3)
+        city, state = rng.choice(CITIES)
+        batch.append(Product(
+            title=' '.join(words + rng.choices(VOCABULARY, VOCABULARY_WEIGHTS)).title(),
+            slug=f'benchmark-product-{i}',
+            description=' '.join(rng.choices(VOCABULARY, VOCABULARY_WEIGHTS, k=20)),
+            category=rng.choice(categories),
+            seller=seller,
+            price=Decimal(rng.randint(100, 200000)) / 2,
+            condition=rng.choice(conditions),
+            brand=rng.choice(BRANDS),
+            city=city,
+            state=state,
+            status='available' if rng.random() < 0.9 else 'sold',
+            is_featured=rng.random() < 0.01,
+        ))
+        if len(batch) >= batch_size:
+            Product.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Product.objects.bulk_create(batch)
+    if connection.vendor == 'sqlite':
+        # Planner statistics, as a migrated production database has them
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    return Product.objects.count()
+
+
+def time_call(func, repeat=20, setup=None):
+    """
+    Call ``func`` repeatedly and summarise wall-clock latency in
+    milliseconds; ``setup``, if given, runs untimed before every call
+    """
+    setup = setup or (lambda: None)
+    setup()
+    func()  # warm up caches and connections
+    timings = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'mean_ms': statistics.mean(timings),
+        'p50_ms': timings[len(timings) // 2],
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+    }
+
+
+def format_timing(timing):
+    return 'mean {mean_ms:8.2f} ms  p50 {p50_ms:8.2f} ms  p95 {p95_ms:8.2f} ms'.format(**timing)
@@ -0,0 +1,148 @@
+"""
+Cache helpers for data derived from the product catalog.
+
+Derived results are stored under keys that embed a generation counter.
+Whenever products change the counter is bumped, so stale entries are never
+read again and simply expire; nothing has to track individual keys.
+"""
+import time
+
+from django.core.cache import cache
+
+CATALOG_GENERATION_KEY = 'catalog:generation'
+
+
+def get_generation(key):
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock so an evicted counter never reuses an old value
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def get_catalog_generation():
+    return get_generation(CATALOG_GENERATION_KEY)
+
+
+def bump_catalog_generation():
+    bump_generation(CATALOG_GENERATION_KEY)
+
+
+# Detail pages: one version counter per product, bumped whenever anything
+# shown on its page changes, plus a generation for bulk related-product
+# rebuilds
+RELATED_GENERATION_KEY = 'related:generation'
+
+
+def product_version_key(product_id):
+    return f'product:{product_id}:version'
+
+
+def bump_product_versions(product_ids):
+    for product_id in set(product_ids):
+        bump_generation(product_version_key(product_id))
+
+
+def bump_related_generation():
+    bump_generation(RELATED_GENERATION_KEY)
+
+
+def product_detail_key(product_id):
+    version = get_generation(product_version_key(product_id))
+    related = get_generation(RELATED_GENERATION_KEY)
+    return f'product:detail:{product_id}:{version}:{related}'
+
+
+# Home page blocks, refreshed when products are published, featured, edited
+# or sold
+HOME_GENERATION_KEY = 'home:generation'
+
+
+def get_home_generation():
+    return get_generation(HOME_GENERATION_KEY)
+
+
+def bump_home_generation():
+    bump_generation(HOME_GENERATION_KEY)
+
+
+# Listing results: a generation per category, bumped when one of its
+# products changes, and one for listings across all categories
+def listing_generation_key(category_id=None):
+    if category_id is None:
+        return 'listing:all:generation'
+    return f'listing:category:{category_id}:generation'
+
+
+def get_listing_generation(category_id=None):
+    return get_generation(listing_generation_key(category_id))
+
+
+def bump_listing_generations(category_ids):
+    for category_id in {*category_ids, None}:
+        bump_generation(listing_generation_key(category_id))
+
+
+# Hit/miss counters per cache, reported by the cache_stats command
+TRACKED_CACHES = ['home_response', 'home_body', 'product_detail', 'listing_results']
+
+OUTCOMES = ('hits', 'misses', 'hits_us', 'misses_us')
+
+
+def _counter_key(name, outcome):
+    return f'stats:{name}:{outcome}'
+
+
+def _increment(key, amount):
+    if not cache.add(key, amount, None):
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(key, amount, None)
+
+
+def record_lookup(name, hit, elapsed=None):
+    """Count a hit or miss, and the seconds it took to serve if given"""
+    outcome = 'hits' if hit else 'misses'
+    _increment(_counter_key(name, outcome), 1)
+    if elapsed is not None:
+        _increment(_counter_key(name, f'{outcome}_us'), int(elapsed * 1_000_000))
+
+
+def lookup_stats(names=None):
+    """
+    ``{name: {'hits': n, 'misses': n, 'hit_ratio': r}}`` per tracked cache,
+    plus ``hit_ms``/``miss_ms`` mean latencies for caches that record them
+    """
+    names = names or TRACKED_CACHES
+    counters = cache.get_many([_counter_key(name, outcome) for name in names for outcome in OUTCOMES])
+    stats = {}
+    for name in names:
+        hits = counters.get(_counter_key(name, 'hits'), 0)
+        misses = counters.get(_counter_key(name, 'misses'), 0)
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else None,
+        }
+        for label, outcome, count in (('hit_ms', 'hits', hits), ('miss_ms', 'misses', misses)):
+            total = counters.get(_counter_key(name, f'{outcome}_us'))
+            if total is not None and count:
+                stats[name][label] = total / count / 1000
+    return stats
+
+
+def reset_lookup_stats(names=None):
+    cache.delete_many([
+        _counter_key(name, outcome)
+        for name in (names or TRACKED_CACHES) for outcome in OUTCOMES
+    ])
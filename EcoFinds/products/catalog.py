@@ -0,0 +1,218 @@
+"""
+Catalog queries shared by every product listing.
+
+A listing request is parsed once into a ``CatalogQuery``: a validated
+description of what to show, independent of which view or URL it came
+from. The query then compiles itself to a queryset that keeps the sort
+index usable (see products.pagination.filter_price_range), loads only the
+columns a product card and its cursor need, and is paginated through the
+result cache when it is not a search. Listing views, and anything else
+that lists products, should go through here rather than filter
+``Product.objects`` themselves.
+"""
+import time
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+from .cache import get_catalog_generation
+from .facets import get_facets
+from .fuzzy import search_with_fallback
+from .models import Category, Product
+from .pagination import SORT_ORDERINGS, filter_price_range, paginate
+from .results import RESULT_TIMEOUT, paginate_cached
+from .search import tokenize
+
+# Minimum average rating options offered on listing pages
+RATING_FILTERS = ('4', '3', '2')
+
+CONDITIONS = {value for value, _ in Product.CONDITION_CHOICES}
+
+# Sorts by values that change without a save (see products.counters)
+DERIVED_SORTS = {'popular'}
+
+# Columns a product card renders; sort columns are added per query so that
+# building cursors never loads a deferred field
+CARD_FIELDS = (
+    'id', 'title', 'slug', 'description', 'price', 'condition', 'city', 'state',
+    'created_at', 'rating_average', 'rating_count', 'category_id',
+)
+
+
+def parse_price(value, label, errors):
+    """A non-negative Decimal, or None with a message in ``errors``"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        price = None
+    if price is None or not price.is_finite() or price < 0:
+        errors.append(f'Ignored the {label} price "{value}": enter a number of rupees.')
+        return None
+    return price.normalize() if price == price.to_integral() else price
+
+
+@dataclass(frozen=True)
+class CatalogQuery:
+    category: Category = None
+    search: str = ''
+    condition: str = ''
+    min_price: Decimal = None
+    max_price: Decimal = None
+    min_rating: str = ''
+    sort: str = 'newest'
+    errors: tuple = ()
+
+    @classmethod
+    def from_params(cls, params, category=None, search_param='search'):
+        """
+        Parse listing parameters. ``category`` pins the listing to a
+        category resolved from the URL instead of ``?category=``; searches
+        are read from ``search_param``. Unknown values are ignored and
+        unusable prices are reported in ``errors``.
+        """
+        if category is None and params.get('category'):
+            category = Category.objects.filter(slug=params['category']).first()
+        search = ' '.join(params.get(search_param, '').split())
+        if not tokenize(search):
+            # Nothing to match on, e.g. only punctuation: not a search
+            search = ''
+        condition = params.get('condition', '')
+        min_rating = params.get('min_rating', '')
+
+        errors = []
+        min_price = parse_price(params.get('min_price'), 'minimum', errors)
+        max_price = parse_price(params.get('max_price'), 'maximum', errors)
+        if min_price is not None and max_price is not None and min_price > max_price:
+            min_price, max_price = max_price, min_price
+
+        # Searches default to best match first; other listings cannot use it
+        sort = params.get('sort') or ('relevance' if search else 'newest')
+        if sort not in SORT_ORDERINGS or (sort == 'relevance' and not search):
+            sort = 'newest'
+
+        return cls(
+            category=category,
+            search=search,
+            condition=condition if condition in CONDITIONS else '',
+            min_price=min_price,
+            max_price=max_price,
+            min_rating=min_rating if min_rating in RATING_FILTERS else '',
+            sort=sort,
+            errors=tuple(errors),
+        )
+
+    @property
+    def params(self):
+        """The filters in the parameter form products.facets signs for cache keys"""
+        values = {
+            'category': self.category.slug if self.category else '',
+            'search': self.search,
+            'condition': self.condition,
+            'min_price': '' if self.min_price is None else str(self.min_price),
+            'max_price': '' if self.max_price is None else str(self.max_price),
+            'min_rating': self.min_rating,
+        }
+        return {name: value for name, value in values.items() if value}
+
+    @property
+    def version(self):
+        """
+        Changes whenever the listing may show something different: with the
+        catalog generation, and for derived sorts as often as cached results
+        may lag (see products.results)
+        """
+        if self.sort in DERIVED_SORTS:
+            return get_catalog_generation(), int(time.time() // RESULT_TIMEOUT)
+        return (get_catalog_generation(),)
+
+    @property
+    def ordering(self):
+        return SORT_ORDERINGS[self.sort]
+
+    @property
+    def selections(self):
+        """
+        The category, condition and price selected, as conditions by facet
+        dimension (see products.facets.compute_facets)
+        """
+        selections = {}
+        if self.category:
+            selections['category'] = Q(category_id=self.category.pk)
+        if self.condition:
+            selections['condition'] = Q(condition=self.condition)
+        price = Q()
+        if self.min_price:
+            price &= Q(price__gte=self.min_price)
+        if self.max_price:
+            price &= Q(price__lte=self.max_price)
+        if price:
+            selections['price'] = price
+        return selections
+
+    def searched(self):
+        """
+        ``(queryset, corrected_query)``: the available products matching the
+        search and rating filter, before the facet selections are applied,
+        and the search as corrected when close spellings had to be used (see
+        products.fuzzy)
+        """
+        products = Product.objects.filter(status='available')
+        if self.min_rating:
+            products = products.filter(rating_average__gte=self.min_rating)
+        corrected_query = None
+        if self.search:
+            products, corrected_query = search_with_fallback(products, self.search)
+        return products, corrected_query
+
+    def select(self, queryset):
+        """``queryset`` narrowed to the selected category, condition and prices"""
+        if self.category:
+            queryset = queryset.filter(category_id=self.category.pk)
+        if self.condition:
+            queryset = queryset.filter(condition=self.condition)
+        return filter_price_range(queryset, self.min_price, self.max_price, self.sort)
+
+    def filtered(self):
+        """
+        ``(queryset, corrected_query)``: the matching available products,
+        unordered unless searched, and the corrected search if any
+        """
+        products, corrected_query = self.searched()
+        return self.select(products), corrected_query
+
+    def cards(self, queryset, fields=CARD_FIELDS, images=True):
+        """
+        ``queryset`` narrowed to the columns ``fields`` and the cursors read,
+        with card images prefetched unless ``images`` is false
+        """
+        sort_fields = [field.lstrip('-') for field in self.ordering if field != 'search_rank']
+        queryset = queryset.only(*dict.fromkeys([*fields, *sort_fields]))
+        return queryset.with_primary_image() if images else queryset
+
+    def page(self, request, queryset):
+        """A page of cards; plain filter combinations come from the result cache"""
+        cards = self.cards(queryset)
+        if self.search:
+            return paginate(request, cards, self.sort)
+        return paginate_cached(
+            request, cards, self.sort, self.category.pk if self.category else None, params=self.params
+        )
+
+    def listing(self, request, categories=None):
+        """
+        Everything a listing page shows for this query: the page of cards,
+        the corrected search, and sidebar facets when ``categories`` is given
+        """
+        products, corrected_query = self.searched()
+        facets = None
+        if categories is not None:
+            facets = get_facets(products, categories, self.params, self.selections)
+        return {
+            'products': self.page(request, self.select(products)),
+            'corrected_query': corrected_query,
+            'facets': facets,
+        }
@@ -0,0 +1,50 @@
+"""
+Conditional GET for catalog pages.
+
+A page's ETag is built from the cache counters that already change
+whenever its content does (see products.cache), together with what makes
+the page differ between visitors: the signed-in user and the CSRF cookie
+that embedded forms are tied to. A browser revalidating with a matching
+``If-None-Match`` gets a 304 before the page's queries run or its
+templates render.
+
+ETags are weak because pages embed a freshly masked CSRF token on every
+render; the content is equivalent, not byte-identical.
+"""
+import hashlib
+import json
+
+from django.contrib.messages import get_messages
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+
+def page_etag(request, *parts):
+    """
+    ETag for the page ``parts`` describe, as seen by this visitor, or None
+    when the response must not be reused, e.g. while messages are pending
+    """
+    if request.method not in ('GET', 'HEAD') or get_messages(request):
+        return None
+    user = request.user
+    visitor = [user.pk, user.get_short_name() or user.get_username()] if user.is_authenticated else None
+    # Pages post to the cart with a CSRF token, so make sure the cookie a
+    # first visit is given is the one this tag is computed from
+    get_token(request)
+    payload = json.dumps([parts, visitor, request.META.get('CSRF_COOKIE')], default=str)
+    return f'W/"{hashlib.md5(payload.encode()).hexdigest()}"'
+
+
+def not_modified(request, etag):
+    """A 304 response when the client already has the page tagged ``etag``"""
+    if etag is None:
+        return None
+    return get_conditional_response(request, etag=etag)
+
+
+def tag_response(response, etag):
+    """Attach ``etag`` and ask browsers to revalidate before reusing the page"""
+    if etag is not None and response.status_code == 200:
+        response.headers['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,98 @@
+"""
+Write-behind product view counters.
+
+Detail page hits are tallied in memory per process and written out in one
+UPDATE per flush, instead of one write per hit competing for the database's
+write lock. A timer writes hits at most ``VIEW_COUNTER_FLUSH_SECONDS`` after
+they are recorded, or at once when ``VIEW_COUNTER_MAX_PENDING`` are pending,
+on the background task pool; one more flush runs at interpreter exit. A
+killed worker therefore loses at most one interval's worth of its own hits.
+"""
+import atexit
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import tasks
+from .models import Product
+
+
+def write_view_counts(counts):
+    """Add ``{product_id: views}`` to the stored counters in one UPDATE"""
+    if not counts:
+        return
+    Product.objects.filter(pk__in=counts).update(
+        view_count=F('view_count') + Case(
+            *[When(pk=product_id, then=Value(views)) for product_id, views in counts.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        last_viewed_at=timezone.now(),
+    )
+
+
+class ViewCounterBuffer:
+    def __init__(self, flush_seconds=None, max_pending=None):
+        self.flush_seconds = flush_seconds if flush_seconds is not None else getattr(
+            settings, 'VIEW_COUNTER_FLUSH_SECONDS', 10)
+        self.max_pending = max_pending if max_pending is not None else getattr(
+            settings, 'VIEW_COUNTER_MAX_PENDING', 1000)
+        self._counts = Counter()
+        self._pending = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def record(self, product_id):
+        with self._lock:
+            self._counts[product_id] += 1
+            self._pending += 1
+            counts = self._take() if self._pending >= self.max_pending else None
+            if counts is None and self._timer is None:
+                # Whatever is pending then is written within one interval
+                self._timer = threading.Timer(self.flush_seconds, self._flush_due)
+                self._timer.daemon = True
+                self._timer.start()
+        if counts:
+            tasks.enqueue(write_view_counts, counts)
+
+    def flush(self):
+        """Write pending counts now, in the calling thread"""
+        with self._lock:
+            counts = self._take()
+        write_view_counts(counts)
+
+    def pending(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def _flush_due(self):
+        with self._lock:
+            self._timer = None
+            counts = self._take()
+        if counts:
+            tasks.enqueue(write_view_counts, counts)
+
+    def _take(self):
+        counts, self._counts = dict(self._counts), Counter()
+        self._pending = 0
+        return counts
+
+
+view_counter = ViewCounterBuffer()
+
+
+def record_view(product_id):
+    if getattr(settings, 'VIEW_COUNTERS_ENABLED', True):
+        view_counter.record(product_id)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        view_counter.flush()
+    except Exception:
+        # The database may already be gone at shutdown
+        pass
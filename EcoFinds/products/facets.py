@@ -0,0 +1,109 @@
+"""
+Faceted counts for the product list sidebar.
+
+All per-category, per-condition and price-bucket counts for a filtered
+queryset come from a single conditional-aggregate query; each dimension is
+counted without its own selection, so choosing one category still shows
+how many products the others have. Results are cached per normalized
+filter signature and catalog generation.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .cache import get_catalog_generation
+from .models import Product
+
+FACET_TIMEOUT = 60 * 5
+
+# Query parameters that change which products match
+FILTER_PARAMS = ('category', 'search', 'condition', 'min_price', 'max_price', 'min_rating')
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ('under-500', 'Under ₹500', None, 500),
+    ('500-2000', '₹500 – ₹2,000', 500, 2000),
+    ('2000-10000', '₹2,000 – ₹10,000', 2000, 10000),
+    ('10000-50000', '₹10,000 – ₹50,000', 10000, 50000),
+    ('over-50000', 'Over ₹50,000', 50000, None),
+]
+
+
+def filter_signature(params):
+    """Stable hash of the filtering parameters, ignoring sort and cursor"""
+    normalized = sorted(
+        (name, ' '.join(params.get(name, '').lower().split()))
+        for name in FILTER_PARAMS
+        if params.get(name, '').strip()
+    )
+    return hashlib.md5(json.dumps(normalized).encode()).hexdigest()
+
+
+def _price_condition(low, high):
+    condition = Q()
+    if low is not None:
+        condition &= Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+def _count(condition, selections, dimension):
+    """Count matches of ``condition`` under every selection but ``dimension``'s"""
+    for name, selection in selections.items():
+        if name != dimension:
+            condition &= selection
+    return Count('pk', filter=condition) if condition else Count('pk')
+
+
+def compute_facets(queryset, categories, selections=None):
+    """
+    Count matches per facet value in one aggregate query.
+
+    ``selections`` maps the dimensions with a value chosen ('category',
+    'condition', 'price') to the condition that applies it; ``queryset`` has
+    every other filter but not these. Each dimension is counted under the
+    other dimensions' selections only, so the counts next to the
+    alternatives to a chosen value are what choosing them would show.
+    """
+    selections = selections or {}
+    aggregates = {'total': _count(Q(), selections, None)}
+    for category in categories:
+        aggregates[f'category_{category.pk}'] = _count(Q(category_id=category.pk), selections, 'category')
+    for value, _ in Product.CONDITION_CHOICES:
+        aggregates[f'condition_{value}'] = _count(Q(condition=value), selections, 'condition')
+    for key, _, low, high in PRICE_BUCKETS:
+        aggregates[f'price_{key}'] = _count(_price_condition(low, high), selections, 'price')
+
+    counts = queryset.order_by().aggregate(**aggregates)
+    return {
+        'total': counts['total'],
+        'categories': [
+            {'slug': category.slug, 'name': category.name, 'count': counts[f'category_{category.pk}']}
+            for category in categories
+        ],
+        'conditions': [
+            {'value': value, 'label': label, 'count': counts[f'condition_{value}']}
+            for value, label in Product.CONDITION_CHOICES
+        ],
+        'price_buckets': [
+            {'key': key, 'label': label, 'min': low, 'max': high, 'count': counts[f'price_{key}']}
+            for key, label, low, high in PRICE_BUCKETS
+        ],
+    }
+
+
+def get_facets(queryset, categories, params, selections=None):
+    """
+    Facet counts for ``queryset``, the products matching ``params`` (the
+    request's GET parameters) before ``selections`` are applied (see
+    compute_facets).
+    """
+    key = f'catalog:facets:{get_catalog_generation()}:{filter_signature(params)}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset, categories, selections)
+        cache.set(key, facets, FACET_TIMEOUT)
+    return facets
@@ -0,0 +1,175 @@
+"""
+Typo-tolerant product search.
+
+The words of available products' titles, brands and models form a
+vocabulary, and every word is posted under its character trigrams, padded
+as in PostgreSQL's pg_trgm so "samsung" gives "  s", " sa", "sam", ...
+"ng ". A misspelt query word is looked up by merging the posting lists of
+its own trigrams and scoring each candidate by trigram similarity (shared
+trigrams over distinct trigrams of both words). The work depends on the
+query's trigrams and the vocabulary, which grows far slower than the
+catalog, and never on the number of products.
+
+The search views fall back to these corrections when the exact query finds
+fewer than ``FALLBACK_THRESHOLD`` products; corrected words are searched as
+alternatives to what was typed. As with the other in-memory indexes, each
+process builds its own copy on first use and applies the product saves and
+deletes it commits (see products.signals).
+"""
+import threading
+from array import array
+from collections import Counter
+
+from .models import Product
+from .search import search, tokenize
+
+# Fewer exact matches than this triggers the fuzzy fallback
+FALLBACK_THRESHOLD = 5
+
+# Minimum trigram similarity for a correction, as pg_trgm's default is 0.3
+SIMILARITY_THRESHOLD = 0.4
+
+# Corrections searched per misspelt word
+CORRECTIONS = 2
+
+# Shorter words have too few trigrams to compare meaningfully
+MIN_WORD_LENGTH = 3
+
+# Product fields the vocabulary is built from
+PRODUCT_FIELDS = ('title', 'brand', 'model', 'status')
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def words(row):
+    return {
+        word
+        for field in ('title', 'brand', 'model')
+        for word in tokenize(row[field])
+        if len(word) >= MIN_WORD_LENGTH and not word.isdigit()
+    }
+
+
+class TrigramIndex:
+    def __init__(self):
+        self.ids = {}           # word -> word id
+        self.words = []         # word id -> word
+        self.counts = array('I')    # word id -> available products using it
+        self.sizes = array('H')     # word id -> number of distinct trigrams
+        self.postings = {}      # trigram -> array of word ids
+
+    @classmethod
+    def build(cls, rows):
+        index = cls()
+        for row in rows:
+            index.add(row)
+        return index
+
+    def __len__(self):
+        return sum(1 for count in self.counts if count)
+
+    def add_word(self, word):
+        word_id = self.ids.get(word)
+        if word_id is None:
+            word_id = self.ids[word] = len(self.words)
+            self.words.append(word)
+            self.counts.append(0)
+            grams = trigrams(word)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, array('I')).append(word_id)
+        self.counts[word_id] += 1
+
+    def add(self, row):
+        for word in words(row):
+            self.add_word(word)
+
+    def remove(self, row):
+        # Unused words keep their postings and are skipped by count
+        for word in words(row):
+            word_id = self.ids.get(word)
+            if word_id is not None and self.counts[word_id]:
+                self.counts[word_id] -= 1
+
+    def known(self, word):
+        word_id = self.ids.get(word)
+        return word_id is not None and self.counts[word_id] > 0
+
+    def similar(self, word, limit=CORRECTIONS, threshold=SIMILARITY_THRESHOLD):
+        """``[(word, similarity), ...]`` for the closest vocabulary words"""
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        scored = []
+        for word_id, common in shared.items():
+            if not self.counts[word_id]:
+                continue
+            similarity = common / (len(grams) + self.sizes[word_id] - common)
+            if similarity >= threshold:
+                scored.append((-similarity, -self.counts[word_id], self.words[word_id]))
+        scored.sort()
+        return [(candidate, -similarity) for similarity, _, candidate in scored[:limit]]
+
+    def corrections(self, query):
+        """``{token: [candidate, ...]}`` for the query words the vocabulary lacks"""
+        corrections = {}
+        for token in tokenize(query):
+            if len(token) < MIN_WORD_LENGTH or token.isdigit() or self.known(token):
+                continue
+            candidates = [candidate for candidate, _ in self.similar(token) if candidate != token]
+            if candidates:
+                corrections[token] = candidates
+        return corrections
+
+
+_index = None
+_index_lock = threading.RLock()
+
+
+def clear_index():
+    """Forget the in-memory index; the next lookup rebuilds it"""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = TrigramIndex.build(
+                Product.objects.filter(status='available').values(*PRODUCT_FIELDS).iterator(chunk_size=5000)
+            )
+        return _index
+
+
+def product_changed(old, new):
+    """Apply a committed product change, see products.autocomplete.product_changed"""
+    with _index_lock:
+        if _index is None:
+            return
+        if old is not None and old.get('status') == 'available':
+            _index.remove(old)
+        if new is not None and new.get('status') == 'available':
+            _index.add(new)
+
+
+def search_with_fallback(queryset, query):
+    """
+    ``search()`` that also accepts close spellings of unknown words when the
+    exact query finds too little. Returns the results and, if corrections
+    were used, the query as corrected for display.
+    """
+    results = search(queryset, query)
+    if results[:FALLBACK_THRESHOLD].count() >= FALLBACK_THRESHOLD:
+        return results, None
+    with _index_lock:
+        corrections = get_index().corrections(query)
+    if not corrections:
+        return results, None
+    corrected = ' '.join(corrections.get(token, [token])[0] for token in tokenize(query))
+    return search(queryset, query, alternatives=corrections), corrected
@@ -0,0 +1,116 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, RequestFactory, override_settings
+from rest_framework import serializers
+from rest_framework.request import Request
+
+from products.benchmarks import benchmark_database, format_timing, seed_catalog, time_call
+from products.models import Product, ProductImage
+from products.serializers import ImageSerializer, ProductSerializer, media_url
+from products.thumbnails import RENDITIONS
+
+
+class StockRepresentation:
+    """DRF's own per-field ``to_representation``, for comparison"""
+    to_representation = serializers.Serializer.to_representation
+
+
+class StockImageSerializer(StockRepresentation, ImageSerializer):
+    pass
+
+
+class StockProductSerializer(StockRepresentation, ProductSerializer):
+    primary_image = StockImageSerializer()
+
+
+def hand_built(products, request):
+    """The same payload built directly from model attributes"""
+    origin = request.build_absolute_uri('/')[:-1]
+
+    def image_dict(image):
+        storage = image.image.storage
+        return {
+            'id': image.pk,
+            'url': media_url(storage, image.image.name, origin),
+            'alt_text': image.alt_text,
+            'is_primary': image.is_primary,
+            'renditions': {
+                name: {'url': media_url(storage, entry['name'], origin), 'width': entry['width']}
+                for name, entry in image.renditions.items()
+            },
+        }
+
+    return [
+        {
+            'id': product.pk,
+            'title': product.title,
+            'slug': product.slug,
+            'price': str(product.price),
+            'original_price': None if product.original_price is None else str(product.original_price),
+            'condition': product.condition,
+            'brand': product.brand,
+            'model': product.model,
+            'city': product.city,
+            'state': product.state,
+            'category': product.category_id,
+            'created_at': product.created_at.isoformat().replace('+00:00', 'Z'),
+            'rating_average': product.rating_average,
+            'rating_count': product.rating_count,
+            'primary_image': image_dict(product.primary_image) if product.primary_image else None,
+        }
+        for product in products
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark catalog API serialization against hand-built dicts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=5000, help='Catalog size')
+        parser.add_argument('--page-size', type=int, default=1000, help='Products per serialized page')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per variant')
+
+    def handle(self, *args, **options):
+        with benchmark_database(), override_settings(DEBUG=False):
+            self.stdout.write(f'Seeding {options["size"]} products...')
+            seed_catalog(options['size'])
+            ProductImage.objects.bulk_create([
+                ProductImage(
+                    product_id=product_id, image=f'products/benchmark-{product_id}.jpg', is_primary=True,
+                    renditions={
+                        name: {'name': f'products/benchmark-{product_id}.{name}.jpg', 'width': width}
+                        for name, (width, _) in RENDITIONS.items()
+                    },
+                )
+                for product_id in Product.objects.values_list('pk', flat=True)
+            ], batch_size=5000)
+
+            page_size = options['page_size']
+            products = list(
+                Product.objects.filter(status='available').order_by('-created_at', '-id')
+                .with_primary_image()[:page_size]
+            )
+            request = Request(RequestFactory().get('/api/products/'))
+            context = {'request': request, 'fields': None}
+
+            fast = ProductSerializer(products, many=True, context=context).data
+            if StockProductSerializer(products, many=True, context=context).data != fast:
+                raise CommandError('Fast and stock representations differ')
+            if hand_built(products, request) != fast:
+                raise CommandError('Hand-built dicts differ from the serializer output')
+
+            variants = [
+                ('hand-built dicts', lambda: hand_built(products, request)),
+                ('ProductSerializer', lambda: ProductSerializer(products, many=True, context=context).data),
+                ('stock DRF fields', lambda: StockProductSerializer(products, many=True, context=context).data),
+            ]
+            self.stdout.write(f'Serializing {len(products)} products:')
+            for name, func in variants:
+                self.stdout.write(f'  {name:18} {format_timing(time_call(func, options["repeat"]))}')
+
+            client = Client()
+            endpoint = time_call(
+                lambda: client.get('/api/products/', {'page_size': page_size}), options['repeat']
+            )
+            self.stdout.write(f'  {"endpoint":18} {format_timing(endpoint)}')
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from products import autocomplete
+from products.benchmarks import benchmark_database, seed_catalog, time_call, format_timing
+
+
+class Command(BaseCommand):
+    help = 'Benchmark autocomplete index build time and suggestion latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000],
+                            help='Catalog sizes to benchmark')
+        parser.add_argument('--repeat', type=int, default=200, help='Timed runs per query')
+        parser.add_argument('--queries', nargs='+',
+                            default=['le', 'leat', 'vintage le', 'sa', 'samsung', 'kalo', 'elec', 'zzz'],
+                            help='Partial queries to time')
+
+    def handle(self, *args, **options):
+        with benchmark_database(), override_settings(DEBUG=False):
+            client = Client()
+            for size in sorted(options['sizes']):
+                self.stdout.write(f'\nSeeding {size} products...')
+                seed_catalog(size)
+
+                autocomplete.clear_index()
+                start = time.perf_counter()
+                index = autocomplete.get_index()
+                self.stdout.write(
+                    f'Built index in {time.perf_counter() - start:.2f} s: ' + ', '.join(
+                        f'{len(keys)} {kind} keys' for kind, keys in index.indexes.items()
+                    )
+                )
+
+                for query in options['queries']:
+                    lookup = time_call(lambda: autocomplete.suggest(query), options['repeat'])
+                    endpoint = time_call(
+                        lambda: client.get('/products/autocomplete/', {'q': query}), options['repeat']
+                    )
+                    self.stdout.write(f'  {query!r:14} lookup:   {format_timing(lookup)}')
+                    self.stdout.write(f'  {"":14} endpoint: {format_timing(endpoint)}')
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
@@ -0,0 +1,96 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test import Client, override_settings
+from products import counters
+from products.models import Product
+from products.benchmarks import benchmark_database, seed_catalog
+
+
+class DirectCounter:
+    """The naive alternative: one UPDATE per page view"""
+
+    def record(self, product_id):
+        counters.write_view_counts({product_id: 1})
+
+
+class Command(BaseCommand):
+    help = 'Benchmark product detail throughput with view counters off, buffered and written per hit'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10000, help='Catalog size')
+        parser.add_argument('--requests', type=int, default=2000, help='Detail page requests per mode')
+        parser.add_argument('--threads', type=int, default=1, help='Concurrent clients')
+        parser.add_argument('--pages', type=int, default=200,
+                            help='Distinct products the requests are spread over')
+
+    def handle(self, *args, **options):
+        # Flushes run inline so their cost lands in the timed requests
+        with benchmark_database(), override_settings(DEBUG=False, TASKS_EAGER=True):
+            self.stdout.write(f'Seeding {options["size"]} products...')
+            seed_catalog(options['size'])
+            slugs = list(Product.objects.filter(status='available').values_list(
+                'slug', flat=True)[:options['pages']])
+            rng = random.Random(42)
+            paths = [f'/products/{rng.choice(slugs)}/' for _ in range(options['requests'])]
+
+            modes = [
+                ('disabled', {'VIEW_COUNTERS_ENABLED': False}, counters.view_counter),
+                ('buffered', {'VIEW_COUNTERS_ENABLED': True}, counters.ViewCounterBuffer()),
+                ('per-hit UPDATE', {'VIEW_COUNTERS_ENABLED': True}, DirectCounter()),
+            ]
+            original = counters.view_counter
+            try:
+                for name, overrides, counter in modes:
+                    counters.view_counter = counter
+                    with override_settings(**overrides):
+                        self.run(paths[:20], 1)  # warm the page caches
+                        self.flush(counter)
+                        Product.objects.update(view_count=0)
+                        elapsed, failures = self.run(paths, options['threads'])
+                        self.flush(counter)
+                    recorded = sum(Product.objects.values_list('view_count', flat=True))
+                    self.stdout.write(
+                        f'  {name:15} {len(paths) / elapsed:8.1f} req/s  '
+                        f'{elapsed * 1000 / len(paths):6.2f} ms/req  '
+                        f'views recorded {recorded}  failed {failures}'
+                    )
+            finally:
+                counters.view_counter = original
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
+
+    @staticmethod
+    def flush(counter):
+        if isinstance(counter, counters.ViewCounterBuffer):
+            counter.flush()
+
+    def run(self, paths, threads):
+        """Request ``paths`` from ``threads`` clients; returns (seconds, failures)"""
+        chunks = [paths[i::threads] for i in range(max(1, threads))]
+        failures = []
+
+        def client(chunk):
+            browser = Client()
+            for path in chunk:
+                try:
+                    if browser.get(path).status_code != 200:
+                        failures.append(path)
+                except OperationalError:
+                    # SQLite gave up waiting for the write lock
+                    failures.append(path)
+            connection.close()
+
+        start = time.perf_counter()
+        if len(chunks) == 1:
+            client(chunks[0])
+        else:
+            workers = [threading.Thread(target=client, args=(chunk,)) for chunk in chunks]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        return time.perf_counter() - start, len(failures)
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from products.models import Product
+from products import fuzzy, search
+from products.benchmarks import benchmark_database, seed_catalog, time_call, format_timing
+
+
+class Command(BaseCommand):
+    help = 'Benchmark full-text product search against icontains filtering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000],
+                            help='Catalog sizes to benchmark')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query')
+        parser.add_argument('--queries', nargs='+',
+                            default=['leather', 'lapt', 'vintage camera', 'kalomi', 'brufenbru'],
+                            help='Search queries to time')
+        parser.add_argument('--typos', nargs='+', default=['samsng', 'addidas', 'lether jaket', 'kalomy'],
+                            help='Misspelt queries to time through the fuzzy fallback')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            if not search.fts_available():
+                self.stdout.write(self.style.WARNING(
+                    'FTS5 index is not available on this database; timing the fallback path only.'
+                ))
+
+            for size in sorted(options['sizes']):
+                self.stdout.write(f'\nSeeding {size} products...')
+                seed_catalog(size)
+                indexed = search.rebuild_index()
+                self.stdout.write(f'Indexed {indexed} available products')
+
+                available = Product.objects.filter(status='available')
+                for query in options['queries']:
+                    # A listing page fetches one page of rows and counts the matches
+                    icontains = time_call(
+                        lambda: self.page(self.icontains(available, query)), options['repeat']
+                    )
+                    fts = time_call(
+                        lambda: self.page(search.search(available, query)), options['repeat']
+                    )
+                    self.stdout.write(f'  {query!r:18} icontains: {format_timing(icontains)}')
+                    self.stdout.write(f'  {"":18} search:    {format_timing(fts)}')
+
+                fuzzy.clear_index()
+                index = fuzzy.get_index()
+                self.stdout.write(f'Trigram index holds {len(index)} words')
+                for query in options['typos']:
+                    lookup = time_call(lambda: index.corrections(query), options['repeat'])
+                    fallback = time_call(
+                        lambda: self.page(fuzzy.search_with_fallback(available, query)[0]), options['repeat']
+                    )
+                    self.stdout.write(f'  {query!r:18} corrections: {format_timing(lookup)}')
+                    self.stdout.write(f'  {"":18} fallback:    {format_timing(fallback)}')
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
+
+    @staticmethod
+    def page(queryset):
+        return list(queryset.values_list('id', flat=True)[:24]), queryset.count()
+
+    @staticmethod
+    def icontains(queryset, query):
+        """The original product_list search path"""
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(brand__icontains=query)
+        ).order_by('-created_at')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from products.cache import TRACKED_CACHES, lookup_stats, reset_lookup_stats
+
+
+class Command(BaseCommand):
+    help = ('Show hit/miss counters of the page and result caches '
+            '(needs a cache backend shared with the web processes)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Caches to report (default: {', '.join(TRACKED_CACHES)})")
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after reporting')
+
+    def handle(self, *args, **options):
+        names = options['names'] or TRACKED_CACHES
+        for name, stats in lookup_stats(names).items():
+            ratio = f"{stats['hit_ratio']:.1%}" if stats['hit_ratio'] is not None else 'n/a'
+            latency = ''.join(
+                f"  {label.replace('_ms', '')} {stats[label]:.2f} ms"
+                for label in ('hit_ms', 'miss_ms') if label in stats
+            )
+            self.stdout.write(
+                f"{name:16} hits: {stats['hits']:>8}  misses: {stats['misses']:>8}  hit ratio: {ratio}{latency}"
+            )
+        if options['reset']:
+            reset_lookup_stats(names)
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
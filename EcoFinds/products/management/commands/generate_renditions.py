@@ -0,0 +1,85 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from products.cache import bump_catalog_generation, bump_home_generation, bump_product_versions
+from products.models import ProductImage
+from products import thumbnails
+
+logger = logging.getLogger(__name__)
+
+
+def setup_worker():
+    django.setup()
+
+
+def render(pk, name):
+    """
+    Runs in a worker process; touches storage only, never the database. Any
+    error is returned rather than raised so one bad image fails alone.
+    """
+    try:
+        return pk, thumbnails.render_renditions(name), None
+    except Exception as e:
+        return pk, None, f'{type(e).__name__}: {e}'
+
+
+class Command(BaseCommand):
+    help = 'Generate resized renditions for existing product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate renditions that already exist')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Rows written per bulk update')
+
+    def handle(self, *args, **options):
+        fields = ('id', 'product_id', 'image', 'renditions', 'processing_state')
+        images = [
+            image for image in ProductImage.objects.only(*fields).order_by('id')
+            if options['force'] or not thumbnails.renditions_current(image)
+        ]
+        if not images:
+            self.stdout.write(self.style.SUCCESS('All product images already have renditions'))
+            return
+
+        self.stdout.write(f"Rendering {len(images)} images with {options['workers']} workers...")
+        by_pk = {image.pk: image for image in images}
+        done, failed = [], 0
+
+        # Forked workers must not inherit open database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=setup_worker) as pool:
+            futures = {pool.submit(render, image.pk, image.image.name): image.pk for image in images}
+            for future in as_completed(futures):
+                try:
+                    pk, renditions, error = future.result()
+                except Exception as e:
+                    # The worker itself failed, e.g. it was killed
+                    pk, renditions, error = futures[future], None, f'{type(e).__name__}: {e}'
+                if error:
+                    failed += 1
+                    logger.warning('Could not render %s: %s', by_pk[pk].image.name, error)
+                    self.stderr.write(f'{by_pk[pk].image.name}: {error}')
+                    continue
+                by_pk[pk].renditions = renditions
+                by_pk[pk].processing_state = ProductImage.READY
+                done.append(by_pk[pk])
+                if len(done) % options['batch_size'] == 0:
+                    ProductImage.objects.bulk_update(done[-options['batch_size']:], ['renditions', 'processing_state'])
+
+        remainder = len(done) % options['batch_size']
+        if remainder:
+            ProductImage.objects.bulk_update(done[-remainder:], ['renditions', 'processing_state'])
+        if done:
+            # The bulk updates send no signals; retire pages showing the old URLs
+            bump_product_versions({image.product_id for image in done})
+            bump_catalog_generation()
+            bump_home_generation()
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered {len(done)} images, {failed} failed'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from products import similarity
+
+
+class Command(BaseCommand):
+    help = 'Recompute related products for every available product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=similarity.TOP_K,
+                            help='Neighbours stored per product')
+
+    def handle(self, *args, **options):
+        count = similarity.rebuild(k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'Computed related products for {count} products'))
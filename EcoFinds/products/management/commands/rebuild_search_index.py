@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index'
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild_index()
+        if indexed is None:
+            self.stdout.write(self.style.WARNING('Full-text index is not available on this database'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} available products'))
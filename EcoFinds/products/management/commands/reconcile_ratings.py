@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from products.cache import bump_catalog_generation, bump_listing_generations, bump_product_versions
+from products.models import Product, ProductReview
+
+
+class Command(BaseCommand):
+    help = 'Recompute product review aggregates from the reviews table and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per bulk update')
+
+    def handle(self, *args, **options):
+        reviews = ProductReview.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        products = Product.objects.annotate(
+            actual_count=Coalesce(
+                Subquery(reviews.annotate(count=Count('id')).values('count'), output_field=IntegerField()), 0
+            ),
+            actual_sum=Coalesce(
+                Subquery(reviews.annotate(total=Sum('rating')).values('total'), output_field=IntegerField()), 0
+            ),
+        ).exclude(rating_count=F('actual_count'), rating_sum=F('actual_sum'))
+
+        drifted = []
+        for product in products.only('id', 'title', 'category_id', 'rating_count', 'rating_sum', 'rating_average').iterator():
+            self.stdout.write(
+                f'  {product.pk:>8} {product.title[:40]:40} '
+                f'count {product.rating_count} -> {product.actual_count}, '
+                f'sum {product.rating_sum} -> {product.actual_sum}'
+            )
+            product.rating_count = product.actual_count
+            product.rating_sum = product.actual_sum
+            product.rating_average = product.actual_sum / product.actual_count if product.actual_count else 0
+            drifted.append(product)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Rating aggregates are consistent'))
+            return
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} products have drifted (dry run, nothing changed)'))
+            return
+        Product.objects.bulk_update(
+            drifted, ['rating_count', 'rating_sum', 'rating_average'], batch_size=options['batch_size']
+        )
+        # As apply_rating_change does: listings sorted or filtered by rating
+        # and the products' pages show the new aggregates
+        bump_catalog_generation()
+        bump_listing_generations({product.category_id for product in drifted})
+        bump_product_versions([product.pk for product in drifted])
+        self.stdout.write(self.style.SUCCESS(f'Fixed {len(drifted)} drifted products'))
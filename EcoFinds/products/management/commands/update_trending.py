@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products import trending
+
+
+class Command(BaseCommand):
+    help = 'Decay product trending scores and add the events since the previous run (run periodically)'
+
+    def handle(self, *args, **options):
+        run = trending.update_scores()
+        if run is None:
+            self.stdout.write(self.style.WARNING('No time has passed since the previous run'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Trending scores updated with {run.events} new events'))
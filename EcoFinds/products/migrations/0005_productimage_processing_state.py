@@ -0,0 +1,26 @@
+# Generated by Django 5.0.2 on 2026-10-18 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0004_productimage_renditions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productimage",
+            name="processing_state",
+            field=models.CharField(
+                choices=[
+                    ("processing", "Processing"),
+                    ("ready", "Ready"),
+                    ("failed", "Failed"),
+                ],
+                default="ready",
+                max_length=20,
+            ),
+        ),
+    ]
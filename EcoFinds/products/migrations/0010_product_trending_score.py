@@ -0,0 +1,55 @@
+# Generated by Django 5.0.2 on 2026-10-18 04:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0009_product_view_count"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrendingRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ran_at", models.DateTimeField()),
+                ("events", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "get_latest_by": "ran_at",
+            },
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="trending_score",
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="trending_views_seen",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["status", "trending_score", "id"],
+                name="product_status_trending_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wishlist",
+            index=models.Index(fields=["created_at"], name="wishlist_created_idx"),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+FTS_TABLE = "products_product_fts"
+
+
+def create_fts_index(columns, weights):
+    def forwards(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        column_list = ", ".join(columns)
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"{column_list}, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) "
+            f"VALUES ('rank', 'bm25({weights})')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, {column_list}) "
+            f"SELECT id, {column_list} FROM products_product "
+            "WHERE status = 'available'"
+        )
+        # Without statistics SQLite expects status = 'available' to be
+        # selective and counts search matches by probing the FTS table once
+        # per available product instead of reading the matches directly
+        schema_editor.execute("ANALYZE")
+
+    return forwards
+
+
+class Migration(migrations.Migration):
+    """Index product model names alongside title, description and brand"""
+
+    dependencies = [
+        ("products", "0010_product_trending_score"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_fts_index(("title", "description", "brand", "model"), "10.0, 1.0, 5.0, 5.0"),
+            create_fts_index(("title", "description", "brand"), "10.0, 1.0, 5.0"),
+        ),
+        migrations.AddField(
+            model_name="productsearchdocument",
+            name="model",
+            field=models.TextField(),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.2 on 2026-10-18 05:40
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def stamp_unscored_views(apps, schema_editor):
+    """Views not yet folded into trending scores count as recent ones"""
+    Product = apps.get_model("products", "Product")
+    Product.objects.exclude(view_count=F("trending_views_seen")).update(
+        last_viewed_at=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0011_product_fts_model"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="last_viewed_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("trending_score__gt", 0)),
+                fields=["trending_score"],
+                name="product_trending_active_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["last_viewed_at"], name="product_last_viewed_idx"
+            ),
+        ),
+        migrations.RunPython(stamp_unscored_views, migrations.RunPython.noop),
+    ]
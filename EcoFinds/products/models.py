@@ -2,6 +2,11 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
+from django.db.models.functions import Cast
+from django.utils.functional import cached_property
+
+from . import tasks, thumbnails
+from .cache import bump_catalog_generation, bump_listing_generations, bump_product_versions
 
 
 class Category(models.Model):
@@ -20,6 +25,24 @@ class Category(models.Model):
         return self.name
 
 
+def display_images_prefetch(lookup='images'):
+    """
+    Prefetch a product's images, primary first, into ``display_images``.
+    ``lookup`` is the path to the images relation, e.g. 'product__images'.
+    """
+    return models.Prefetch(
+        lookup,
+        queryset=ProductImage.objects.displayable().order_by(*ProductImage.DISPLAY_ORDER),
+        to_attr='display_images',
+    )
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_primary_image(self):
+        """Load card images for all products in one extra query"""
+        return self.prefetch_related(display_images_prefetch())
+
+
 class Product(models.Model):
     CONDITION_CHOICES = [
         ('excellent', 'Excellent'),
@@ -65,8 +88,69 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     published_at = models.DateTimeField(blank=True, null=True)
 
+    # Review aggregates, kept current by add_review and signals (see
+    # apply_rating_change) and checked by the reconcile_ratings command
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(default=0, editable=False)
+
+    # Detail page views, written behind by products.counters, and when views
+    # were last added
+    view_count = models.PositiveIntegerField(default=0, editable=False)
+    last_viewed_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    # Time-decayed engagement, maintained by the update_trending command;
+    # trending_views_seen is the view_count already folded into the score
+    trending_score = models.FloatField(default=0, editable=False)
+    trending_views_seen = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    # Maintained with targeted UPDATEs; a plain save() of a loaded product
+    # must not write back stale copies
+    DERIVED_FIELDS = (
+        'rating_count', 'rating_sum', 'rating_average', 'view_count', 'last_viewed_at',
+        'trending_score', 'trending_views_seen',
+    )
+
+    # Fields whose changes derived catalog data reacts to (see signals)
+    TRACKED_FIELDS = (
+        'title', 'description', 'brand', 'model', 'category_id', 'condition', 'price',
+        'city', 'status', 'is_featured',
+    )
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Listing pages: available products, optionally by category,
+            # ordered by date or price with the id tie-breaker used by
+            # keyset pagination
+            models.Index(fields=['status', 'created_at', 'id'], name='product_status_created_idx'),
+            models.Index(fields=['status', 'price', 'id'], name='product_status_price_idx'),
+            models.Index(fields=['status', 'category', 'created_at', 'id'], name='product_category_created_idx'),
+            models.Index(fields=['status', 'category', 'price', 'id'], name='product_category_price_idx'),
+            models.Index(fields=['status', 'rating_average', 'rating_count', 'id'], name='product_status_rating_idx'),
+            models.Index(
+                fields=['status', 'category', 'rating_average', 'rating_count', 'id'],
+                name='product_category_rating_idx'
+            ),
+            models.Index(fields=['status', 'view_count', 'id'], name='product_status_views_idx'),
+            models.Index(fields=['status', 'category', 'view_count', 'id'], name='product_category_views_idx'),
+            # Home page trending block
+            models.Index(fields=['status', 'trending_score', 'id'], name='product_status_trending_idx'),
+            # update_trending: scores left to decay, and products viewed
+            # since the previous run
+            models.Index(
+                fields=['trending_score'], name='product_trending_active_idx',
+                condition=models.Q(trending_score__gt=0)
+            ),
+            models.Index(fields=['last_viewed_at'], name='product_last_viewed_idx'),
+            # Home page featured block
+            models.Index(
+                fields=['created_at', 'id'], name='product_featured_idx',
+                condition=models.Q(status='available', is_featured=True)
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -74,8 +158,42 @@ class Product(models.Model):
     def save(self, *args, **kwargs):
         if self.status == 'available' and not self.published_at:
             self.published_at = timezone.now()
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
         super().save(*args, **kwargs)
+        self._loaded_values = self._tracked_values()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._tracked_values()
+        return instance
+
+    def _tracked_values(self):
+        deferred = self.get_deferred_fields()
+        return {name: getattr(self, name) for name in self.TRACKED_FIELDS if name not in deferred}
+
+    def changed_fields(self):
+        """
+        Tracked fields whose value differs from the last load or save; every
+        tracked field for a product that has not been saved yet. Inside
+        post_save handlers this reports what that save changed.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return set(self.TRACKED_FIELDS)
+        return {name for name, value in self._tracked_values().items() if loaded.get(name) != value}
     
+    @cached_property
+    def primary_image(self):
+        """The image shown on product cards: the primary one, else the oldest"""
+        if hasattr(self, 'display_images'):
+            return self.display_images[0] if self.display_images else None
+        return self.images.displayable().order_by(*ProductImage.DISPLAY_ORDER).first()
+
     @property
     def get_discount_percentage(self):
         """Calculate discount percentage if original price is available"""
@@ -84,13 +202,36 @@ class Product(models.Model):
         return 0
 
 
+class ProductImageQuerySet(models.QuerySet):
+    def displayable(self):
+        """Images that can be shown: processed or still processing, not rejected"""
+        return self.exclude(processing_state=ProductImage.FAILED)
+
+
 class ProductImage(models.Model):
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    PROCESSING_STATE_CHOICES = [
+        (PROCESSING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/')
     alt_text = models.CharField(max_length=200, blank=True)
     is_primary = models.BooleanField(default=False)
+    # Resized copies of the image, see products.thumbnails.RENDITIONS
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+    processing_state = models.CharField(max_length=20, choices=PROCESSING_STATE_CHOICES, default=READY)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ProductImageQuerySet.as_manager()
+
+    # Order in which images are presented: primary first, then by upload
+    DISPLAY_ORDER = ('-is_primary', 'created_at', 'id')
+
     class Meta:
         ordering = ['is_primary', 'created_at']
 
@@ -101,7 +242,43 @@ class ProductImage(models.Model):
         if self.is_primary:
             # Ensure only one primary image per product
             ProductImage.objects.filter(product=self.product, is_primary=True).exclude(id=self.id).update(is_primary=False)
+        needs_processing = bool(self.image) and not thumbnails.renditions_current(self)
+        if needs_processing:
+            self.processing_state = self.PROCESSING
         super().save(*args, **kwargs)
+        if needs_processing:
+            tasks.enqueue(tasks.process_image, self.pk)
+
+    def rendition_url(self, rendition):
+        """URL of a rendition, falling back to the original upload"""
+        entry = self.renditions.get(rendition)
+        if entry:
+            return self.image.storage.url(entry['name'])
+        return self.image.url
+
+
+def apply_rating_change(product_id, count_delta, sum_delta):
+    """
+    Adjust a product's review aggregates in a single UPDATE. The new average
+    is computed from the same pre-update column values, so concurrent
+    reviews cannot interleave between reading and writing them.
+    """
+    count = models.F('rating_count') + count_delta
+    total = models.F('rating_sum') + sum_delta
+    Product.objects.filter(pk=product_id).update(
+        rating_count=count,
+        rating_sum=total,
+        rating_average=models.Case(
+            models.When(rating_count=-count_delta, then=models.Value(0.0)),
+            default=Cast(total, models.FloatField()) / Cast(count, models.FloatField()),
+            output_field=models.FloatField(),
+        ),
+    )
+    # Rating sorts, filters and the product's page change; UPDATEs bypass
+    # the Product signals
+    bump_catalog_generation()
+    bump_listing_generations(Product.objects.filter(pk=product_id).values_list('category_id', flat=True))
+    bump_product_versions([product_id])
 
 
 class ProductReview(models.Model):
@@ -124,6 +301,10 @@ class ProductReview(models.Model):
     class Meta:
         unique_together = ['product', 'user']
         ordering = ['-created_at']
+        indexes = [
+            # Review feed pages, newest first
+            models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.product.title} ({self.rating} stars)"
@@ -137,6 +318,74 @@ class Wishlist(models.Model):
     class Meta:
         unique_together = ['user', 'product']
         ordering = ['-created_at']
+        indexes = [
+            # Trending runs read only the adds since the previous run
+            models.Index(fields=['created_at'], name='wishlist_created_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.product.title}"
\ No newline at end of file
+        return f"{self.user.username} - {self.product.title}"
+
+
+class RelatedProduct(models.Model):
+    """Precomputed nearest neighbours of a product (see products.similarity)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_to')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        unique_together = ['product', 'rank']
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.3f})"
+
+
+class TrendingRun(models.Model):
+    """One run of the update_trending command; the next run starts where it ended"""
+    ran_at = models.DateTimeField()
+    events = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        get_latest_by = 'ran_at'
+
+    def __str__(self):
+        return f"Trending run at {self.ran_at}"
+
+
+class FullTextField(models.TextField):
+    """FTS5 hidden column named after its table, queried with ``__match``"""
+
+
+@FullTextField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class ProductSearchDocument(models.Model):
+    """
+    Read-only view of the SQLite FTS5 product index (see products.search).
+
+    The table is created by a migration only on SQLite and maintained by
+    signal handlers, so Django never manages it.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='rowid', db_constraint=False, related_name='search_document'
+    )
+    title = models.TextField()
+    description = models.TextField()
+    brand = models.TextField()
+    model = models.TextField()
+    document = FullTextField(db_column='products_product_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'products_product_fts'
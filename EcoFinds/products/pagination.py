@@ -0,0 +1,235 @@
+"""
+Keyset (cursor) pagination for catalog listings.
+
+Pages are addressed by the sort key of the last row seen instead of an
+OFFSET, so every page costs one indexed range scan of ``per_page + 1`` rows
+no matter how deep the user scrolls. Cursors are opaque URL-safe strings.
+"""
+import base64
+import binascii
+import json
+import math
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import DecimalField, Q
+from django.db.models.functions import Cast
+
+PER_PAGE = 24
+
+# Sort option -> ordering; the trailing id makes every ordering total
+SORT_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', '-id'),
+    'rating': ('-rating_average', '-rating_count', '-id'),
+    'popular': ('-view_count', '-id'),
+    'relevance': ('search_rank', 'id'),
+}
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def filter_price_range(queryset, min_price, max_price, sort):
+    """
+    Apply price bounds in a way that keeps the sort index usable.
+
+    When the listing is not sorted by price, the bounds are compared against
+    a cast of the column to its own decimal type, which no index covers. The
+    planner then walks the index for the requested order and stops after one
+    page, instead of collecting the entire price range from the price index
+    and sorting it. The comparison stays exact either way.
+    """
+    if not (min_price or max_price):
+        return queryset
+    price = 'price'
+    if not sort.startswith('price'):
+        field = queryset.model._meta.get_field('price')
+        queryset = queryset.alias(unindexed_price=Cast('price', DecimalField(
+            max_digits=field.max_digits, decimal_places=field.decimal_places
+        )))
+        price = 'unindexed_price'
+    if min_price:
+        queryset = queryset.filter(**{f'{price}__gte': min_price})
+    if max_price:
+        queryset = queryset.filter(**{f'{price}__lte': max_price})
+    return queryset
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, [str(value) for value in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(direction, values)`` or None for a missing or malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+def cursor_values(model, ordering, values):
+    """
+    Cursor values converted to the types of the ordering's fields, or None
+    if any does not convert, e.g. in a forged or outdated cursor.
+    Annotations such as ``search_rank`` are floats.
+    """
+    if len(values) != len(ordering):
+        return None
+    converted = []
+    for field, value in zip(ordering, values):
+        try:
+            to_python = model._meta.get_field(field.lstrip('-')).to_python
+        except FieldDoesNotExist:
+            to_python = float
+        try:
+            value = to_python(value)
+        except (ValidationError, ValueError, TypeError, ArithmeticError):
+            return None
+        if value is None or isinstance(value, float) and not math.isfinite(value):
+            return None
+        if hasattr(value, 'is_finite') and not value.is_finite():
+            return None
+        converted.append(value)
+    return converted
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """
+    Build the "rows after this key" condition for an ordering, e.g. for
+    ``('-created_at', '-id')``:
+
+        created_at <= v0 AND (created_at < v0 OR id < v1)
+
+    The leading inclusive bound lets the database seek straight to the
+    cursor in an index on the sort columns instead of filtering from the
+    start of the range.
+    """
+    fields = [
+        (field.lstrip('-'), 'lt' if field.startswith('-') != reverse else 'gt')
+        for field in ordering
+    ]
+    condition = Q()
+    for (name, lookup), value in reversed(list(zip(fields, values))):
+        strictly_after = Q(**{f'{name}__{lookup}': value})
+        if condition:
+            strictly_after |= Q(**{name: value}) & condition
+        condition = strictly_after
+    (first_name, first_lookup), first_value = fields[0], values[0]
+    return Q(**{f'{first_name}__{first_lookup}e': first_value}) & condition
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+class KeysetPage:
+    """One page of results plus the cursors that lead away from it"""
+
+    def __init__(self, object_list, ordering, has_next, has_previous):
+        self.object_list = object_list
+        self.ordering = ordering
+        # Cursors are taken from the rows shown, so an empty page has none
+        self.has_next = has_next and bool(object_list)
+        self.has_previous = has_previous and bool(object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def _key(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        return encode_cursor(NEXT, self._key(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous:
+            return None
+        return encode_cursor(PREVIOUS, self._key(self.object_list[0]))
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, ordering, per_page=PER_PAGE):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+
+    def parse_cursor(self, cursor):
+        """``(direction, values)`` for a valid cursor of this ordering, else None"""
+        decoded = decode_cursor(cursor)
+        if decoded is None:
+            return None
+        direction, values = decoded
+        values = cursor_values(self.queryset.model, self.ordering, values)
+        return None if values is None else (direction, values)
+
+    def page(self, cursor=None):
+        """The page ``cursor`` leads to; the first page if it is missing or invalid"""
+        decoded = self.parse_cursor(cursor)
+        if decoded is None:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            return KeysetPage(rows[:self.per_page], self.ordering,
+                              has_next=len(rows) > self.per_page, has_previous=False)
+
+        direction, values = decoded
+        if direction == NEXT:
+            rows = list(
+                self.queryset.filter(keyset_filter(self.ordering, values))
+                .order_by(*self.ordering)[:self.per_page + 1]
+            )
+            return KeysetPage(rows[:self.per_page], self.ordering,
+                              has_next=len(rows) > self.per_page, has_previous=True)
+
+        # Walk backwards from the cursor, then restore display order
+        rows = list(
+            self.queryset.filter(keyset_filter(self.ordering, values, reverse=True))
+            .order_by(*reverse_ordering(self.ordering))[:self.per_page + 1]
+        )
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return KeysetPage(rows, self.ordering, has_next=True, has_previous=has_previous)
+
+
+def paginate(request, queryset, sort, per_page=PER_PAGE):
+    """
+    Paginate ``queryset`` by the given sort option using ``?cursor=``.
+
+    The returned page carries ``next_query``/``previous_query`` strings: the
+    current query string with the cursor swapped, ready to append after "?".
+    """
+    ordering = SORT_ORDERINGS.get(sort, SORT_ORDERINGS['newest'])
+    page = KeysetPaginator(queryset, ordering, per_page).page(request.GET.get('cursor'))
+    return add_page_queries(request, page)
+
+
+def add_page_queries(request, page):
+    """Set ``next_query``/``previous_query`` on a page of this request's listing"""
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    page.next_query = page.previous_query = None
+    if page.has_next:
+        params['cursor'] = page.next_cursor
+        page.next_query = params.urlencode()
+    if page.has_previous:
+        params['cursor'] = page.previous_cursor
+        page.previous_query = params.urlencode()
+    return page
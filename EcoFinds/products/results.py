@@ -0,0 +1,98 @@
+"""
+Cached listing results.
+
+Most listing traffic repeats a few filter combinations, so the ordered ids
+of their first ``CACHED_PAGES`` pages are cached under the filter signature
+(see products.facets) and sort. Serving a page from the cache costs one
+``id__in`` query for the rows shown; deeper pages, and cursors that point
+outside the cached ids, go to the database as before.
+
+Keys embed the listing generation of the filtered category, or the
+all-categories one, which product changes bump for the categories they
+touch (see products.signals). Ordering by derived values that change
+without a save - view counts and trending scores - may lag by up to
+``RESULT_TIMEOUT``.
+"""
+import time
+
+from django.core.cache import cache
+
+from .cache import get_listing_generation, record_lookup
+from .facets import filter_signature
+from .pagination import (
+    NEXT, PER_PAGE, SORT_ORDERINGS, KeysetPage, KeysetPaginator, add_page_queries, decode_cursor,
+)
+
+CACHED_PAGES = 3
+
+RESULT_TIMEOUT = 60 * 5
+
+
+def result_key(params, sort, category_id=None):
+    generation = get_listing_generation(category_id)
+    return f'listing:results:{generation}:{sort}:{filter_signature(params)}'
+
+
+def cached_ids(queryset, ordering, key, per_page):
+    """``(ids, truncated)`` for the first pages of a listing, from the cache if present"""
+    entry = cache.get(key)
+    if entry is not None:
+        return entry, True
+    limit = CACHED_PAGES * per_page
+    ids = list(queryset.order_by(*ordering).values_list('pk', flat=True)[:limit + 1])
+    entry = (ids[:limit], len(ids) > limit)
+    cache.set(key, entry, RESULT_TIMEOUT)
+    return entry, False
+
+
+def page_bounds(ids, truncated, cursor, per_page):
+    """
+    The slice of ``ids`` a cursor selects, or None if it leads past them or
+    selects nothing, which leaves the page to the database
+    """
+    decoded = decode_cursor(cursor)
+    if decoded is None:
+        return 0, per_page
+    direction, values = decoded
+    try:
+        position = ids.index(int(values[-1]))
+    except (ValueError, TypeError, IndexError):
+        return None
+    if direction == NEXT:
+        start = position + 1
+        if start + per_page > len(ids) and truncated:
+            return None
+        end = start + per_page
+    else:
+        start, end = max(0, position - per_page), position
+    return (start, end) if start < min(end, len(ids)) else None
+
+
+def paginate_cached(request, queryset, sort, category_id=None, per_page=PER_PAGE, params=None):
+    """
+    ``paginate()`` through the result cache. ``queryset`` must be the product
+    listing filtered according to ``params`` (by default ``request.GET``),
+    restricted to ``category_id`` when one is given, and must not be a
+    search. Cached pages are loaded through ``queryset``, so they get the
+    same columns and prefetches as pages read from the database.
+    """
+    started = time.perf_counter()
+    ordering = SORT_ORDERINGS.get(sort, SORT_ORDERINGS['newest'])
+    if params is None:
+        params = request.GET
+    (ids, truncated), hit = cached_ids(
+        queryset, ordering, result_key(params, sort, category_id), per_page
+    )
+    bounds = page_bounds(ids, truncated, request.GET.get('cursor'), per_page)
+    if bounds is None:
+        page = KeysetPaginator(queryset, ordering, per_page).page(request.GET.get('cursor'))
+    else:
+        start, end = bounds
+        page_ids = ids[start:end]
+        products = queryset.order_by().in_bulk(page_ids)
+        page = KeysetPage(
+            [products[pk] for pk in page_ids if pk in products], ordering,
+            has_next=end < len(ids) or truncated, has_previous=start > 0,
+        )
+    record_lookup('listing_results', hit and bounds is not None, time.perf_counter() - started)
+    return add_page_queries(request, page)
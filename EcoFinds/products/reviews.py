@@ -0,0 +1,54 @@
+"""
+Review listings for product pages.
+
+Reviews are served a page at a time, newest first, with keyset cursors
+(see products.pagination); the detail page renders the first page and the
+JSON feed supplies the rest on demand.
+"""
+from django.db.models import Count, Q
+
+from .models import ProductReview
+from .pagination import KeysetPaginator
+
+REVIEWS_PER_PAGE = 6
+
+REVIEW_ORDERING = ('-created_at', '-id')
+
+
+def review_paginator(product_id, per_page=REVIEWS_PER_PAGE):
+    reviews = ProductReview.objects.filter(product_id=product_id).select_related('user')
+    return KeysetPaginator(reviews, REVIEW_ORDERING, per_page)
+
+
+def review_page(product_id, cursor=None, per_page=REVIEWS_PER_PAGE):
+    """The page ``cursor`` leads to; the first page if it is missing or invalid"""
+    return review_paginator(product_id, per_page).page(cursor)
+
+
+def rating_histogram(product_id):
+    """Review counts per star rating, five stars first, from one aggregate"""
+    counts = ProductReview.objects.filter(product_id=product_id).aggregate(**{
+        f'stars_{rating}': Count('pk', filter=Q(rating=rating))
+        for rating, _ in ProductReview.RATING_CHOICES
+    })
+    total = sum(counts.values())
+    return [
+        {
+            'rating': rating,
+            'count': counts[f'stars_{rating}'],
+            'percent': round(100 * counts[f'stars_{rating}'] / total) if total else 0,
+        }
+        for rating, _ in reversed(ProductReview.RATING_CHOICES)
+    ]
+
+
+def serialize_review(review):
+    return {
+        'id': review.pk,
+        'author': review.user.get_full_name() or review.user.username,
+        'rating': review.rating,
+        'title': review.title,
+        'comment': review.comment,
+        'created_at': review.created_at.isoformat(),
+        'created_display': review.created_at.strftime('%b %d, %Y'),
+    }
@@ -0,0 +1,129 @@
+"""
+Full-text search engine for products.
+
+On SQLite the searchable catalog lives in an FTS5 virtual table whose rowid
+mirrors ``Product.id`` (exposed read-only as ``ProductSearchDocument``). Only
+available products are indexed, results are ranked with BM25 weighted
+towards title, brand and model, and every query term is matched as a prefix, so
+"iph" finds "iPhone". Other database backends fall back to ``icontains``.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+
+FTS_TABLE = 'products_product_fts'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Per-database cache of whether the FTS table exists
+_fts_ready = {}
+
+
+def tokenize(query):
+    """Split a search query into lowercase word tokens"""
+    return TOKEN_RE.findall((query or '').lower())
+
+
+def fts_available():
+    """Return True when the FTS5 index table exists on the default database"""
+    name = str(connection.settings_dict['NAME'])
+    if name not in _fts_ready:
+        _fts_ready[name] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_ready[name]
+
+
+def build_match_expression(tokens, alternatives=None):
+    """
+    Build an FTS5 MATCH expression requiring every token as a prefix, or
+    one of the token's ``alternatives`` in its place
+    """
+    alternatives = alternatives or {}
+    terms = []
+    for token in tokens:
+        options = [token, *alternatives.get(token, ())]
+        term = ' OR '.join(f'"{option}"*' for option in options)
+        terms.append(f'({term})' if len(options) > 1 else term)
+    return ' AND '.join(terms)
+
+
+def search(queryset, query, alternatives=None):
+    """
+    Restrict a Product queryset to matches for ``query``. ``alternatives``
+    maps query tokens to other words accepted in their place (see
+    products.fuzzy).
+
+    The result is annotated with ``search_rank`` (lower is a better match)
+    and ordered by it; callers that want another sort can simply re-order.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset
+
+    if not fts_available():
+        condition = Q()
+        for token in tokens:
+            token_condition = Q()
+            for option in [token, *(alternatives or {}).get(token, ())]:
+                token_condition |= (
+                    Q(title__icontains=option) |
+                    Q(description__icontains=option) |
+                    Q(brand__icontains=option) |
+                    Q(model__icontains=option)
+                )
+            condition &= token_condition
+        return queryset.filter(condition).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        ).order_by('search_rank', '-created_at')
+
+    return queryset.filter(
+        search_document__document__match=build_match_expression(tokens, alternatives)
+    ).annotate(search_rank=F('search_document__rank')).order_by('search_rank')
+
+
+def index_product(product):
+    """Insert or refresh a product's index row; unavailable products are dropped"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product.pk])
+        if product.status == 'available':
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, title, description, brand, model) VALUES (%s, %s, %s, %s, %s)",
+                [product.pk, product.title, product.description, product.brand, product.model],
+            )
+
+
+def unindex_product(product_id):
+    """Remove a product from the index"""
+    unindex_products([product_id])
+
+
+def unindex_products(product_ids):
+    """Remove several products from the index with one statement"""
+    if not fts_available() or not product_ids:
+        return
+    placeholders = ', '.join('%s' for _ in product_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", list(product_ids))
+
+
+def rebuild_index():
+    """
+    Re-populate the whole index from the products table.
+
+    Returns the number of indexed products, or None without FTS support.
+    """
+    if not fts_available():
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, title, description, brand, model) "
+            "SELECT id, title, description, brand, model FROM products_product WHERE status = 'available'"
+        )
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
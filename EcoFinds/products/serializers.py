@@ -0,0 +1,141 @@
+"""
+Serializers for the read-only catalog API (see products.api).
+
+List pages can hold up to a thousand products, so rows are not rendered
+through the generic ``Serializer.to_representation``, which looks up each
+field's source and checks for skipped fields once per row and field.
+Instead the readable fields are resolved once per serializer and every
+row is read through that list (see ``FastRepresentationMixin``). Fields
+are still declared the usual way, and ``?fields=`` narrows them.
+"""
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from django.utils.functional import cached_property
+from rest_framework import serializers
+
+from .models import Category, Product, ProductImage, ProductReview
+
+
+def media_url(storage, name, origin=''):
+    """Absolute URL of a stored file, given the request's scheme and host"""
+    if isinstance(storage, FileSystemStorage):
+        # What FileSystemStorage.url() returns, without a urljoin per call
+        url = storage.base_url + filepath_to_uri(name).lstrip('/')
+    else:
+        url = storage.url(name)
+    return origin + url if url.startswith('/') else url
+
+
+class FastRepresentationMixin:
+    """
+    ``to_representation`` for read-only serializers whose fields read
+    attributes (or the whole object, for ``source='*'`` and method fields).
+    None is passed through without calling the field, as DRF does.
+    """
+
+    @property
+    def _representers(self):
+        representers = getattr(self, '_cached_representers', None)
+        if representers is None:
+            representers = self._cached_representers = [
+                (field.field_name, field.source_attrs, field.to_representation)
+                for field in self._readable_fields
+            ]
+        return representers
+
+    def to_representation(self, instance):
+        data = {}
+        for name, source_attrs, represent in self._representers:
+            value = instance
+            for attr in source_attrs:
+                value = getattr(value, attr)
+                if value is None:
+                    break
+            data[name] = None if value is None else represent(value)
+        return data
+
+
+class SparseFieldsMixin:
+    """
+    Drop every field not named in the ``fields`` context entry, a set of
+    field names parsed from ``?fields=`` by the view
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        wanted = self.context.get('fields')
+        if wanted:
+            for name in set(self.fields) - set(wanted):
+                self.fields.pop(name)
+
+
+class ImageSerializer(FastRepresentationMixin, serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    renditions = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductImage
+        fields = ['id', 'url', 'alt_text', 'is_primary', 'renditions']
+
+    @cached_property
+    def origin(self):
+        """Scheme and host prepended to media URLs, resolved once per serializer"""
+        request = self.context.get('request')
+        return request.build_absolute_uri('/')[:-1] if request is not None else ''
+
+    def get_url(self, image):
+        return media_url(image.image.storage, image.image.name, self.origin)
+
+    def get_renditions(self, image):
+        storage = image.image.storage
+        return {
+            name: {'url': media_url(storage, entry['name'], self.origin), 'width': entry['width']}
+            for name, entry in image.renditions.items()
+        }
+
+
+class CategorySerializer(FastRepresentationMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'slug', 'description']
+
+
+class ProductSerializer(SparseFieldsMixin, FastRepresentationMixin, serializers.ModelSerializer):
+    """A product card: what list pages show, plus its rating aggregates"""
+    category = serializers.IntegerField(source='category_id')
+    primary_image = ImageSerializer()
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'title', 'slug', 'price', 'original_price', 'condition', 'brand', 'model',
+            'city', 'state', 'category', 'created_at', 'rating_average', 'rating_count',
+            'primary_image',
+        ]
+
+    # Columns each field reads; ``primary_image`` comes from a prefetch
+    COLUMNS = {'category': 'category_id', 'primary_image': None}
+
+    @classmethod
+    def columns(cls, fields=None):
+        """Product columns to load for ``fields`` (default: all of them)"""
+        names = fields or cls.Meta.fields
+        columns = [cls.COLUMNS.get(name, name) for name in names if name in cls.Meta.fields]
+        return [column for column in columns if column is not None]
+
+
+class ProductDetailSerializer(ProductSerializer):
+    category = CategorySerializer()
+    seller = serializers.CharField(source='seller.username')
+    images = ImageSerializer(source='display_images', many=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['description', 'year_purchased', 'seller', 'images']
+
+
+class ReviewSerializer(FastRepresentationMixin, serializers.ModelSerializer):
+    author = serializers.CharField(source='user.username')
+
+    class Meta:
+        model = ProductReview
+        fields = ['id', 'author', 'rating', 'title', 'comment', 'created_at']
@@ -0,0 +1,211 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.db import transaction
+from django.dispatch import receiver
+from .models import Category, Product, ProductImage, ProductReview, RelatedProduct, apply_rating_change
+from .cache import (
+    bump_catalog_generation, bump_home_generation, bump_listing_generations, bump_product_versions,
+)
+from . import autocomplete, fuzzy, search, similarity, tasks
+
+# Product fields shown on home page cards
+HOME_CARD_FIELDS = {'title', 'slug', 'description', 'price', 'condition'}
+
+# Product fields that feed the similarity vectors
+SIMILARITY_FIELDS = {'title', 'description', 'brand', 'category_id', 'condition', 'price', 'city', 'status'}
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, **kwargs):
+    """Keep the full-text index in sync with product saves"""
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.unindex_product(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def update_related_products(sender, instance, **kwargs):
+    """Recompute related products when a product is listed, edited or sold"""
+    changed = instance.changed_fields()
+    if not changed & SIMILARITY_FIELDS:
+        return
+    if instance.status == 'available':
+        tasks.enqueue(similarity.product_listed, instance.pk)
+    elif 'status' in changed:
+        tasks.enqueue(similarity.product_removed, instance.pk)
+
+
+# In-memory lookup indexes kept by each process; each names the product
+# fields it is built from and applies committed changes itself
+MEMORY_INDEXES = (autocomplete, fuzzy)
+
+
+def indexed_values(index, values):
+    """Field values ``index`` was built from, if all are known"""
+    if values is None or not set(index.PRODUCT_FIELDS) <= values.keys():
+        return None
+    return {name: values[name] for name in index.PRODUCT_FIELDS}
+
+
+@receiver(post_save, sender=Product)
+def update_memory_indexes(sender, instance, created, **kwargs):
+    changed = instance.changed_fields()
+    for index in MEMORY_INDEXES:
+        if not changed & set(index.PRODUCT_FIELDS):
+            continue
+        old = None if created else indexed_values(index, getattr(instance, '_loaded_values', None))
+        if old is None and not created:
+            # Loaded with deferred fields: what to take out is unknown
+            transaction.on_commit(index.clear_index)
+            continue
+        new = {name: getattr(instance, name) for name in index.PRODUCT_FIELDS}
+        transaction.on_commit(lambda index=index, old=old, new=new: index.product_changed(old, new))
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_memory_indexes(sender, instance, **kwargs):
+    for index in MEMORY_INDEXES:
+        old = indexed_values(index, getattr(instance, '_loaded_values', None)) or {
+            name: getattr(instance, name) for name in index.PRODUCT_FIELDS
+        }
+        transaction.on_commit(lambda index=index, old=old: index.product_changed(old, None))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def reload_autocomplete(sender, **kwargs):
+    # Renames are rare; rebuilding beats tracking names per product
+    transaction.on_commit(autocomplete.clear_index)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_related_lists(sender, instance, **kwargs):
+    # The cascade removes these rows before post_delete runs
+    instance._related_lists = list(
+        RelatedProduct.objects.filter(related=instance).values_list('product_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_related_products(sender, instance, **kwargs):
+    tasks.enqueue(similarity.product_removed, instance.pk, getattr(instance, '_related_lists', []))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_caches(sender, **kwargs):
+    """Retire every cached result derived from the catalog"""
+    bump_catalog_generation()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_listing_results(sender, instance, **kwargs):
+    """Retire cached listings of the categories a product left or is in"""
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    bump_listing_generations({instance.category_id, loaded.get('category_id', instance.category_id)})
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_listings(sender, instance, **kwargs):
+    bump_listing_generations([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_pages(sender, instance, **kwargs):
+    """
+    Retire cached detail pages showing the product: its own, and those
+    listing it among their related products
+    """
+    product_id = instance.pk if sender is Product else instance.product_id
+    bump_product_versions([
+        product_id,
+        *RelatedProduct.objects.filter(related_id=product_id).values_list('product_id', flat=True),
+    ])
+
+
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def invalidate_reviewed_product_page(sender, instance, **kwargs):
+    bump_product_versions([instance.product_id])
+
+
+@receiver(post_save, sender=Product)
+def refresh_home_blocks(sender, instance, **kwargs):
+    """
+    Rebuild the home page when a product is published, featured or
+    unfeatured, sold or withdrawn, or a listed product's card changes
+    """
+    changed = instance.changed_fields()
+    if changed & {'status', 'is_featured'} or (instance.status == 'available' and changed & HOME_CARD_FIELDS):
+        bump_home_generation()
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def retire_home_blocks(sender, **kwargs):
+    bump_home_generation()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def refresh_card_images(sender, instance, **kwargs):
+    """
+    Cards show a product's primary image; processing, which updates images
+    without signals, bumps the same generations (see products.tasks)
+    """
+    bump_catalog_generation()
+    bump_home_generation()
+
+
+@receiver(post_save, sender=ProductReview)
+def add_to_rating_aggregates(sender, instance, created, **kwargs):
+    """
+    Count new reviews in, however they are created. Rating changes to an
+    existing review are applied by whoever makes them (see add_review).
+    """
+    if created:
+        product_id, rating = instance.product_id, instance.rating
+        transaction.on_commit(lambda: apply_rating_change(product_id, 1, rating))
+
+
+@receiver(post_delete, sender=ProductReview)
+def remove_from_rating_aggregates(sender, instance, **kwargs):
+    """Count deleted reviews out, after the creates committed before them"""
+    product_id, rating = instance.product_id, instance.rating
+    transaction.on_commit(lambda: apply_rating_change(product_id, -1, -rating))
+
+
+def products_sold(products):
+    """
+    Do what saving each product as sold would, for ``products`` (as loaded
+    before the change) marked sold by one bulk UPDATE, which sends no
+    post_save signals
+    """
+    if not products:
+        return
+    product_ids = [product.pk for product in products]
+    search.unindex_products(product_ids)
+    for product in products:
+        tasks.enqueue(similarity.product_removed, product.pk)
+        for index in MEMORY_INDEXES:
+            old = {name: getattr(product, name) for name in index.PRODUCT_FIELDS}
+            new = {**old, 'status': 'sold'}
+            transaction.on_commit(lambda index=index, old=old, new=new: index.product_changed(old, new))
+
+    bump_catalog_generation()
+    bump_listing_generations({product.category_id for product in products})
+    bump_product_versions([
+        *product_ids,
+        *RelatedProduct.objects.filter(related_id__in=product_ids).values_list('product_id', flat=True),
+    ])
+    bump_home_generation()
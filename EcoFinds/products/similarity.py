@@ -0,0 +1,470 @@
+"""
+Content-based "related products".
+
+Every available product is described by a sparse feature vector: TF-IDF
+weights over the words of its title, description and brand, plus one-hot
+features for category, condition, price band and city. Cosine similarity
+between vectors ranks neighbours, and the top ``TOP_K`` per product are
+stored in ``RelatedProduct`` so the detail page needs one indexed lookup.
+
+``rebuild()`` recomputes everything (see the ``rebuild_related_products``
+command). Listing, editing or selling a product updates only the rows it
+affects, against an in-memory index kept by each process. That index is
+loaded from the database on first use and reflects the changes made by its
+own process, so a periodic rebuild keeps multi-process deployments exact.
+Changes are queued and applied in batches (see ``apply_pending``), so
+products changed together cost one pass.
+"""
+import math
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
+from scipy import sparse
+
+from .cache import bump_product_versions, bump_related_generation
+from .facets import PRICE_BUCKETS
+from .models import Product, RelatedProduct
+from .search import tokenize
+
+TOP_K = 8
+
+# Relative weight of each text field in the term counts
+FIELD_WEIGHTS = {'title': 3, 'brand': 2, 'description': 1}
+
+# Share of the final vector carried by each feature group
+GROUP_WEIGHTS = {
+    'text': 0.70,
+    'category': 0.15,
+    'condition': 0.04,
+    'price': 0.08,
+    'city': 0.03,
+}
+
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from has in is it its of on or that the '
+    'this to was were will with very good used new'.split()
+)
+
+# Rows of the similarity matrix computed at once during a rebuild, bounded
+# by the number of dense cells per block
+BLOCK_CELLS = 4_000_000
+
+# Products whose neighbour lists are reconsidered when one product is listed
+REVERSE_CANDIDATES = 50
+
+FIELDS = ('id', 'title', 'description', 'brand', 'category_id', 'condition', 'price', 'city')
+
+
+def price_band(price):
+    for key, _, low, high in PRICE_BUCKETS:
+        if (low is None or price >= low) and (high is None or price < high):
+            return key
+    return PRICE_BUCKETS[-1][0]
+
+
+def terms(row):
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(row[field]):
+            if len(token) > 1 and token not in STOP_WORDS and not token.isdigit():
+                counts[token] += weight
+    return counts
+
+
+def categorical_features(row):
+    return {
+        'category': row['category_id'],
+        'condition': row['condition'],
+        'price': price_band(row['price']),
+        'city': (row['city'] or '').strip().lower(),
+    }
+
+
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+
+class SimilarityIndex:
+    """
+    Feature vectors for a set of products, one CSR row per product.
+
+    Rows added or replaced after the matrix was built are held aside and
+    scored on their own, then merged into the matrix in one pass once they
+    reach ``COMPACT_RATIO`` of it, so a product change does not copy the
+    whole matrix.
+    """
+
+    COMPACT_RATIO = 0.05
+    COMPACT_MIN = 256
+
+    def __init__(self, idf, live_count):
+        self.idf = idf                # term -> inverse document frequency
+        self.live_count = live_count  # corpus size the idf was computed for
+        self.columns = {}             # ('term', word) or (group, value) -> column
+        self.ids = []
+        self.rows = {}
+        self.matrix = sparse.csr_matrix((0, 0))
+        self.changed = {}             # row -> vector replacing the matrix row
+        self._changed_rows = None     # (rows, stacked vectors) of ``changed``
+
+    @classmethod
+    def build(cls, rows):
+        documents = [terms(row) for row in rows]
+        document_frequency = Counter()
+        for counts in documents:
+            document_frequency.update(counts.keys())
+        n = len(rows)
+        index = cls(
+            {term: math.log((1 + n) / (1 + df)) + 1 for term, df in document_frequency.items()}, n
+        )
+        index.ids = [row['id'] for row in rows]
+        index.rows = {pk: i for i, pk in enumerate(index.ids)}
+        index.matrix = index.vectorize(rows, documents)
+        return index
+
+    @property
+    def width(self):
+        return len(self.columns)
+
+    def column(self, key):
+        if key not in self.columns:
+            self.columns[key] = len(self.columns)
+        return self.columns[key]
+
+    def vectorize(self, rows, documents=None):
+        """
+        Feature vectors for product rows. Words and categorical values not
+        seen before get new columns; a new word is weighted as one that
+        occurs in a single product.
+        """
+        documents = documents or [terms(row) for row in rows]
+        text_data, text_rows, text_cols = [], [], []
+        for i, counts in enumerate(documents):
+            for term, count in counts.items():
+                if term not in self.idf:
+                    self.idf[term] = math.log((1 + self.live_count) / 2) + 1
+                text_rows.append(i)
+                text_cols.append(self.column(('term', term)))
+                text_data.append((1 + math.log(count)) * self.idf[term])
+
+        # A one-hot group has unit norm, so its weight is applied directly
+        cat_data, cat_rows, cat_cols = [], [], []
+        for i, row in enumerate(rows):
+            for group, value in categorical_features(row).items():
+                cat_rows.append(i)
+                cat_cols.append(self.column((group, value)))
+                cat_data.append(math.sqrt(GROUP_WEIGHTS[group]))
+
+        shape = (len(rows), self.width)
+        text = normalize_rows(sparse.csr_matrix((text_data, (text_rows, text_cols)), shape=shape))
+        categorical = sparse.csr_matrix((cat_data, (cat_rows, cat_cols)), shape=shape)
+        return normalize_rows(math.sqrt(GROUP_WEIGHTS['text']) * text + categorical).tocsr()
+
+    def _pad(self, matrix):
+        """``matrix`` with the columns added since it was made"""
+        if matrix.shape[1] == self.width:
+            return matrix
+        return sparse.csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], self.width))
+
+    def vectors(self, positions):
+        """The current vectors of the given rows"""
+        if not any(i in self.changed for i in positions):
+            return self._pad(self.matrix[positions])
+        return sparse.vstack([
+            self._pad(self.changed[i] if i in self.changed else self.matrix[i]) for i in positions
+        ]).tocsr()
+
+    def scores(self, vectors):
+        """Cosine similarity of each vector against every indexed product"""
+        # Shared categorical features make the result dense, so multiply
+        # against a dense block rather than forming a sparse product
+        dense = self._pad(vectors).T.toarray()
+        result = np.zeros((len(self.ids), dense.shape[1]))
+        result[:self.matrix.shape[0]] = self.matrix @ dense[:self.matrix.shape[1]]
+        if self.changed:
+            if self._changed_rows is None:
+                positions = sorted(self.changed)
+                self._changed_rows = (positions, sparse.vstack(
+                    [self._pad(self.changed[i]) for i in positions]
+                ).tocsr())
+            positions, changed = self._changed_rows
+            result[positions] = changed @ dense[:changed.shape[1]]
+        return result.T
+
+    def top_k(self, scores, exclude, k=TOP_K):
+        """``[(product_id, score), ...]`` best first, skipping ``exclude``"""
+        limit = min(k + 1, len(scores))
+        if limit == 0:
+            return []
+        candidates = np.argpartition(-scores, limit - 1)[:limit]
+        ranked = sorted(candidates, key=lambda i: (-scores[i], i))
+        return [
+            (self.ids[i], float(scores[i]))
+            for i in ranked
+            if self.ids[i] is not None and self.ids[i] != exclude and scores[i] > 0
+        ][:k]
+
+    def _replace(self, i, vector):
+        self.changed[i] = vector
+        self._changed_rows = None
+        if len(self.changed) > max(self.COMPACT_MIN, self.COMPACT_RATIO * self.matrix.shape[0]):
+            self.compact()
+
+    def compact(self):
+        """Merge the rows held aside into the matrix"""
+        if not self.changed:
+            return
+        base = self.matrix
+        keep = np.ones(base.shape[0])
+        keep[[i for i in self.changed if i < base.shape[0]]] = 0
+        base = self._pad((sparse.diags(keep) @ base).tocsr())
+        positions = sorted(self.changed)
+        placement = sparse.csr_matrix(
+            (np.ones(len(positions)), (positions, range(len(positions)))), shape=(len(self.ids), len(positions))
+        )
+        changed = sparse.vstack([self._pad(self.changed[i]) for i in positions]).tocsr()
+        grown = sparse.vstack([base, sparse.csr_matrix((len(self.ids) - base.shape[0], self.width))])
+        self.matrix = (grown + placement @ changed).tocsr()
+        self.matrix.eliminate_zeros()
+        self.changed = {}
+        self._changed_rows = None
+
+    def upsert(self, row):
+        """Add or replace one product's vector and return its row number"""
+        vector = self.vectorize([row])
+        i = self.rows.get(row['id'])
+        if i is None:
+            i = len(self.ids)
+            self.ids.append(row['id'])
+            self.rows[row['id']] = i
+            self.live_count += 1
+        self._replace(i, vector)
+        return i
+
+    def remove(self, product_id):
+        """Blank a product's row; positions of the others stay stable"""
+        i = self.rows.pop(product_id, None)
+        if i is None:
+            return
+        self.ids[i] = None
+        self.live_count -= 1
+        self._replace(i, sparse.csr_matrix((1, self.width)))
+
+
+_index = None
+_index_lock = threading.RLock()
+
+
+def available_rows(**filters):
+    return list(Product.objects.filter(status='available', **filters).values(*FIELDS))
+
+
+def clear_index():
+    """Forget the in-memory index; the next update reloads it"""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SimilarityIndex.build(available_rows())
+        return _index
+
+
+def related_rows(product_id, neighbours):
+    return [
+        RelatedProduct(product_id=product_id, related_id=related_id, score=score, rank=rank)
+        for rank, (related_id, score) in enumerate(neighbours)
+    ]
+
+
+def rebuild(k=TOP_K):
+    """Recompute the neighbour lists of every available product"""
+    global _index
+    # Rows go in through executemany: model instances would cost more than
+    # computing the neighbours
+    table = connection.ops.quote_name(RelatedProduct._meta.db_table)
+    insert = (
+        f'INSERT INTO {table} (product_id, related_id, score, {connection.ops.quote_name("rank")}) '
+        'VALUES (%s, %s, %s, %s)'
+    )
+    with _index_lock:
+        index = SimilarityIndex.build(available_rows())
+        block = max(1, BLOCK_CELLS // max(1, len(index.ids)))
+        with transaction.atomic(), connection.cursor() as cursor:
+            RelatedProduct.objects.all().delete()
+            for start in range(0, len(index.ids), block):
+                scores = index.scores(index.matrix[start:start + block])
+                values = []
+                for offset, row_scores in enumerate(scores):
+                    product_id = index.ids[start + offset]
+                    values.extend(
+                        (product_id, related_id, score, rank)
+                        for rank, (related_id, score) in enumerate(index.top_k(row_scores, product_id, k))
+                    )
+                cursor.executemany(insert, values)
+        _index = index
+    bump_related_generation()
+    return len(index.ids)
+
+
+def _store_neighbours(index, product_ids):
+    """Recompute and replace the neighbour lists of indexed products"""
+    while True:
+        product_ids = [pk for pk in product_ids if pk in index.rows]
+        if not product_ids:
+            return
+        scores = index.scores(index.vectors([index.rows[pk] for pk in product_ids]))
+        neighbours = {
+            product_id: index.top_k(row_scores, product_id)
+            for product_id, row_scores in zip(product_ids, scores)
+        }
+        # Products sold or deleted by another process are still in this
+        # process's index; drop them and try again
+        referenced = set(product_ids) | {pk for entries in neighbours.values() for pk, _ in entries}
+        gone = referenced - set(
+            Product.objects.filter(pk__in=referenced, status='available').values_list('pk', flat=True)
+        )
+        if not gone:
+            break
+        for pk in gone:
+            index.remove(pk)
+
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product_id__in=product_ids).delete()
+        RelatedProduct.objects.bulk_create([
+            entry for product_id, entries in neighbours.items()
+            for entry in related_rows(product_id, entries)
+        ])
+    bump_product_versions(product_ids)
+
+
+# Products whose related lists are waiting to be updated, with the lists
+# each one's removal leaves to refill; see apply_pending()
+_pending = {}
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+
+# Attempts at applying a batch, and the pause before the first retry
+RETRY_ATTEMPTS = 3
+RETRY_DELAY = 0.05
+
+
+def product_listed(product_id):
+    """
+    Bring a newly listed or edited product into the related-product tables:
+    its own neighbours, and the lists of similar products it now belongs in.
+    """
+    queue_update(product_id)
+
+
+def product_removed(product_id, affected=()):
+    """
+    Drop a sold or deleted product and refill the lists it appeared in.
+    ``affected`` names lists already gone from the table, e.g. rows removed
+    by a cascading delete.
+    """
+    queue_update(product_id, affected)
+
+
+def queue_update(product_id, affected=()):
+    with _pending_lock:
+        _pending.setdefault(product_id, set()).update(affected)
+    apply_pending()
+
+
+def apply_pending():
+    """
+    Apply every queued update, a batch at a time. One thread applies at a
+    time and picks up products queued meanwhile; a batch that keeps
+    failing, e.g. on a locked database, stays queued for the next run
+    instead of being lost.
+    """
+    while True:
+        if not _flush_lock.acquire(blocking=False):
+            return
+        try:
+            while True:
+                with _pending_lock:
+                    batch = dict(_pending)
+                    _pending.clear()
+                if not batch:
+                    break
+                try:
+                    _apply_with_retries(batch)
+                except Exception:
+                    with _pending_lock:
+                        for product_id, affected in batch.items():
+                            _pending.setdefault(product_id, set()).update(affected)
+                    raise
+        finally:
+            _flush_lock.release()
+        # Products queued while the lock was being released
+        with _pending_lock:
+            if not _pending:
+                return
+
+
+def _apply_with_retries(batch):
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            return _apply(batch)
+        except OperationalError:
+            if attempt == RETRY_ATTEMPTS - 1:
+                raise
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+
+def _apply(batch):
+    """Update the related lists for ``{product_id: affected lists}``"""
+    rows = {row['id']: row for row in available_rows(pk__in=list(batch))}
+    removed = [pk for pk in batch if pk not in rows]
+    with _index_lock:
+        index = get_index()
+        stale = set().union(*batch.values())
+
+        if removed:
+            for product_id in removed:
+                index.remove(product_id)
+            stale |= set(RelatedProduct.objects.filter(related_id__in=removed).values_list('product_id', flat=True))
+            RelatedProduct.objects.filter(Q(product_id__in=removed) | Q(related_id__in=removed)).delete()
+
+        listed = list(rows)
+        if listed:
+            positions = [index.upsert(rows[pk]) for pk in listed]
+            all_scores = index.scores(index.vectors(positions))
+            candidates = {}
+            for product_id, i, scores in zip(listed, positions, all_scores):
+                scores[i] = 0
+                limit = min(REVERSE_CANDIDATES, len(scores))
+                candidates[product_id] = [
+                    (index.ids[j], scores[j]) for j in np.argpartition(-scores, limit - 1)[:limit]
+                    if index.ids[j] is not None and scores[j] > 0
+                ] if limit else []
+
+            # A candidate gains a new product if it beats its weakest
+            # neighbour or the list has room; lists already holding it are
+            # recomputed since an edit may have moved it
+            lists = {}
+            for entry in RelatedProduct.objects.filter(
+                    product_id__in={pk for entries in candidates.values() for pk, _ in entries}).only(
+                    'product_id', 'related_id', 'score'):
+                lists.setdefault(entry.product_id, []).append(entry)
+            for product_id, entries in candidates.items():
+                stale.add(product_id)
+                stale.update(
+                    pk for pk, score in entries
+                    if len(lists.get(pk, [])) < TOP_K or score > min(entry.score for entry in lists[pk])
+                )
+            stale |= set(RelatedProduct.objects.filter(related_id__in=listed).values_list('product_id', flat=True))
+
+        _store_neighbours(index, list(stale))
@@ -0,0 +1,82 @@
+"""
+Background work for the products app.
+
+Tasks run on a small in-process thread pool, submitted once the surrounding
+transaction commits so workers always see the rows they were queued for.
+Set ``TASKS_EAGER = True`` (tests do) to run tasks synchronously instead.
+"""
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from PIL import Image
+
+from . import thumbnails
+from .cache import bump_catalog_generation, bump_home_generation, bump_product_versions
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'TASK_WORKERS', 2),
+                thread_name_prefix='products-tasks',
+            )
+            atexit.register(_executor.shutdown)
+        return _executor
+
+
+def run_task(func, *args):
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception(f"Background task {func.__name__} failed")
+    finally:
+        # Worker threads outlive requests; don't leave their connections open
+        connection.close()
+
+
+def enqueue(func, *args):
+    """Run ``func(*args)`` in the background after the current transaction commits"""
+    if getattr(settings, 'TASKS_EAGER', False):
+        func(*args)
+        return
+    transaction.on_commit(lambda: get_executor().submit(run_task, func, *args))
+
+
+def process_image(image_id):
+    """
+    Validate and re-encode an uploaded ProductImage, then cut its renditions.
+    Leaves the image ``ready``, or ``failed`` if the upload is not usable.
+    """
+    from .models import ProductImage
+
+    image = ProductImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return
+    storage = image.image.storage
+    try:
+        name = thumbnails.normalize_original(image.image.name, storage)
+        renditions = thumbnails.render_renditions(name, storage)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Rejected product image {image.image.name}: {str(e)}")
+        ProductImage.objects.filter(pk=image_id).update(processing_state=ProductImage.FAILED)
+    else:
+        ProductImage.objects.filter(pk=image_id).update(
+            image=name, renditions=renditions, processing_state=ProductImage.READY
+        )
+    # The upload stops being shown as it was (re-encoding deletes the
+    # original), on the product page, listing cards and home page alike
+    bump_product_versions([image.product_id])
+    bump_catalog_generation()
+    bump_home_generation()
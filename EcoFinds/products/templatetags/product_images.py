@@ -0,0 +1,29 @@
+from django import template
+
+from products.thumbnails import RENDITIONS
+
+register = template.Library()
+
+
+@register.filter
+def rendition(image, name):
+    """URL of a ProductImage rendition, e.g. ``{{ image|rendition:'card' }}``"""
+    return image.rendition_url(name)
+
+
+@register.filter
+def srcset(image, names=None):
+    """
+    ``srcset`` value listing the image's renditions by width, e.g.
+    ``{{ image|srcset:'card,detail' }}``. Empty when no renditions exist, in
+    which case the browser uses ``src``.
+    """
+    wanted = names.split(',') if names else list(RENDITIONS)
+    candidates = {}
+    for name in wanted:
+        entry = image.renditions.get(name.strip())
+        # Small originals are never upscaled, so several renditions can share
+        # a width; the first (smallest file) wins
+        if entry and entry['width'] not in candidates:
+            candidates[entry['width']] = image.image.storage.url(entry['name'])
+    return ', '.join(f'{url} {width}w' for width, url in candidates.items())
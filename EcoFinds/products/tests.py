@@ -1,3 +1,1209 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from decimal import Decimal
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+import numpy as np
+from PIL import Image
+
+from .models import (
+    Category, Product, ProductImage, ProductReview, RelatedProduct, TrendingRun, Wishlist, apply_rating_change,
+)
+from . import autocomplete, catalog, counters, fuzzy, results, search, similarity, tasks, trending
+from .pagination import NEXT, PREVIOUS, SORT_ORDERINGS, KeysetPaginator, encode_cursor, filter_price_range
+from .cache import (
+    bump_catalog_generation, get_catalog_generation, get_generation, get_home_generation, listing_generation_key,
+    lookup_stats, product_version_key,
+)
+from .thumbnails import RENDITIONS
+
+
+@override_settings(VIEW_COUNTERS_ENABLED=False)
+class CacheTestCase(TestCase):
+    """
+    Tests start with an empty cache, which outlives the rolled-back test
+    transactions. Page views are not buffered for writing unless a test
+    enables the counters.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+
+class QueryPlanAssertions:
+    """Checks that a query reads the products table through an index"""
+
+    # Partial indexes only hold the rows a query asks for, so walking them
+    # in full is the intended plan
+    PARTIAL_INDEXES = {'product_featured_idx', 'product_trending_active_idx'}
+
+    # Sold filler rows that give the PostgreSQL planner a table big enough
+    # to prefer indexes on its own; listings and trending runs skip them
+    PLANNER_ROWS = 20000
+
+    @classmethod
+    def fill_for_planner(cls, seller, category):
+        if connection.vendor != 'postgresql':
+            return
+        Product.objects.bulk_create([
+            Product(
+                title=f'Sold item {i}', slug=f'sold-item-{i}', description='Sold', category=category,
+                seller=seller, price=Decimal(100 + i % 900), condition='good', city='Pune',
+                state='Maharashtra', status='sold',
+            )
+            for i in range(cls.PLANNER_ROWS)
+        ], batch_size=2000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE products_product')
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN {sql}')
+                return [row[0] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedPlan(self, sql, allow_sort=False):
+        plan = self.explain(sql)
+        for step in plan:
+            if connection.vendor == 'postgresql':
+                self.assertNotIn('Seq Scan on products_product', step, f'{sql}\n{plan}')
+                if not allow_sort:
+                    self.assertNotRegex(step, r'^\s*(->\s*)?(Incremental )?Sort\b', f'{sql}\n{plan}')
+                continue
+            if not allow_sort:
+                self.assertNotIn('USE TEMP B-TREE', step, f'{sql}\n{plan}')
+            if step.startswith('SCAN products_product') and 'VIRTUAL TABLE' not in step:
+                self.assertTrue(
+                    any(name in step for name in self.PARTIAL_INDEXES),
+                    f'Full scan of products:\n{sql}\n{plan}'
+                )
+
+
+class ListingQueryPlanTests(QueryPlanAssertions, CacheTestCase):
+    """
+    Every catalog query issued by the listing views must be answered from an
+    index: no full table scans of products and no temporary sort B-trees.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.books = Category.objects.create(name='Books', slug='books')
+        cls.furniture = Category.objects.create(name='Furniture', slug='furniture')
+        conditions = ['excellent', 'good', 'fair', 'poor']
+        for i in range(60):
+            Product.objects.create(
+                title=f'Leather bound book {i}' if i % 2 else f'Oak table {i}',
+                slug=f'product-{i}',
+                description='Gently used',
+                category=cls.books if i % 2 else cls.furniture,
+                seller=cls.seller,
+                price=Decimal(100 + i * 37 % 900),
+                condition=conditions[i % 4],
+                city='Pune',
+                state='Maharashtra',
+                is_featured=i % 5 == 0,
+            )
+        cls.fill_for_planner(cls.seller, cls.furniture)
+
+    def capture_catalog_queries(self, url, follow_cursor=True):
+        """
+        Request ``url`` (and the next page, when there is one) and return the
+        SQL of every query that reads the products table.
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+            page = response.context.get('page_obj') if response.context else None
+            if follow_cursor and page is not None and page.has_next:
+                self.capture_catalog_queries(f"{url.split('?')[0]}?{page.next_query}", follow_cursor=False)
+        return [q['sql'] for q in ctx.captured_queries if 'FROM "products_product"' in q['sql']]
+
+    def assertViewUsesIndexes(self, url, allow_sort=False):
+        queries = self.capture_catalog_queries(url)
+        self.assertTrue(queries, f'{url} issued no product queries')
+        for sql in queries:
+            with self.subTest(url=url, sql=sql):
+                self.assertIndexedPlan(sql, allow_sort)
+
+    def test_product_list(self):
+        for params in ['', 'sort=oldest', 'sort=price_low', 'sort=price_high',
+                       'condition=good', 'min_price=200&max_price=600',
+                       'condition=fair&sort=price_high', 'sort=rating', 'min_rating=4&sort=rating',
+                       'sort=popular']:
+            self.assertViewUsesIndexes(f'/products/?{params}')
+
+    def test_product_list_by_category(self):
+        for params in ['', 'sort=oldest', 'sort=price_low', 'sort=price_high',
+                       'condition=excellent', 'min_price=150&sort=price_low', 'sort=rating',
+                       'sort=popular']:
+            self.assertViewUsesIndexes(f'/products/?category=books&{params}')
+
+    def test_category_products(self):
+        for params in ['', 'sort=price_low', 'sort=price_high', 'sort=oldest']:
+            self.assertViewUsesIndexes(f'/products/category/furniture/?{params}')
+
+    def test_search(self):
+        # Search results are driven by the full-text index; ordering them
+        # (by relevance or otherwise) sorts the match set, which is bounded
+        # by the query rather than by catalog size
+        self.assertViewUsesIndexes('/products/search/?q=leather', allow_sort=True)
+        self.assertViewUsesIndexes('/products/?search=leather&sort=price_low', allow_sort=True)
+
+    def test_home(self):
+        self.assertViewUsesIndexes('/')
+
+    def test_product_detail(self):
+        self.assertViewUsesIndexes('/products/product-3/')
+
+
+def create_catalog(seller, category, count, images_per_product=2):
+    """Products with a couple of images each, the first one primary"""
+    products = []
+    for i in range(count):
+        product = Product.objects.create(
+            title=f'Product {category.slug} {i}', slug=f'{category.slug}-product-{i}',
+            description='Gently used', category=category, seller=seller,
+            price=Decimal('499.00'), condition='good', city='Pune', state='Maharashtra',
+        )
+        for n in range(images_per_product):
+            ProductImage.objects.create(product=product, image=f'products/{product.slug}-{n}.jpg',
+                                        is_primary=(n == 0))
+        products.append(product)
+    return products
+
+
+class ProductCardQueryCountTests(CacheTestCase):
+    """Rendering product cards must not cost a query per card"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.small = Category.objects.create(name='Small', slug='small')
+        cls.large = Category.objects.create(name='Large', slug='large')
+        create_catalog(cls.seller, cls.small, 2)
+        create_catalog(cls.seller, cls.large, 20)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_product_list_query_count_is_constant(self):
+        self.assertEqual(
+            self.count_queries('/products/?category=small'),
+            self.count_queries('/products/?category=large'),
+        )
+
+    def test_related_products_query_count_is_constant(self):
+        self.assertEqual(
+            self.count_queries('/products/small-product-0/'),
+            self.count_queries('/products/large-product-0/'),
+        )
+
+    def test_primary_image_comes_first(self):
+        product = Product.objects.with_primary_image().get(slug='large-product-3')
+        self.assertTrue(product.primary_image.is_primary)
+        self.assertEqual(product.primary_image, Product.objects.get(pk=product.pk).primary_image)
+
+
+def image_upload(name, size=(1200, 900), format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, (80, 186, 66)).save(buffer, format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{format.lower()}')
+
+
+class ProductImageIngestTests(TestCase):
+    """Uploads are stored as-is, then processed by the (eager) task queue"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, TASKS_EAGER=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.seller = User.objects.create_user('seller', password='password')
+        self.category = Category.objects.create(name='Books', slug='books')
+        self.client.force_login(self.seller)
+
+    def create_product(self, images):
+        return self.client.post('/products/create/', {
+            'title': 'Oak table', 'description': 'Solid oak', 'category': self.category.id,
+            'price': '1500', 'condition': 'good', 'city': 'Pune', 'state': 'Maharashtra',
+            'images': images,
+        })
+
+    def test_uploads_are_re_encoded_with_renditions(self):
+        self.create_product([image_upload('table.png'), image_upload('legs.png', (300, 200))])
+        product = Product.objects.with_primary_image().get()
+        images = product.display_images
+        self.assertEqual(len(images), 2)
+        self.assertTrue(images[0].is_primary)
+        for image in images:
+            self.assertEqual(image.processing_state, ProductImage.READY)
+            self.assertTrue(image.image.name.endswith('.jpg'))
+            self.assertEqual(set(image.renditions), set(RENDITIONS))
+        card = images[0].renditions['card']
+        self.assertEqual((card['width'], card['height']), (400, 300))
+
+    def test_invalid_upload_is_marked_failed_and_hidden(self):
+        broken = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+        with self.assertLogs('products.tasks', 'WARNING'):
+            self.create_product([broken, image_upload('table.png')])
+        product = Product.objects.get()
+        self.assertEqual(
+            sorted(product.images.values_list('processing_state', flat=True)),
+            [ProductImage.FAILED, ProductImage.READY],
+        )
+        self.assertEqual(product.primary_image.processing_state, ProductImage.READY)
+
+
+class GenerateRenditionsCommandTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        seller = User.objects.create_user('seller', password='password')
+        self.product = create_catalog(seller, Category.objects.create(name='Books', slug='books'), 1, 0)[0]
+
+    def generations(self):
+        return get_generation(product_version_key(self.product.pk)), get_catalog_generation(), get_home_generation()
+
+    def add_image(self, upload):
+        name = default_storage.save(f'products/{upload.name}', upload)
+        return ProductImage.objects.create(product=self.product, image=name)
+
+    def test_corrupt_images_fail_without_stopping_the_rest(self):
+        valid = self.add_image(image_upload('table.png'))
+        corrupt = self.add_image(SimpleUploadedFile('broken.jpg', b'not an image'))
+        stdout, stderr = StringIO(), StringIO()
+        generations = self.generations()
+        with self.assertLogs('products.management.commands.generate_renditions', 'WARNING'):
+            call_command('generate_renditions', workers=1, stdout=stdout, stderr=stderr)
+        # Pages showing the old image URLs are retired
+        for before, after in zip(generations, self.generations()):
+            self.assertNotEqual(before, after)
+        self.assertIn('Rendered 1 images, 1 failed', stdout.getvalue())
+        self.assertIn(corrupt.image.name, stderr.getvalue())
+
+        valid.refresh_from_db()
+        corrupt.refresh_from_db()
+        self.assertEqual(valid.processing_state, ProductImage.READY)
+        self.assertEqual(set(valid.renditions), set(RENDITIONS))
+        self.assertFalse(corrupt.renditions)
+
+
+@override_settings(TASKS_EAGER=True)
+class RelatedProductsTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.books = Category.objects.create(name='Books', slug='books')
+        cls.furniture = Category.objects.create(name='Furniture', slug='furniture')
+
+    def setUp(self):
+        super().setUp()
+        # The in-memory index outlives the rolled-back test transactions
+        similarity.clear_index()
+        similarity._pending.clear()
+
+    def create(self, title, category, slug, price='500', condition='good'):
+        return Product.objects.create(
+            title=title, slug=slug, description=f'{title}, gently used', category=category,
+            seller=self.seller, price=Decimal(price), condition=condition,
+            city='Pune', state='Maharashtra',
+        )
+
+    def related_titles(self, product):
+        response = self.client.get(f'/products/{product.slug}/')
+        return [related.title for related in response.context['related_products']]
+
+    def test_neighbours_follow_content(self):
+        novel = self.create('Harry Potter hardcover novel', self.books, 'novel')
+        self.create('Oak dining table', self.furniture, 'table')
+        self.create('Cookbook paperback', self.books, 'cookbook')
+        self.create('Harry Potter paperback novel set', self.books, 'novel-set')
+        self.assertEqual(
+            self.related_titles(novel)[:2],
+            ['Harry Potter paperback novel set', 'Cookbook paperback'],
+        )
+
+    def test_sold_products_leave_related_lists(self):
+        chair = self.create('Teak chair', self.furniture, 'chair')
+        stool = self.create('Teak stool', self.furniture, 'stool')
+        self.assertIn('Teak stool', self.related_titles(chair))
+        stool.status = 'sold'
+        stool.save()
+        self.assertNotIn('Teak stool', self.related_titles(chair))
+        self.assertFalse(RelatedProduct.objects.filter(related=stool).exists())
+
+    def test_changed_rows_are_merged_without_copying_per_change(self):
+        def row(i, title):
+            return {'id': i, 'title': title, 'description': 'Gently used', 'brand': '', 'category_id': i % 3,
+                    'condition': 'good', 'price': Decimal(100 + i), 'city': 'Pune'}
+
+        index = similarity.SimilarityIndex.build([row(i, f'Oak table {i % 7}') for i in range(20)])
+        matrix = index.matrix
+        index.upsert(row(3, 'Teak chair'))
+        index.upsert(row(20, 'Oak table 1'))
+        index.remove(5)
+        self.assertIs(index.matrix, matrix)
+        before = index.scores(index.vectors([3, 20]))
+        self.assertEqual(before[0][5], 0)
+
+        index.compact()
+        self.assertEqual(index.matrix.shape[0], 21)
+        self.assertTrue(np.allclose(index.scores(index.vectors([3, 20])), before))
+
+    def test_failed_updates_stay_queued(self):
+        chair = self.create('Teak chair', self.furniture, 'chair')
+        with mock.patch.object(similarity, '_apply', side_effect=OperationalError('database table is locked')), \
+                mock.patch.object(similarity, 'RETRY_DELAY', 0), self.assertRaises(OperationalError):
+            # Eager tasks raise; the task pool would log the error instead
+            self.create('Teak stool', self.furniture, 'stool')
+        stool = Product.objects.get(slug='stool')
+        self.assertIn(stool.pk, similarity._pending)
+        self.assertFalse(RelatedProduct.objects.filter(product=chair, related=stool).exists())
+
+        similarity.apply_pending()
+        self.assertEqual(similarity._pending, {})
+        self.assertTrue(RelatedProduct.objects.filter(product=chair, related=stool).exists())
+
+    def test_transient_failures_are_retried(self):
+        chair = self.create('Teak chair', self.furniture, 'chair')
+        apply = similarity._apply
+        failures = [OperationalError('database table is locked')]
+
+        def flaky(batch):
+            if failures:
+                raise failures.pop()
+            return apply(batch)
+
+        with mock.patch.object(similarity, '_apply', side_effect=flaky), \
+                mock.patch.object(similarity, 'RETRY_DELAY', 0):
+            stool = self.create('Teak stool', self.furniture, 'stool')
+        self.assertTrue(RelatedProduct.objects.filter(product=chair, related=stool).exists())
+
+
+class ProductDetailCacheTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.buyer = User.objects.create_user('buyer', password='password')
+        category = Category.objects.create(name='Books', slug='books')
+        cls.product, cls.other = create_catalog(cls.seller, category, 2)
+        Wishlist.objects.create(user=cls.buyer, product=cls.product)
+
+    def get(self, product=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/products/{(product or self.product).slug}/')
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in ctx.captured_queries]
+
+    def test_shared_parts_are_served_from_cache(self):
+        self.get()
+        response, queries = self.get()
+        self.assertFalse([sql for sql in queries if 'products_productreview' in sql or 'products_productimage' in sql])
+        self.assertContains(response, self.product.title)
+
+    def test_review_invalidates_page(self):
+        self.get()
+        self.client.force_login(self.buyer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/products/{self.product.pk}/review/',
+                             {'rating': 5, 'title': 'Great read', 'comment': 'Arrived quickly'},
+                             content_type='application/json')
+        self.assertContains(self.get()[0], 'Great read')
+
+    def test_related_product_change_invalidates_page(self):
+        RelatedProduct.objects.create(product=self.product, related=self.other, score=0.5, rank=0)
+        self.get()
+        self.other.title = 'Renamed neighbour'
+        self.other.save()
+        self.assertContains(self.get()[0], 'Renamed neighbour')
+
+    def test_wishlist_state_is_per_user(self):
+        self.client.force_login(self.buyer)
+        self.assertContains(self.get()[0], '<span>Remove from Wishlist</span>')
+        self.client.force_login(self.seller)
+        self.assertContains(self.get()[0], '<span>Add to Wishlist</span>')
+
+
+class RatingAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.reviewers = [User.objects.create_user(f'reader{i}', password='password') for i in range(3)]
+        category = Category.objects.create(name='Books', slug='books')
+        cls.product = create_catalog(cls.seller, category, 1, images_per_product=0)[0]
+
+    def review(self, user, rating):
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/products/{self.product.pk}/review/',
+                {'rating': rating, 'title': 'Review', 'comment': 'As described'},
+                content_type='application/json',
+            )
+        self.assertTrue(response.json()['success'])
+
+    def assertRating(self, count, total, average):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (count, total))
+        self.assertAlmostEqual(self.product.rating_average, average)
+
+    def test_reviews_update_aggregates(self):
+        self.review(self.reviewers[0], 5)
+        self.review(self.reviewers[1], 2)
+        self.assertRating(2, 7, 3.5)
+        self.review(self.reviewers[1], 4)
+        self.assertRating(2, 9, 4.5)
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductReview.objects.get(user=self.reviewers[0]).delete()
+        self.assertRating(1, 4, 4.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductReview.objects.all().delete()
+        self.assertRating(0, 0, 0.0)
+
+    def test_reviews_created_outside_the_view_are_counted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            review = ProductReview.objects.create(
+                product=self.product, user=self.reviewers[0], rating=4, title='Review', comment='As described'
+            )
+        self.assertRating(1, 4, 4.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        self.assertRating(0, 0, 0.0)
+        # Created and deleted before committing
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductReview.objects.create(
+                product=self.product, user=self.reviewers[1], rating=2, title='Review', comment='As described'
+            )
+            self.reviewers[1].delete()
+        self.assertRating(0, 0, 0.0)
+
+    def test_saving_a_loaded_product_keeps_aggregates(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self.review(self.reviewers[0], 4)
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertRating(1, 4, 4.0)
+
+    def test_reconcile_fixes_drift(self):
+        self.review(self.reviewers[0], 3)
+        Product.objects.filter(pk=self.product.pk).update(rating_count=7, rating_sum=1, rating_average=0.1)
+        keys = [listing_generation_key(self.product.category_id), product_version_key(self.product.pk)]
+        versions = [get_generation(key) for key in keys]
+        call_command('reconcile_ratings', stdout=StringIO())
+        self.assertRating(1, 3, 3.0)
+        for key, version in zip(keys, versions):
+            self.assertNotEqual(get_generation(key), version, key)
+
+
+class ReviewFeedTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        category = Category.objects.create(name='Books', slug='books')
+        cls.product = create_catalog(cls.seller, category, 1, images_per_product=0)[0]
+        for i in range(15):
+            user = User.objects.create(username=f'reader{i}')
+            ProductReview.objects.create(product=cls.product, user=user, rating=i % 5 + 1,
+                                         title=f'Review {i}', comment='As described')
+        call_command('reconcile_ratings', stdout=StringIO())
+
+    def test_feed_pages_through_all_reviews(self):
+        url = f'/products/{self.product.pk}/reviews/'
+        first = self.client.get(url).json()
+        self.assertEqual([bar['count'] for bar in first['histogram']], [3, 3, 3, 3, 3])
+        titles = [review['title'] for review in first['reviews']]
+        cursor = first['next_cursor']
+        while cursor:
+            with self.assertNumQueries(2):
+                page = self.client.get(url, {'cursor': cursor}).json()
+            self.assertNotIn('histogram', page)
+            titles += [review['title'] for review in page['reviews']]
+            cursor = page['next_cursor']
+        self.assertEqual(titles, [f'Review {i}' for i in reversed(range(15))])
+
+    def test_malformed_cursor_gets_the_first_page(self):
+        url = f'/products/{self.product.pk}/reviews/'
+        first = self.client.get(url).json()
+        for values in (['yesterday', '3'], ['2024-01-01T00:00:00+00:00', 'x'], []):
+            with self.subTest(values=values):
+                response = self.client.get(url, {'cursor': encode_cursor(NEXT, values)})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), first)
+        self.assertEqual(self.client.get(url, {'cursor': '%%%'}).json(), first)
+
+    def test_detail_page_renders_first_page(self):
+        response = self.client.get(f'/products/{self.product.slug}/')
+        self.assertContains(response, 'Review 14')
+        self.assertNotContains(response, 'Review 0<')
+        self.assertContains(response, 'id="load-more-reviews"')
+
+
+class ViewCounterTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user('seller', password='password')
+        category = Category.objects.create(name='Books', slug='books')
+        cls.products = create_catalog(seller, category, 3, images_per_product=0)
+
+    def test_flush_writes_all_counts_in_one_update(self):
+        buffer = counters.ViewCounterBuffer(flush_seconds=3600, max_pending=100)
+        first, second, third = self.products
+        for product in [first, first, first, second]:
+            buffer.record(product.pk)
+        self.assertEqual(buffer.pending(), {first.pk: 3, second.pk: 1})
+        with self.assertNumQueries(1):
+            buffer.flush()
+        self.assertEqual(
+            dict(Product.objects.values_list('pk', 'view_count')),
+            {first.pk: 3, second.pk: 1, third.pk: 0},
+        )
+        self.assertEqual(buffer.pending(), {})
+
+    @override_settings(TASKS_EAGER=True)
+    def test_buffer_flushes_when_full(self):
+        buffer = counters.ViewCounterBuffer(flush_seconds=3600, max_pending=3)
+        for _ in range(2):
+            buffer.record(self.products[0].pk)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).view_count, 0)
+        buffer.record(self.products[0].pk)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).view_count, 3)
+        self.assertEqual(buffer.pending(), {})
+
+    def test_pending_counts_are_flushed_on_a_timer(self):
+        buffer = counters.ViewCounterBuffer(flush_seconds=0.01, max_pending=100)
+        flushed = threading.Event()
+        with mock.patch.object(tasks, 'enqueue', side_effect=lambda *args: flushed.set()) as enqueue:
+            buffer.record(self.products[0].pk)
+            self.assertTrue(flushed.wait(5))
+        enqueue.assert_called_once_with(counters.write_view_counts, {self.products[0].pk: 1})
+        self.assertEqual(buffer.pending(), {})
+
+    @override_settings(VIEW_COUNTERS_ENABLED=True)
+    def test_detail_page_records_view_without_writing(self):
+        buffer = counters.ViewCounterBuffer(flush_seconds=3600, max_pending=100)
+        product = self.products[0]
+        with mock.patch.object(counters, 'view_counter', buffer), \
+                CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/products/{product.slug}/')
+        self.assertEqual(buffer.pending(), {product.pk: 1})
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE')])
+
+    def test_most_viewed_sort(self):
+        counters.write_view_counts({self.products[1].pk: 5, self.products[2].pk: 2})
+        response = self.client.get('/products/', {'sort': 'popular'})
+        self.assertEqual(
+            [product.pk for product in response.context['products']],
+            [self.products[1].pk, self.products[2].pk, self.products[0].pk],
+        )
+
+
+class TrendingTests(QueryPlanAssertions, CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        category = Category.objects.create(name='Books', slug='books')
+        cls.products = create_catalog(cls.seller, category, 3, images_per_product=0)
+        cls.fill_for_planner(cls.seller, category)
+
+    def score(self, product):
+        return Product.objects.get(pk=product.pk).trending_score
+
+    def test_scores_decay_and_add_only_new_events(self):
+        quiet, viewed, wished = self.products
+        start = timezone.now()
+        trending.update_scores(start)
+        self.assertEqual(self.score(wished), 0)
+
+        counters.write_view_counts({viewed.pk: 10})
+        Wishlist.objects.create(user=self.seller, product=wished)
+        later = start + timedelta(hours=1)
+        trending.update_scores(later)
+        wished_score = trending.EVENT_WEIGHTS['wishlist'] * trending.decay(later - timezone.now())
+        self.assertAlmostEqual(self.score(wished), wished_score, places=3)
+        self.assertAlmostEqual(
+            self.score(viewed), 10 * trending.decay(timedelta(minutes=30)), places=3
+        )
+        self.assertEqual(self.score(quiet), 0)
+
+        # A half-life later, with nothing new, every score has halved
+        trending.update_scores(later + trending.HALF_LIFE)
+        self.assertAlmostEqual(self.score(wished), wished_score / 2, places=3)
+        self.assertEqual(TrendingRun.objects.count(), 3)
+        self.assertEqual(TrendingRun.objects.latest().events, 0)
+
+    def test_runs_walk_indexes_not_the_catalog(self):
+        trending.update_scores(timezone.now() - timedelta(hours=1))
+        counters.write_view_counts({self.products[1].pk: 3})
+        with CaptureQueriesContext(connection) as ctx:
+            trending.update_scores()
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "products_product"')]
+        self.assertTrue(updates)
+        for sql in updates:
+            with self.subTest(sql=sql):
+                self.assertIndexedPlan(sql)
+        self.assertGreater(self.score(self.products[1]), 0)
+
+    def test_home_shows_trending_block(self):
+        counters.write_view_counts({self.products[1].pk: 3})
+        call_command('update_trending', stdout=StringIO())
+        response = self.client.get('/')
+        self.assertContains(response, 'Trending Now')
+        self.assertEqual(list(trending.trending_products()), [self.products[1]])
+
+
+# Saves below run their on-commit work, background tasks included
+@override_settings(TASKS_EAGER=True)
+class AutocompleteTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.electronics = Category.objects.create(name='Electronics', slug='electronics')
+        for i, (title, brand) in enumerate([
+                ('Samsung Galaxy phone', 'Samsung'), ('Samsung smart TV', 'Samsung'),
+                ('Sandalwood table', ''), ('Leather sandals', 'Bata')]):
+            Product.objects.create(
+                title=title, slug=f'product-{i}', description='Gently used', category=cls.electronics,
+                seller=cls.seller, price=Decimal('499.00'), condition='good', brand=brand,
+                city='Pune', state='Maharashtra',
+            )
+
+    def setUp(self):
+        super().setUp()
+        autocomplete.clear_index()
+        similarity.clear_index()
+
+    def texts(self, query):
+        return [(s['kind'], s['text']) for s in self.client.get('/products/autocomplete/', {'q': query}).json()['suggestions']]
+
+    def test_suggestions_by_kind_and_popularity(self):
+        # "samsung" the word repeats the brand and is shown once
+        self.assertEqual(self.texts('sa'), [
+            ('brand', 'Samsung'), ('term', 'sandals'), ('term', 'sandalwood'),
+            ('title', 'samsung galaxy phone'), ('title', 'samsung smart tv'), ('title', 'sandalwood table'),
+        ])
+        # Earlier words are kept and the last one is completed
+        self.assertIn(('term', 'leather sandals'), self.texts('leather sa'))
+        self.assertEqual(self.texts('elec'), [('category', 'Electronics')])
+        self.assertEqual(self.texts('s'), [])
+
+    def test_category_suggestion_links_to_category(self):
+        suggestion = self.client.get('/products/autocomplete/', {'q': 'elec'}).json()['suggestions'][0]
+        self.assertEqual(suggestion['url'], '/products/?category=electronics')
+
+    def test_index_follows_committed_saves_and_deletes(self):
+        self.assertEqual(self.texts('galaxy'), [('term', 'galaxy')])
+        product = Product.objects.get(slug='product-0')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.title = 'Samsung Note phone'
+            product.save()
+        self.assertEqual(self.texts('galaxy'), [])
+        self.assertEqual(self.texts('note'), [('term', 'note')])
+        with self.captureOnCommitCallbacks(execute=True):
+            product.status = 'sold'
+            product.save()
+        self.assertEqual(self.texts('note'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(slug='product-3').delete()
+        self.assertNotIn(('brand', 'Bata'), self.texts('bata'))
+
+    def test_index_is_rebuilt_after_changes_in_other_processes(self):
+        self.assertEqual(self.texts('galaxy'), [('term', 'galaxy')])
+        # Another worker's save: no signal reaches this process's index
+        Product.objects.filter(slug='product-0').update(title='Samsung Note phone')
+        bump_catalog_generation()
+        self.assertEqual(self.texts('note'), [])
+        with mock.patch.object(autocomplete, 'REFRESH_INTERVAL', 0):
+            self.assertEqual(self.texts('note'), [('term', 'note')])
+        self.assertEqual(self.texts('galaxy'), [])
+
+
+@override_settings(TASKS_EAGER=True)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.category = Category.objects.create(name='Furniture', slug='furniture')
+
+    def setUp(self):
+        if not search.fts_available():
+            self.skipTest('SQLite FTS5 index not available')
+
+    def create(self, title, description='Gently used', slug=None):
+        return Product.objects.create(
+            title=title, slug=slug or title.lower().replace(' ', '-'), description=description,
+            category=self.category, seller=self.seller, price=Decimal('499.00'), condition='good',
+            city='Pune', state='Maharashtra',
+        )
+
+    def titles(self, query):
+        return [product.title for product in search.search(Product.objects.all(), query)]
+
+    def test_index_follows_saves_and_deletes(self):
+        product = self.create('Walnut bookshelf')
+        self.assertEqual(self.titles('walnut'), ['Walnut bookshelf'])
+
+        product.title = 'Teak bookshelf'
+        product.save()
+        self.assertEqual(self.titles('walnut'), [])
+        self.assertEqual(self.titles('teak'), ['Teak bookshelf'])
+
+        product.status = 'sold'
+        product.save()
+        self.assertEqual(self.titles('teak'), [])
+        product.status = 'available'
+        product.save()
+        self.assertEqual(self.titles('teak'), ['Teak bookshelf'])
+
+        product.delete()
+        self.assertEqual(self.titles('teak'), [])
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.create('Study table', 'Solid walnut top with two drawers', slug='table')
+        self.create('Walnut side table', 'Solid top with two drawers', slug='side-table')
+        self.assertEqual(self.titles('walnut'), ['Walnut side table', 'Study table'])
+        # Every term is matched as a prefix
+        self.assertEqual(self.titles('wal draw'), ['Walnut side table', 'Study table'])
+
+    def test_queries_without_words_leave_the_queryset_alone(self):
+        self.create('Walnut bookshelf')
+        products = Product.objects.all()
+        for query in ('', '  ', '"?!', None):
+            with self.subTest(query=query):
+                results = search.search(products, query)
+                self.assertIs(results, products)
+                self.assertNotIn('search_rank', results.query.annotations)
+
+
+# Saves below run their on-commit work, background tasks included
+@override_settings(TASKS_EAGER=True)
+class FuzzySearchTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.category = Category.objects.create(name='Electronics', slug='electronics')
+        for i, (title, brand, model) in enumerate([
+                ('Smartphone with charger', 'Samsung', 'Galaxy S21'),
+                ('Running shoes', 'Adidas', 'Ultraboost'),
+                ('Leather jacket', '', ''),
+                ('Leather wallet', '', '')]):
+            cls.create(i, title, brand, model)
+
+    @classmethod
+    def create(cls, i, title, brand, model=''):
+        return Product.objects.create(
+            title=title, slug=f'product-{i}', description='Gently used', category=cls.category,
+            seller=cls.seller, price=Decimal('499.00'), condition='good', brand=brand, model=model,
+            city='Pune', state='Maharashtra',
+        )
+
+    def setUp(self):
+        super().setUp()
+        fuzzy.clear_index()
+        similarity.clear_index()
+
+    def results(self, query):
+        response = self.client.get('/products/', {'search': query})
+        return [product.title for product in response.context['products']], response.context['corrected_query']
+
+    def test_misspelt_brands_and_models_fall_back_to_close_words(self):
+        self.assertEqual(self.results('samsng'), (['Smartphone with charger'], 'samsung'))
+        self.assertEqual(self.results('addidas shoes'), (['Running shoes'], 'adidas shoes'))
+        self.assertEqual(self.results('galaxi'), (['Smartphone with charger'], 'galaxy'))
+
+    def test_exact_matches_do_not_need_the_fallback(self):
+        for i in range(4, 4 + fuzzy.FALLBACK_THRESHOLD):
+            self.create(i, f'Leather bag {i}', '')
+        titles, corrected = self.results('leather')
+        self.assertEqual(len(titles), fuzzy.FALLBACK_THRESHOLD + 2)
+        self.assertIsNone(corrected)
+
+    def test_vocabulary_follows_committed_changes(self):
+        self.assertEqual(fuzzy.get_index().corrections('philps'), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            product = self.create(9, 'Hair dryer', 'Philips')
+        self.assertEqual(fuzzy.get_index().corrections('philps'), {'philps': ['philips']})
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(fuzzy.get_index().corrections('philps'), {})
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.books = Category.objects.create(name='Books', slug='books')
+        cls.products = create_catalog(cls.seller, cls.books, 10, images_per_product=0)
+        for i, product in enumerate(cls.products):
+            product.price = Decimal(100 + i * 7 % 10 * 10)
+            product.save()
+
+    def paginator(self, sort):
+        return KeysetPaginator(Product.objects.all(), SORT_ORDERINGS[sort], per_page=4)
+
+    def test_next_and_previous_cross_page_boundaries(self):
+        for sort in ('newest', 'price_low', 'rating'):
+            with self.subTest(sort=sort):
+                paginator = self.paginator(sort)
+                expected = list(Product.objects.order_by(*SORT_ORDERINGS[sort]))
+                pages = [paginator.page()]
+                while pages[-1].has_next:
+                    pages.append(paginator.page(pages[-1].next_cursor))
+                self.assertEqual([len(page) for page in pages], [4, 4, 2])
+                self.assertEqual([product for page in pages for product in page], expected)
+
+                back = paginator.page(pages[-1].previous_cursor)
+                self.assertEqual(list(back), list(pages[1]))
+                first = paginator.page(back.previous_cursor)
+                self.assertEqual(list(first), list(pages[0]))
+                self.assertFalse(first.has_previous)
+                self.assertIsNone(first.previous_cursor)
+
+    def test_cursor_past_the_end_gives_an_empty_page(self):
+        paginator = self.paginator('newest')
+        last = Product.objects.order_by(*SORT_ORDERINGS['newest']).last()
+        page = paginator.page(encode_cursor(NEXT, [last.created_at, last.pk]))
+        self.assertEqual(list(page), [])
+        self.assertEqual((page.has_next, page.has_previous), (False, False))
+        self.assertEqual((page.next_cursor, page.previous_cursor), (None, None))
+
+    def test_malformed_cursor_serves_the_first_page(self):
+        paginator = self.paginator('price_low')
+        first = list(paginator.page())
+        for values in (['cheap', '1'], ['100', 'x'], ['NaN', '1'], ['100'], [['100'], '1']):
+            with self.subTest(values=values):
+                self.assertEqual(list(paginator.page(encode_cursor(NEXT, values))), first)
+        newest = self.paginator('newest')
+        self.assertEqual(list(newest.page(encode_cursor(NEXT, ['yesterday', '1']))), list(newest.page()))
+        for sort in ('newest', 'price_low'):
+            response = self.client.get('/products/', {
+                'sort': sort, 'cursor': encode_cursor(NEXT, ['yesterday', 'x']),
+            })
+            self.assertEqual(response.status_code, 200)
+
+
+    def test_price_bounds_are_compared_as_decimals(self):
+        Product.objects.filter(pk=self.products[0].pk).update(price=Decimal('19.99'))
+        Product.objects.filter(pk=self.products[1].pk).update(price=Decimal('0.30'))
+        cases = [
+            ((None, Decimal('19.99')), {'19.99', '0.30'}),
+            ((Decimal('19.99'), Decimal('19.99')), {'19.99'}),
+            ((Decimal('19.98'), Decimal('19.99')), {'19.99'}),
+            ((None, Decimal('19.98')), {'0.30'}),
+            ((Decimal('0.3'), Decimal('0.3')), {'0.30'}),
+            ((Decimal('20.00'), Decimal('99.99')), set()),
+        ]
+        for sort in ('newest', 'price_low', 'price_high', 'rating'):
+            for (low, high), expected in cases:
+                with self.subTest(sort=sort, low=low, high=high):
+                    products = filter_price_range(Product.objects.all(), low, high, sort)
+                    self.assertEqual({str(product.price) for product in products}, expected)
+        response = self.client.get('/products/', {'max_price': '19.99'})
+        self.assertEqual({str(product.price) for product in response.context['products']}, {'19.99', '0.30'})
+
+class ListingResultCacheTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.books = Category.objects.create(name='Books', slug='books')
+        cls.furniture = Category.objects.create(name='Furniture', slug='furniture')
+        create_catalog(cls.seller, cls.books, 60, images_per_product=1)
+        create_catalog(cls.seller, cls.furniture, 5, images_per_product=1)
+
+    def walk(self, params):
+        """Titles of every page of a listing, following next cursors"""
+        titles = []
+        query = params
+        while query is not None:
+            page = self.client.get(f'/products/?{query}').context['page_obj']
+            titles += [product.title for product in page]
+            query = page.next_query
+        return titles
+
+    def test_cached_pages_match_the_database(self):
+        for params in ['category=books', 'category=books&sort=price_high', 'condition=good&sort=oldest']:
+            for cached_pages in (1, results.CACHED_PAGES):
+                # With one cached page, later pages come from the database
+                with self.subTest(params=params, cached_pages=cached_pages), \
+                        mock.patch.object(results, 'CACHED_PAGES', cached_pages):
+                    cache.clear()
+                    fresh = self.walk(params)
+                    self.assertEqual(len(fresh), len(set(fresh)))
+                    self.assertEqual(self.walk(params), fresh)
+        self.assertGreater(lookup_stats(['listing_results'])['listing_results']['hits'], 0)
+
+    def test_cursors_past_the_cached_ids(self):
+        ordering = SORT_ORDERINGS['newest']
+        ordered = list(Product.objects.filter(category=self.furniture).order_by(*ordering))
+        self.client.get('/products/?category=furniture')
+        for direction, product in ((NEXT, ordered[-1]), (PREVIOUS, ordered[0])):
+            with self.subTest(direction=direction):
+                cursor = encode_cursor(direction, [product.created_at, product.pk])
+                response = self.client.get('/products/', {'category': 'furniture', 'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                page = response.context['page_obj']
+                self.assertEqual(list(page), [])
+                self.assertEqual((page.next_query, page.previous_query), (None, None))
+
+    def test_hit_hydrates_page_by_id(self):
+        self.client.get('/products/?category=books')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/products/?category=books')
+        product_queries = [q['sql'] for q in queries if 'FROM "products_product"' in q['sql']]
+        self.assertEqual(len(product_queries), 1)
+        self.assertIn('"products_product"."id" IN', product_queries[0])
+        stats = lookup_stats(['listing_results'])['listing_results']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertIn('hit_ms', stats)
+
+    def test_product_changes_retire_their_category_only(self):
+        self.client.get('/products/?category=books')
+        self.client.get('/products/?category=furniture')
+        chair = Product.objects.filter(category=self.furniture).first()
+        chair.status = 'sold'
+        chair.save()
+
+        response = self.client.get('/products/?category=furniture')
+        self.assertNotIn(chair, list(response.context['products']))
+        self.client.get('/products/?category=books')
+        stats = lookup_stats(['listing_results'])['listing_results']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+
+
+class CatalogQueryTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.books = Category.objects.create(name='Books', slug='books')
+        cls.furniture = Category.objects.create(name='Furniture', slug='furniture')
+        create_catalog(cls.seller, cls.books, 3, images_per_product=1)
+        create_catalog(cls.seller, cls.furniture, 2, images_per_product=1)
+        Product.objects.filter(slug='books-product-0').update(price=Decimal('150.00'))
+
+    def test_params_are_validated_up_front(self):
+        query = catalog.CatalogQuery.from_params({
+            'category': 'books', 'condition': 'mint', 'min_rating': '5',
+            'min_price': '900', 'max_price': '200.50', 'sort': 'relevance',
+        })
+        self.assertEqual(query.category, self.books)
+        self.assertEqual((query.condition, query.min_rating, query.sort), ('', '', 'newest'))
+        self.assertEqual((query.min_price, query.max_price), (Decimal('200.50'), Decimal('900')))
+        self.assertEqual(query.errors, ())
+
+        query = catalog.CatalogQuery.from_params({'min_price': 'abc', 'max_price': '-5', 'search': ' oak  desk '})
+        self.assertEqual((query.min_price, query.max_price), (None, None))
+        self.assertEqual(len(query.errors), 2)
+        self.assertEqual((query.search, query.sort), ('oak desk', 'relevance'))
+
+    def test_search_without_words_lists_everything(self):
+        for sort in ('', 'relevance'):
+            query = catalog.CatalogQuery.from_params({'search': ' "? ', 'sort': sort})
+            self.assertEqual((query.search, query.sort), ('', 'newest'))
+        response = self.client.get('/products/', {'search': '"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), 5)
+        response = self.client.get('/products/search/', {'q': '"', 'sort': 'relevance'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_equivalent_params_share_cache_keys(self):
+        first = catalog.CatalogQuery.from_params({'category': 'books', 'min_price': '200.00'})
+        second = catalog.CatalogQuery.from_params({'category': 'books', 'min_price': '200', 'max_price': 'x'})
+        self.assertEqual(first.params, second.params)
+
+    def test_listing_views_share_the_query(self):
+        responses = {
+            'list': self.client.get('/products/?category=books&max_price=200'),
+            'category': self.client.get('/products/category/books/?max_price=200'),
+        }
+        for name, response in responses.items():
+            with self.subTest(view=name):
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([p.slug for p in response.context['products']], ['books-product-0'])
+
+        response = self.client.get('/products/search/?q=furniture&min_price=oops')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), 2)
+        self.assertEqual(len(response.context['filter_errors']), 1)
+
+    def facet_counts(self, params):
+        facets = self.client.get('/products/', params).context['facets']
+        return (
+            facets['total'],
+            {category['slug']: category['count'] for category in facets['categories']},
+            {option['value']: option['count'] for option in facets['conditions'] if option['count']},
+            {bucket['key']: bucket['count'] for bucket in facets['price_buckets'] if bucket['count']},
+        )
+
+    def test_facets_without_a_selection(self):
+        self.assertEqual(self.facet_counts({}), (
+            5, {'books': 3, 'furniture': 2}, {'good': 5}, {'under-500': 5},
+        ))
+
+    def test_facets_count_each_dimension_without_its_own_selection(self):
+        Product.objects.filter(slug='furniture-product-0').update(condition='fair')
+        total, categories, conditions, prices = self.facet_counts({'category': 'books', 'condition': 'good'})
+        self.assertEqual(total, 3)
+        # Other categories are counted under the condition selected, and
+        # other conditions within the category
+        self.assertEqual(categories, {'books': 3, 'furniture': 1})
+        self.assertEqual(conditions, {'good': 3})
+        self.assertEqual(prices, {'under-500': 3})
+
+        total, categories, conditions, prices = self.facet_counts({'condition': 'fair', 'max_price': '200'})
+        self.assertEqual(total, 0)
+        self.assertEqual(categories, {'books': 0, 'furniture': 0})
+        self.assertEqual(conditions, {'good': 1})
+        self.assertEqual(prices, {'under-500': 1})
+
+    def test_cards_load_only_their_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/products/?sort=popular')
+            slugs = [product.slug for product in response.context['products']]
+        self.assertEqual(len(slugs), 5)
+        listing = [q['sql'] for q in queries if q['sql'].startswith('SELECT "products_product"."id"')
+                   and 'LIMIT' in q['sql']]
+        self.assertTrue(listing)
+        self.assertIn('"products_product"."view_count"', listing[0])
+        self.assertNotIn('"products_product"."original_price"', listing[0])
+
+
+class ConditionalGetTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.books = Category.objects.create(name='Books', slug='books')
+        cls.product, cls.other = create_catalog(cls.seller, cls.books, 2, images_per_product=1)
+
+    def revisit(self, url):
+        """Fetch ``url``, then revalidate it with the ETag it returned"""
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    @override_settings(VIEW_COUNTERS_ENABLED=True)
+    def test_unchanged_detail_page_is_not_rendered_again(self):
+        url = f'/products/{self.product.slug}/'
+        buffer = counters.ViewCounterBuffer(flush_seconds=3600, max_pending=100)
+        with mock.patch.object(counters, 'view_counter', buffer):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Revalidated visits still count as views
+        self.assertEqual(buffer.pending(), {self.product.pk: 2})
+
+        ProductReview.objects.create(product=self.product, user=self.seller, rating=4, comment='Fine')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_unchanged_listing_is_not_queried_again(self):
+        etag = self.client.get('/products/?sort=price_low')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/products/?sort=price_low', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.revisit('/products/category/books/').status_code, 304)
+
+        self.other.price = Decimal('10.00')
+        self.other.save()
+        self.assertEqual(self.client.get('/products/?sort=price_low', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etags_differ_per_visitor(self):
+        url = f'/products/{self.product.slug}/'
+        anonymous = self.client.get(url)['ETag']
+        self.client.login(username='seller', password='password')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=anonymous)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+        Wishlist.objects.create(user=self.seller, product=self.product)
+        self.assertNotEqual(self.client.get(url)['ETag'], response['ETag'])
+
+
+class CatalogApiTests(CacheTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='password')
+        cls.books = Category.objects.create(name='Books', slug='books')
+        cls.furniture = Category.objects.create(name='Furniture', slug='furniture')
+        cls.products = create_catalog(cls.seller, cls.books, 30)
+        create_catalog(cls.seller, cls.furniture, 5)
+        ProductReview.objects.create(product=cls.products[0], user=cls.seller, rating=5, comment='Great')
+        apply_rating_change(cls.products[0].pk, 1, 5)
+
+    def test_list_pages_embed_images_without_extra_queries(self):
+        for size in (5, 30):
+            # Category, products and their images
+            with self.subTest(size=size), self.assertNumQueries(3):
+                response = self.client.get(f'/api/products/?category=books&page_size={size}')
+        results = response.json()['results']
+        self.assertEqual(len(results), 30)
+        self.assertEqual(results[-1]['primary_image']['url'],
+                         f'http://testserver/media/products/{self.products[0].slug}-0.jpg')
+        self.assertEqual((results[-1]['rating_average'], results[-1]['rating_count']), (5.0, 1))
+
+    def test_cursor_links_walk_the_whole_listing(self):
+        ids = []
+        url = '/api/products/?page_size=8&sort=price_low'
+        while url:
+            data = self.client.get(url).json()
+            ids += [product['id'] for product in data['results']]
+            url = data['next']
+        self.assertEqual(len(ids), 35)
+        self.assertEqual(len(set(ids)), 35)
+
+    def test_sparse_fields_load_only_what_they_need(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/products/?fields=id,title&page_size=3')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"products_product"."price"', queries[0]['sql'])
+        self.assertEqual([set(product) for product in response.json()['results']], [{'id', 'title'}] * 3)
+
+    def test_detail_and_reviews(self):
+        product = self.products[0]
+        data = self.client.get(f'/api/products/{product.pk}/').json()
+        self.assertEqual(data['category']['slug'], 'books')
+        self.assertEqual([image['is_primary'] for image in data['images']], [True, False])
+        reviews = self.client.get(f'/api/products/{product.pk}/reviews/').json()
+        self.assertEqual([review['author'] for review in reviews['results']], ['seller'])
+        self.assertEqual(len(self.client.get('/api/categories/').json()), 2)
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get('/api/products/?min_price=cheap')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('price', response.json())
+
+    def test_invalid_cursors_are_not_found(self):
+        product = self.products[0]
+        for url in ('/api/products/', f'/api/products/{product.pk}/reviews/'):
+            for cursor in (encode_cursor(NEXT, ['yesterday', 'x']), 'garbage'):
+                with self.subTest(url=url, cursor=cursor):
+                    response = self.client.get(url, {'cursor': cursor})
+                    self.assertEqual((response.status_code, response.json()), (404, {'detail': 'Invalid cursor'}))
+
+    def test_search_without_words_lists_everything(self):
+        response = self.client.get('/api/products/?search=%22&page_size=100')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 35)
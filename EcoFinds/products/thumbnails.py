@@ -0,0 +1,111 @@
+"""
+Fixed-size renditions of product images.
+
+Each uploaded image is re-encoded into a handful of sizes stored next to
+the original (``products/bike.jpg`` -> ``products/bike.card.jpg``), so pages
+can download an image close to the size they display instead of the
+full-resolution upload.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name -> bounding box; images are scaled down to fit, never up
+RENDITIONS = {
+    'thumb': (160, 160),    # cart and list thumbnails
+    'card': (400, 300),     # product cards
+    'detail': (800, 600),   # detail page carousel
+    'zoom': (1600, 1200),   # full-screen view
+}
+
+JPEG_QUALITY = 82
+
+# Uploads are re-encoded to at most this size before renditions are cut
+MAX_ORIGINAL_SIZE = (2400, 2400)
+MAX_SOURCE_PIXELS = 40_000_000
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF', 'MPO'}
+
+
+def rendition_name(name, rendition):
+    """Storage name of a rendition stored next to the original file"""
+    stem, _ = os.path.splitext(name)
+    return f'{stem}.{rendition}.jpg'
+
+
+def encode_jpeg(image):
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def normalize_original(name, storage=None):
+    """
+    Validate an uploaded image and replace it with a re-encoded JPEG.
+
+    The upload is decoded in full, rotated per its EXIF orientation, stripped
+    of metadata and scaled down to ``MAX_ORIGINAL_SIZE``. Returns the storage
+    name of the normalized file. Raises ValueError for files that are not an
+    accepted image and OSError for files that cannot be decoded.
+    """
+    storage = storage or default_storage
+    with storage.open(name, 'rb') as upload:
+        with Image.open(upload) as probe:
+            if probe.format not in ACCEPTED_FORMATS:
+                raise ValueError(f'unsupported image format {probe.format}')
+            if probe.width * probe.height > MAX_SOURCE_PIXELS:
+                raise ValueError(f'image is too large ({probe.width}x{probe.height})')
+            probe.verify()
+        # verify() leaves the image unusable, so decode it again
+        upload.seek(0)
+        source = Image.open(upload)
+        source.load()
+    source = ImageOps.exif_transpose(source).convert('RGB')
+    source.thumbnail(MAX_ORIGINAL_SIZE, Image.LANCZOS)
+
+    data = encode_jpeg(source)
+    stem, _ = os.path.splitext(name)
+    storage.delete(name)
+    return storage.save(f'{stem}.jpg', ContentFile(data))
+
+
+def render_renditions(name, storage=None):
+    """
+    Write every rendition of the stored image ``name``.
+
+    Returns ``{rendition: {'name': ..., 'width': ..., 'height': ...}}``,
+    suitable for ``ProductImage.renditions``. Raises OSError (including
+    PIL's UnidentifiedImageError) when the original cannot be decoded.
+    """
+    storage = storage or default_storage
+    with storage.open(name, 'rb') as original:
+        source = Image.open(original)
+        source.load()
+    source = ImageOps.exif_transpose(source).convert('RGB')
+
+    renditions = {}
+    for rendition, size in RENDITIONS.items():
+        image = source.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        target = rendition_name(name, rendition)
+        if storage.exists(target):
+            storage.delete(target)
+        saved_name = storage.save(target, ContentFile(encode_jpeg(image)))
+        renditions[rendition] = {'name': saved_name, 'width': image.width, 'height': image.height}
+    return renditions
+
+
+def renditions_current(product_image):
+    """Whether the recorded renditions were rendered from the current file"""
+    if not product_image.renditions:
+        return False
+    stem, _ = os.path.splitext(product_image.image.name or '')
+    return all(
+        entry.get('name', '').startswith(f'{stem}.')
+        for entry in product_image.renditions.values()
+    )
@@ -0,0 +1,115 @@
+"""
+Trending products.
+
+A product's trending score sums its engagement - detail page views,
+wishlist adds, cart adds and orders - weighted by kind and decayed
+exponentially with age, so without new activity a score halves every
+``HALF_LIFE``.
+
+Exponential decay lets the score be carried forward instead of recomputed:
+each run of the ``update_trending`` command multiplies the stored scores by
+the decay since the previous run and adds only the events recorded since
+then. Views are counted rather than logged (see products.counters), so the
+views added since the last run are credited to the middle of the interval.
+A run only reads products that have a score or were viewed since the
+previous run, each found through its own index.
+"""
+import math
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from cart.models import CartItem
+from orders.models import OrderItem
+
+from .cache import bump_home_generation
+from .models import Product, TrendingRun, Wishlist
+
+EVENT_WEIGHTS = {'view': 1.0, 'wishlist': 4.0, 'cart': 6.0, 'order': 12.0}
+
+HALF_LIFE = timedelta(hours=24)
+
+# How far back the first run looks for events
+INITIAL_WINDOW = timedelta(days=7)
+
+# Decayed scores below this are reset to zero, so products that have gone
+# quiet drop out of the block and out of the rows each run rewrites
+MIN_SCORE = 0.01
+
+# Products per UPDATE when adding event scores
+BATCH_SIZE = 500
+
+# View counts are stamped before their UPDATE commits; products stamped this
+# long before the previous run are checked again in case it missed them
+VIEW_WRITE_SLACK = timedelta(minutes=5)
+
+
+def decay(age):
+    return math.pow(0.5, age / HALF_LIFE)
+
+
+def events(since, until):
+    """``(product_id, kind, when)`` for the events recorded in ``(since, until]``"""
+    for product_id, when in Wishlist.objects.filter(
+            created_at__gt=since, created_at__lte=until).values_list('product_id', 'created_at'):
+        yield product_id, 'wishlist', when
+    for product_id, when in CartItem.objects.filter(
+            added_at__gt=since, added_at__lte=until).values_list('product_id', 'added_at'):
+        yield product_id, 'cart', when
+    for product_id, when in OrderItem.objects.filter(
+            order__created_at__gt=since, order__created_at__lte=until).exclude(
+            order__status='cancelled').values_list('product_id', 'order__created_at'):
+        yield product_id, 'order', when
+
+
+def update_scores(now=None):
+    """
+    Bring every trending score forward to ``now``. Returns the TrendingRun
+    recorded, or None if no time has passed since the previous run.
+    """
+    now = now or timezone.now()
+    previous = TrendingRun.objects.order_by('-ran_at').values_list('ran_at', flat=True).first()
+    since = previous or now - INITIAL_WINDOW
+    if now <= since:
+        return None
+
+    gains = Counter()
+    count = 0
+    for product_id, kind, when in events(since, now):
+        gains[product_id] += EVENT_WEIGHTS[kind] * decay(now - when)
+        count += 1
+
+    factor = decay(now - since)
+    with transaction.atomic():
+        # Decay the scored products, then fold in the views of those viewed
+        # since the previous run; each pass walks its own index
+        Product.objects.filter(trending_score__gt=0).update(trending_score=F('trending_score') * factor)
+        Product.objects.filter(last_viewed_at__gte=since - VIEW_WRITE_SLACK).exclude(
+            view_count=F('trending_views_seen')
+        ).update(
+            trending_score=F('trending_score')
+            + (F('view_count') - F('trending_views_seen')) * (EVENT_WEIGHTS['view'] * math.sqrt(factor)),
+            trending_views_seen=F('view_count'),
+        )
+        product_ids = list(gains)
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            batch = product_ids[start:start + BATCH_SIZE]
+            Product.objects.filter(pk__in=batch).update(
+                trending_score=F('trending_score') + Case(
+                    *[When(pk=product_id, then=Value(gains[product_id])) for product_id in batch],
+                    default=Value(0.0),
+                    output_field=FloatField(),
+                )
+            )
+        Product.objects.filter(trending_score__gt=0, trending_score__lt=MIN_SCORE).update(trending_score=0)
+        run = TrendingRun.objects.create(ran_at=now, events=count)
+    bump_home_generation()
+    return run
+
+
+def trending_products(limit=8):
+    return Product.objects.filter(status='available', trending_score__gt=0).order_by(
+        '-trending_score', '-id')[:limit]
@@ -1,100 +1,163 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from django.db.models import Q
 from django.contrib import messages
 from django.utils.text import slugify
-from .models import Product, Category, ProductReview, Wishlist, ProductImage
+from django.utils.safestring import mark_safe
+from django.template.loader import render_to_string
+from django.core.cache import cache
+from django.db import transaction
+from .models import Product, Category, ProductReview, Wishlist, ProductImage, apply_rating_change
+from .catalog import CatalogQuery, RATING_FILTERS
+from .cache import product_detail_key, record_lookup
+from .conditional import not_modified, page_etag, tag_response
+from .counters import record_view
+from .reviews import rating_histogram, review_page, review_paginator, serialize_review
+from . import autocomplete, tasks
 import json
+import time
+
+# Shared parts of product pages stay cached until the product's version is
+# bumped; the timeout bounds staleness of data owned by other models, such
+# as the seller's name
+DETAIL_TIMEOUT = 60 * 30
+
+
+def render_listing(request, query):
+    """
+    Render a product listing page for a ``CatalogQuery``; every listing URL
+    shares the same template and sidebar
+    """
+    etag = page_etag(request, 'listing', request.get_full_path(), query.version)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
+    categories = Category.objects.all()
+    context = {
+        **query.listing(request, categories),
+        'categories': categories,
+        'current_category': query.category.slug if query.category else None,
+        'search_query': query.search,
+        'condition': query.condition,
+        'min_price': query.min_price,
+        'max_price': query.max_price,
+        'min_rating': query.min_rating,
+        'rating_filters': RATING_FILTERS,
+        'sort_by': query.sort,
+        'filter_errors': query.errors,
+    }
+    context['page_obj'] = context['products']
+    return tag_response(render(request, 'products/product_list.html', context), etag)
 
 
 def product_list(request):
     """
     Product listing page
     """
-    products = Product.objects.filter(status='available')
-    categories = Category.objects.all()
-    
-    # Filter by category
-    category_slug = request.GET.get('category')
-    if category_slug:
-        try:
-            category = Category.objects.get(slug=category_slug)
-            products = products.filter(category=category)
-        except Category.DoesNotExist:
-            pass
-    
-    # Search functionality
-    search_query = request.GET.get('search')
-    if search_query:
-        products = products.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(brand__icontains=search_query)
+    return render_listing(request, CatalogQuery.from_params(request.GET))
+
+
+def related_products_for(product):
+    """
+    Related products precomputed by products.similarity; until a product's
+    neighbours have been computed, others in its category
+    """
+    related_products = list(
+        Product.objects.filter(similar_to__product=product, status='available')
+        .order_by('similar_to__rank').with_primary_image()[:4]
+    )
+    if not related_products:
+        related_products = list(
+            Product.objects.filter(category=product.category, status='available')
+            .exclude(id=product.id).with_primary_image()[:4]
         )
-    
-    # Filter by condition
-    condition = request.GET.get('condition')
-    if condition:
-        products = products.filter(condition=condition)
-    
-    # Filter by price range
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    
-    if min_price:
-        products = products.filter(price__gte=min_price)
-    if max_price:
-        products = products.filter(price__lte=max_price)
-    
-    # Sort products
-    sort_by = request.GET.get('sort', 'newest')
-    if sort_by == 'price_low':
-        products = products.order_by('price')
-    elif sort_by == 'price_high':
-        products = products.order_by('-price')
-    elif sort_by == 'oldest':
-        products = products.order_by('created_at')
-    else:  # newest
-        products = products.order_by('-created_at')
-    
+    return related_products
+
+
+def render_detail_fragments(product):
+    """
+    Render the parts of a product page that are the same for every visitor.
+    No request is passed, so nothing user-specific can leak into the cache.
+    """
+    product.display_images = list(
+        product.images.displayable().order_by(*ProductImage.DISPLAY_ORDER)
+    )
     context = {
-        'products': products,
-        'categories': categories,
-        'current_category': category_slug,
-        'search_query': search_query,
-        'condition': condition,
-        'min_price': min_price,
-        'max_price': max_price,
-        'sort_by': sort_by,
+        'product': product,
+        'related_products': related_products_for(product),
+        'reviews': review_page(product.pk),
+        'rating_histogram': rating_histogram(product.pk) if product.rating_count else [],
+    }
+    return {
+        part: render_to_string(f'products/partials/detail_{part}.html', context)
+        for part in ('gallery', 'summary', 'extras')
     }
-    
-    return render(request, 'products/product_list.html', context)
 
 
 def product_detail(request, slug):
     """
     Product detail page
     """
-    try:
-        product = Product.objects.get(slug=slug, status='available')
-        related_products = Product.objects.filter(
-            category=product.category,
-            status='available'
-        ).exclude(id=product.id)[:4]
-        
-        # Get reviews
-        reviews = ProductReview.objects.filter(product=product)
-        
-        context = {
-            'product': product,
-            'related_products': related_products,
-            'reviews': reviews,
-        }
-        
-        return render(request, 'products/product_detail.html', context)
-    except Product.DoesNotExist:
+    product_id = Product.objects.filter(slug=slug, status='available').values_list('pk', flat=True).first()
+    if product_id is None:
         return render(request, 'products/404.html', status=404)
+    record_view(product_id)
+
+    # Versioned per product; see the signal handlers for what bumps it. The
+    # page also goes stale with the fragments' timeout, so the ETag does too
+    key = product_detail_key(product_id)
+    in_wishlist = request.user.is_authenticated and Wishlist.objects.filter(
+        user=request.user, product_id=product_id
+    ).exists()
+    etag = page_etag(request, key, in_wishlist, int(time.time() // DETAIL_TIMEOUT))
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
+    product = Product.objects.select_related('category', 'seller').get(pk=product_id)
+    fragments = cache.get(key)
+    record_lookup('product_detail', fragments is not None)
+    if fragments is None:
+        fragments = render_detail_fragments(product)
+        cache.set(key, fragments, DETAIL_TIMEOUT)
+
+    context = {
+        'product': product,
+        'detail': {part: mark_safe(html) for part, html in fragments.items()},
+        'in_wishlist': in_wishlist,
+    }
+
+    return tag_response(render(request, 'products/product_detail.html', context), etag)
+
+
+def review_feed(request, product_id):
+    """
+    JSON page of a product's reviews, newest first; pass the returned
+    ``next_cursor`` as ``?cursor=`` for the following page. The first page
+    also carries the rating histogram.
+    """
+    product = get_object_or_404(Product, id=product_id)
+    paginator = review_paginator(product.pk)
+    cursor = paginator.parse_cursor(request.GET.get('cursor'))
+    page = paginator.page(request.GET.get('cursor'))
+    data = {
+        'reviews': [serialize_review(review) for review in page],
+        'next_cursor': page.next_cursor,
+    }
+    # Missing and invalid cursors both get the first page
+    if cursor is None:
+        data['histogram'] = rating_histogram(product.pk)
+    return JsonResponse(data)
+
+
+def autocomplete_suggestions(request):
+    """
+    Typeahead suggestions for ``?q=``: matching categories, brands, words
+    and titles, each with the listing URL it leads to
+    """
+    query = request.GET.get('q', '')
+    return JsonResponse({'query': query, 'suggestions': autocomplete.suggest(query)})
 
 
 def category_products(request, slug):
@@ -102,36 +165,14 @@ def category_products(request, slug):
     Products filtered by category
     """
     category = get_object_or_404(Category, slug=slug)
-    products = Product.objects.filter(category=category, status='available')
-    
-    context = {
-        'category': category,
-        'products': products,
-    }
-    
-    return render(request, 'products/category_products.html', context)
+    return render_listing(request, CatalogQuery.from_params(request.GET, category=category))
 
 
 def search_products(request):
     """
     Search products
     """
-    query = request.GET.get('q', '')
-    products = Product.objects.filter(status='available')
-    
-    if query:
-        products = products.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query) |
-            Q(brand__icontains=query)
-        )
-    
-    context = {
-        'products': products,
-        'query': query,
-    }
-    
-    return render(request, 'products/search_results.html', context)
+    return render_listing(request, CatalogQuery.from_params(request.GET, search_param='q'))
 
 
 @login_required
@@ -190,20 +231,19 @@ def create_product(request):
                 status='available'
             )
             
-            # Handle image uploads
-            
-            if images:
-                for i, image in enumerate(images[:5]):  # Limit to 5 images
-                    try:
-                        ProductImage.objects.create(
-                            product=product,
-                            image=image,
-                            is_primary=(i == 0)  # First image is primary
-                        )
-                    except Exception as img_error:
-                        messages.warning(request, f'Warning: Could not upload image {i+1}: {img_error}')
-            else:
-                messages.info(request, 'No images uploaded. You can add images later by editing the product.')
+            # Store the uploads as-is; decoding, validation and renditions
+            # happen in the background (see products.tasks.process_image)
+            product_images = ProductImage.objects.bulk_create([
+                ProductImage(
+                    product=product,
+                    image=image,
+                    is_primary=(i == 0),  # First image is primary
+                    processing_state=ProductImage.PROCESSING,
+                )
+                for i, image in enumerate(images[:5])  # Limit to 5 images
+            ])
+            for product_image in product_images:
+                tasks.enqueue(tasks.process_image, product_image.pk)
             
             # Add points for listing a product
             profile = request.user.profile
@@ -274,26 +314,36 @@ def add_review(request, product_id):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            rating = data.get('rating')
+            rating = int(data.get('rating'))
             title = data.get('title')
             comment = data.get('comment')
+            if not 1 <= rating <= 5:
+                return JsonResponse({'success': False, 'message': 'Rating must be between 1 and 5'})
             
-            # Create or update review
-            review, created = ProductReview.objects.get_or_create(
-                product=product,
-                user=request.user,
-                defaults={
-                    'rating': rating,
-                    'title': title,
-                    'comment': comment
-                }
-            )
-            
-            if not created:
-                review.rating = rating
-                review.title = title
-                review.comment = comment
-                review.save()
+            # Create or update review; new reviews are counted into the
+            # product's rating aggregates by products.signals and changed
+            # ratings here, both once the review is committed
+            with transaction.atomic():
+                review, created = ProductReview.objects.select_for_update().get_or_create(
+                    product=product,
+                    user=request.user,
+                    defaults={
+                        'rating': rating,
+                        'title': title,
+                        'comment': comment
+                    }
+                )
+                
+                if not created:
+                    previous_rating = review.rating
+                    review.rating = rating
+                    review.title = title
+                    review.comment = comment
+                    review.save()
+                    if rating != previous_rating:
+                        transaction.on_commit(
+                            lambda: apply_rating_change(product.pk, 0, rating - previous_rating)
+                        )
             
             return JsonResponse({'success': True, 'message': 'Review added successfully'})
             
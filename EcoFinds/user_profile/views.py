@@ -19,7 +19,7 @@ def profile_view(request):
     addresses = Address.objects.filter(user=request.user)
     
     # Get user's products
-    user_products = Product.objects.filter(seller=request.user).order_by('-created_at')
+    user_products = Product.objects.filter(seller=request.user).order_by('-created_at').with_primary_image()
     
     # Get user's milestones
     user_milestones = UserMilestone.objects.filter(user=request.user)